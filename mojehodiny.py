@@ -1,8 +1,19 @@
 #!/usr/bin/env python
 
+import os
 import sys
 import re
-from itertools import chain, cycle, takewhile, accumulate, repeat, compress
+import hashlib
+import sqlite3
+import threading
+import time
+import tracemalloc
+import unicodedata
+from collections import OrderedDict, namedtuple
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from itertools import chain, compress, islice
 from string import Template
 from datetime import timedelta, datetime as dt
 
@@ -20,227 +31,327 @@ hodina_v_pá = False #@param {type:"boolean"}
 vynechávat = 'svátky a prázdniny (Praha 2)' #@param ["jen svátky", "svátky a prázdniny (Praha 2)"]
 
 YMD_FMT         = '%Y-%m-%d'
-MD_FMT          = '%m-%d'
 OUTPUT_FMT      = '%d. %m. %Y'
-DMY_FMT         = '%d.%m.%Y'
-DM_FMT          = '%d.%m.'
 WEEK_DAYS       = 7
 ONE_DAY         = timedelta(days=1)
 WD_ABBRS        = ('po', 'út', 'st', 'čt', 'pá', 'so', 'ne')
 def ymd2date(s):
     return dt.strptime(s, YMD_FMT)
-def md2date(s, year):
-    date = dt.strptime(s, MD_FMT)
-    return dt(year=year, month=date.month, day=date.day)
-def dmy2date(s):
-    return dt.strptime(s, DMY_FMT)
-def dm2date(s, year):
-    date = dt.strptime(s, DM_FMT)
-    return dt(year=year, month=date.month, day=date.day)
-
-def user_ymd2date(s, year=None):
-    try:
-        return ymd2date(s)
-    except:
-        if year:
-            try:
-                return md2date(s, year)
-            except:
-                raise ValueError(
-                    'Neplatné datum ve formátu YYYY-MM-DD nebo MM-DD: „%s“'%s
-                    ) from None
-        raise ValueError(
-            'Neplatné datum ve formátu YYYY-MM-DD: „%s“'%s) from None
-
-def user_dmy2date(s, year=None):
-    # delete any number of SPACE/NBSP after a PERIOD:
-    ns = re.sub(r'\.[  ]*', '.', s)
-    try:
-        return dmy2date(ns)
-    except:
-        if year:
-            try:
-                return dm2date(s, year)
-            except:
-                raise ValueError(
-                    'Neplatné datum ve formátu DD.MM.YYYY nebo DD.MM.: „%s“'%s
-                    ) from None
-        raise ValueError(
-            'Neplatné datum ve formátu DD.MM.YYYY: „%s“'%s) from None
 
-def dm_dmy_range2dates(ds):
+def dm_dmy_range2interval(ds):
+    """
+    Convert a `d. m.–d. m. yyyy` range to a (first_ord, last_ord) tuple.
+    """
     d_from, __, d_to = ds.partition('–')
     dm_from   = dt.strptime(d_from, '%d. %m.')
     date_to   = dt.strptime(d_to, '%d. %m. %Y')
     date_from = dt(day=dm_from.day , month=dm_from.month, year=date_to.year)
-    return list(accumulate(
-        chain((date_from,), repeat(ONE_DAY, (date_to-date_from).days))
-        ))
+    return (date_from.toordinal(), date_to.toordinal())
 
-def date_range2dates(dates):
-    if len(dates)==1:
-        return list(dates)
-    assert len(dates)==2
-    date_from, date_to = dates
-    return list(accumulate(
-        chain((date_from,), repeat(ONE_DAY, (date_to-date_from).days))
-        ))
 
+# Precompiled patterns for `parse_date_desc` (NBSP is allowed after periods):
+_YMD_RE     = r'(?P<%s_y>\d{4})-(?P<%s_m>\d{1,2})-(?P<%s_d>\d{1,2})'
+_MD_RE      = r'(?:(?P<%s_y>\d{4})-)?(?P<%s_m>\d{1,2})-(?P<%s_d>\d{1,2})'
+_DMY_RE     = r'(?P<%s_d>\d{1,2})\.[  ]*(?P<%s_m>\d{1,2})\.[  ]*(?P<%s_y>\d{4})'
+_DM_RE      = r'(?P<%s_d>\d{1,2})\.[  ]*(?P<%s_m>\d{1,2})\.[  ]*(?P<%s_y>\d{4})?'
+_WS_RE      = r'[^\S\n\t]*' # whitespace except for a tab or a newline
+DATE_PART_RE = '|'.join((
+    # YMD range (the hyphen is not a range separator here): r-m-d~r-m-d,
+    # r-m-d~m-d, or with an en-dash
+    (_YMD_RE%(('yf',)*3)) + _WS_RE + '[~–]' + _WS_RE + (_MD_RE%(('yt',)*3)),
+    # DMY range: d.m.r-d.m.r, d.m.-d.m.r (also with ~ or an en-dash)
+    (_DM_RE%(('df',)*3)) + _WS_RE + '[~–-]' + _WS_RE + (_DMY_RE%(('dt',)*3)),
+    # single date: r-m-d or d.m.r
+    _YMD_RE%(('ys',)*3),
+    _DMY_RE%(('ds',)*3),
+    ))
+DATE_PART_FULL_RE = re.compile('(%s)'%DATE_PART_RE)
+# One line of input, either a date part with an optional separator and
+# description, or anything else (bad, handled by `_parse_date_desc_line`).
+# Only whole dates are captured (the fewer groups, the faster the pattern):
+# `ymd` with an optional `md` end, or `dm` (year optional) with a `dmy` end.
+_DATE_LINE_RE = (
+    r'(?P<ymd>\d{4}-\d{1,2}-\d{1,2})'
+    r'(?:%(ws)s[~–]%(ws)s(?P<md>(?:\d{4}-)?\d{1,2}-\d{1,2}))?'
+    r'|(?P<dm>\d{1,2}\.[  ]*\d{1,2}\.(?:[  ]*\d{4})?)'
+    r'(?:%(ws)s[~–-]%(ws)s(?P<dmy>\d{1,2}\.[  ]*\d{1,2}\.[  ]*\d{4}))?'
+    )%{'ws': _WS_RE}
+DATE_DESC_LINE_RE = re.compile(
+    r'^(?:[^\S\n]*(?P<raw>(?:%s)%s)(?:(?P<sep>[;\t])(?P<desc>[^;\t\n]*))?'
+    r'[^\S\n]*|(?P<bad>.*))$\n?'%(_DATE_LINE_RE, _WS_RE),
+    re.MULTILINE
+    )
+LINE_SEPARATORS_RE = re.compile('[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]')
+# the line breaks of `str.splitlines` (CRLF is one):
+LINE_BREAK_RE = re.compile('\r\n|[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]')
 
-def parse_date_desc(date_desc_str):
+@lru_cache(maxsize=4096)
+def _ymd2ord(y, m, d):
     """
-    Parse a user input of dates/date ranges and their descriptions.
+    Convert year, month and day strings to a day ordinal. Raise ValueError
+    for invalid dates.
     """
-    for line in date_desc_str.splitlines():
-        line=line.strip()
-        if not line:
-            continue
-        sep = '\t'
-        if ';' in line:
-            if '\t' in line:
-                raise ValueError('Řádek „%s“ obsahuje středník i tabulátor. '
-                    'Používejte pro oddělení data a popisu jen jeden z nich.'%
-                    line)
-            sep = ';'
-        date_part, sep, desc = line.partition(sep)
-        if sep and sep in desc:
-            raise ValueError(
-                'Řádek „%s“ obsahuje dva %s. Používejte jen jeden znak pro '
-                'oddělení data a popisu.'%
-                (line, 'středníky' if (sep==';') else 'tabulátory'))
-
-        desc        = desc.strip()
-        d_from      = None
-        d_to        = None
-        date        = None  # single date (datetime.datetime)
-        dt_from     = None  # date range (from)
-        dt_to       = None  # date range (to)
-
-        if not desc:
-            desc    = 'volno %s'%date_part
+    return dt(int(y), int(m), int(d)).toordinal()
+
+@lru_cache(maxsize=4096)
+def _date2ord(date_str, year=''):
+    """
+    Convert a `r-m-d`, `m-d`, `d.m.r` or `d.m.` date string (as captured by
+    `DATE_DESC_LINE_RE`) to a day ordinal, `year` completes the latter
+    ones. Raise ValueError for invalid dates.
+    """
+    if '-' in date_str:
+        ymd = date_str.split('-')
+        if len(ymd) == 2:
+            return _ymd2ord(year, *ymd)
+        return _ymd2ord(*ymd)
+    d, m, y = date_str.split('.')
+    return _ymd2ord(y or year, m, d)
+
+def _groups2interval(groups):
+    """
+    Convert groups of a `DATE_PART_RE` match (as returned by `groups()`, the
+    whole date part is the first one) to a (first_ord, last_ord) tuple. Raise
+    ValueError for invalid dates.
+    """
+    if groups[1]:   # YMD range
+        return (
+            _ymd2ord(groups[1], groups[2], groups[3]),
+            _ymd2ord(groups[4] or groups[1], groups[5], groups[6])
+            )
+    if groups[12]:  # DMY range
+        return (
+            _ymd2ord(groups[9] or groups[12], groups[8], groups[7]),
+            _ymd2ord(groups[12], groups[11], groups[10])
+            )
+    if groups[13]:  # single YMD
+        date_ord = _ymd2ord(groups[13], groups[14], groups[15])
+    else:           # single DMY
+        date_ord = _ymd2ord(groups[18], groups[17], groups[16])
+    return (date_ord, date_ord)
+
+def _parse_date_desc_line(line):
+    """
+    Parse one line of `parse_date_desc` input into a (first_ord, last_ord,
+    desc) tuple, None for a blank line. Raise ValueError with a message
+    explaining the error for an invalid line.
+    """
+    line=line.strip()
+    if not line:
+        return None
+    sep = '\t'
+    if ';' in line:
+        if '\t' in line:
+            raise ValueError('Řádek „%s“ obsahuje středník i tabulátor. '
+                'Používejte pro oddělení data a popisu jen jeden z nich.'%
+                line)
+        sep = ';'
+    date_part, sep, desc = line.partition(sep)
+    if sep and sep in desc:
+        raise ValueError(
+            'Řádek „%s“ obsahuje dva %s. Používejte jen jeden znak pro '
+            'oddělení data a popisu.'%
+            (line, 'středníky' if (sep==';') else 'tabulátory'))
+
+    desc        = desc.strip()
+    if not desc:
+        desc    = 'volno %s'%date_part
 
+    match = DATE_PART_FULL_RE.fullmatch(date_part.strip())
+    if not match:
         for sep in '~–':    # tilde, en-dash (not hyphen)
-            if sep in date_part:
-                d_from, __, d_to = date_part.partition(sep)
-                if sep in d_to:
-                    raise ValueError(
-                        'Rozmezí dat „%s“ obsahuje dva znaky ‚%s‘. Použijte '
-                        'jen jeden pro oddělení počátečního a koncového data.'%
-                        (date_part, sep))
-                break
-        else:
-            if date_part.count('-') == 1:   # hyphen (not en-dash)
-                d_from, __, d_to = date_part.partition('-')
-            # else consider a single date, e.g. 2020-10-20
-            # (or 20.10.2020 – also valid, or 2020-10-20-10-21 – invalid)
-
-        if d_from:
-            d_from = d_from.strip()
-            d_to = d_to.strip()
-            if '-' in d_from:
-                dt_from = user_ymd2date(d_from)
-                dt_to   = user_ymd2date(d_to, year=dt_from.year)
-            else:
-                dt_to   = user_dmy2date(d_to)
-                dt_from = user_dmy2date(d_from, year=dt_to.year)
-            if dt_from > dt_to:
+            if date_part.count(sep) > 1:
                 raise ValueError(
-                    'První datum v rozmezí následuje až po druhém: „%s“'%
-                    date_part)
-        else:
-            is_ymd = ('-' in date_part)
+                    'Rozmezí dat „%s“ obsahuje dva znaky ‚%s‘. Použijte '
+                    'jen jeden pro oddělení počátečního a koncového data.'%
+                    (date_part, sep))
+        raise ValueError(
+            'Neplatné datum nebo rozmezí dat „%s“, povolené formáty jsou '
+            'd.m.r, r-m-d a rozmezí d.m.r-d.m.r, d.m.-d.m.r, r-m-d~r-m-d '
+            'nebo r-m-d~m-d.'%date_part)
+    try:
+        first_ord, last_ord = _groups2interval(match.groups())
+    except ValueError:
+        raise ValueError('Neplatné datum „%s“.'%date_part) from None
+    if first_ord > last_ord:
+        raise ValueError(
+            'První datum v rozmezí následuje až po druhém: „%s“'%date_part)
+    return (first_ord, last_ord, desc)
+
+def iter_parse_date_desc(date_desc_str, errors):
+    """
+    Parse a user input of dates/date ranges and their descriptions in one
+    pass, generating (first_ord, last_ord, desc) intervals line by line as
+    the input is scanned. Errors are not raised, but appended to the list
+    `errors` as (line number, message) tuples.
+
+    Lines are matched by one precompiled pattern (`DATE_DESC_LINE_RE`)
+    iterated over the input, only lines that do not match it are handled
+    one by one by `_parse_date_desc_line`.
+    """
+    if LINE_SEPARATORS_RE.search(date_desc_str):
+        date_desc_str = LINE_BREAK_RE.sub('\n', date_desc_str)
+    for line_no, match in enumerate(
+        DATE_DESC_LINE_RE.finditer(date_desc_str), 1
+        ):
+        raw, ymd, md, dm, dmy, sep, desc, bad = match.groups('')
+        if raw:
             try:
-                date = (user_ymd2date(date_part) if is_ymd
-                    else user_dmy2date(date_part))
-            except:
-                raise ValueError(
-                    'Neplatné datum „%s“, povolené formáty jsou DD.MM.YYYY '
-                    'nebo YYYY-MM-DD.'%date_part) from None
+                if ymd:
+                    first_ord   = _date2ord(ymd)
+                    last_ord    = _date2ord(md, ymd[:4]) if md else first_ord
+                elif dmy:
+                    first_ord   = _date2ord(dm, dmy[-4:])
+                    last_ord    = _date2ord(dmy)
+                else:
+                    first_ord   = last_ord = _date2ord(dm)
+            except ValueError:
+                first_ord = last_ord = None
+            if first_ord is not None and first_ord <= last_ord:
+                desc = desc.strip()
+                yield (
+                    first_ord, last_ord,
+                    desc or 'volno %s'%(raw if sep else raw.rstrip())
+                    )
+                continue
+            bad = raw + sep + desc
+        elif not bad or bad.isspace():
+            continue
+        try:
+            interval = _parse_date_desc_line(bad)
+        except ValueError as error:
+            errors.append((line_no, error.args[0]))
+            continue
+        if interval:
+            yield interval
+
+class DateDescError(ValueError):
+    """
+    Errors in a user input of dates/date ranges and their descriptions.
+    The `errors` attribute is a list of (line number, message) tuples, the
+    message (args[0]) contains all of them.
+    """
+
+    def __init__(self, errors):
+        super().__init__('\n'.join(
+            'Řádek %i: %s'%(line_no, message) for line_no, message in errors
+            ))
+        self.errors = errors
+
+def date_desc_intervals(date_desc_str):
+    """
+    Parse a user input of dates/date ranges and their descriptions
+    (see `parse_date_desc`) into a list of (first_ord, last_ord, desc)
+    intervals. All the errors are collected and raised together as
+    a `DateDescError`.
+    """
+    errors      = []
+    intervals   = list(iter_parse_date_desc(date_desc_str, errors))
+    if errors:
+        raise DateDescError(errors)
+    return intervals
 
-        dates = (date,) if date else (dt_from, dt_to)
+def parse_date_desc(date_desc_str):
+    """
+    Parse a user input of dates/date ranges and their descriptions.
+    Generates tuples (dates, desc) where dates is a one-date or two-date
+    (from, to) tuple of datetime.datetime objects, streamed as the input is
+    scanned. Raises a `DateDescError` with all errors after the valid lines
+    (see `date_desc_intervals`).
+    """
+    errors = []
+    for first_ord, last_ord, desc in iter_parse_date_desc(
+        date_desc_str, errors
+        ):
+        dates = (
+            (ord2date(first_ord),) if first_ord == last_ord
+            else (ord2date(first_ord), ord2date(last_ord))
+            )
         yield (dates, desc)
+    if errors:
+        raise DateDescError(errors)
+
+def format_date_desc(intervals):
+    """
+    Format (first_ord, last_ord, desc) intervals as a user input for
+    `parse_date_desc`, one `d.m.r[-d.m.r]; desc` line per interval.
+    """
+    lines = []
+    for first_ord, last_ord, desc in intervals:
+        dates = '-'.join(
+            '{0.day}.{0.month}.{0.year}'.format(ord2date(date_ord))
+            for date_ord in (
+                (first_ord,) if first_ord == last_ord
+                else (first_ord, last_ord)
+                )
+            )
+        lines.append('%s; %s'%(dates, desc) if desc else dates)
+    return '\n'.join(lines)
+
+# Spring holidays (jarní prázdniny) by place as published by MŠMT, one text
+# per school year:
+
+SPRING_HOLIDAYS_2020_2021 = '''1. 2. - 7. 2. 2021
+
+Česká   Lípa, Jablonec nad Nisou, Liberec, Semily, Havlíčkův Brod, Jihlava,   Pelhřimov, Třebíč, Žďár nad Sázavou, Kladno, Kolín, Kutná Hora, Písek,   Náchod, Bruntál
+
+8. 2. - 14. 2. 2021
+
+Mladá   Boleslav, Příbram, Tábor, Prachatice, Strakonice, Ústí nad Labem, Chomutov,   Most, Jičín, Rychnov nad Kněžnou, Olomouc, Šumperk, Opava, Jeseník
+
+15. 2. - 21. 2. 2021
+
+Benešov,   Beroun, Rokycany, České Budějovice, Český Krumlov, Klatovy, Trutnov,   Pardubice, Chrudim, Svitavy, Ústí nad Orlicí, Ostrava-město, Prostějov
+
+22. 2. - 28. 2. 2021
 
-# Generate spring holiday options for the Dash app:
-#
-# SPRING_HOLIDAYS_1='''1. 2. - 7. 2. 2021
-#
-# Česká   Lípa, Jablonec nad Nisou, Liberec, Semily, Havlíčkův Brod, Jihlava,   Pelhřimov, Třebíč, Žďár nad Sázavou, Kladno, Kolín, Kutná Hora, Písek,   Náchod, Bruntál
-#
-# 8. 2. - 14. 2. 2021
-#
-# Mladá   Boleslav, Příbram, Tábor, Prachatice, Strakonice, Ústí nad Labem, Chomutov,   Most, Jičín, Rychnov nad Kněžnou, Olomouc, Šumperk, Opava, Jeseník
-#
-# 15. 2. - 21. 2. 2021
-#
-# Benešov,   Beroun, Rokycany, České Budějovice, Český Krumlov, Klatovy, Trutnov,   Pardubice, Chrudim, Svitavy, Ústí nad Orlicí, Ostrava-město, Prostějov
-#
-# 22. 2. - 28. 2. 2021
-#
-# Praha 1 až   5, Blansko, Brno-město, Brno-venkov, Břeclav, Hodonín, Vyškov, Znojmo,   Domažlice, Tachov, Louny, Karviná
-#
-# 1. 3. - 7. 3. 2021
-#
-# Praha 6 až   10, Cheb, Karlovy Vary, Sokolov, Nymburk, Jindřichův Hradec, Litoměřice,   Děčín, Přerov, Frýdek-Místek
-#
-# 8. 3. - 14. 3. 2021
-#
-# Kroměříž,   Uherské Hradiště, Vsetín, Zlín, Praha-východ, Praha-západ, Mělník, Rakovník,   Plzeň-město, Plzeň-sever, Plzeň-jih, Hradec Králové, Teplice, Nový Jičín
-# ''' # z webu https://www.msmt.cz/vzdelavani/skolstvi-v-cr/organizace-skolniho-roku-2020-2021-v-zakladnich-skolach
-#
-# SPRING_HOLIDAYS_2='''7. 2. - 13. 2. 2022
-#
-# Kroměříž, Uherské Hradiště, Vsetín, Zlín, Praha-východ, Praha-západ, Mělník, Rakovník, Plzeň-město, Plzeň-sever, Plzeň-jih, Hradec Králové, Teplice, Nový Jičín
-#
-# 14. 2. - 20. 2. 2022
-#
-# Česká Lípa, Jablonec nad Nisou, Liberec, Semily, Havlíčkův Brod, Jihlava, Pelhřimov, Třebíč, Žďár nad Sázavou, Kladno, Kolín, Kutná Hora, Písek, Náchod, Bruntál
-#
-# 21. 2. - 27. 2. 2022
-#
-# Mladá Boleslav, Příbram, Tábor, Prachatice, Strakonice, Ústí nad Labem, Chomutov, Most, Jičín, Rychnov nad Kněžnou, Olomouc, Šumperk, Opava, Jeseník
-#
-# 28. 2. – 6. 3. 2022
-#
-# Benešov, Beroun, Rokycany, České Budějovice, Český Krumlov, Klatovy, Trutnov, Pardubice, Chrudim, Svitavy, Ústí nad Orlicí, Ostrava-město, Prostějov
-#
-# 7. 3. - 13. 3. 2022
-#
-# Praha 1 až 5, Blansko, Brno-město, Brno-venkov, Břeclav, Hodonín, Vyškov, Znojmo, Domažlice, Tachov, Louny, Karviná
-#
-# 14. 3. - 20. 3. 2022
-#
-# Praha 6 až 10, Cheb, Karlovy Vary, Sokolov, Nymburk, Jindřichův Hradec, Litoměřice, Děčín, Přerov, Frýdek-Místek
-# ''' # z webu https://www.msmt.cz/vzdelavani/skolstvi-v-cr/organizace-skolniho-roku-2021-2022-v-zakladnich-skolach
-#
-# def get_spring_holiday_date_places(sh_str):
-#     dates = None
-#     for m in re.finditer(
-#         r'^(([0-9].*[0-9])|([^0-9\n].*[^0-9\n]))$', sh_str, re.MULTILINE):
-#         if m.group(2):  # numeric => dates
-#             assert dates is None
-#             dates = re.sub(' [-–] ', '–', m.group(2))
-#         elif m.group(3):
-#             assert dates is not None
-#             place = re.sub(' +', ' ', m.group(3))
-#             yield (dates, place)
-#             dates = None
-#     assert dates is None
-#
-# def get_spring_holiday_checklist_options():
-#     sh2 = {
-#         place: dates for dates, place in
-#         get_spring_holiday_date_places(SPRING_HOLIDAYS_2)
-#         }
-#     for dates, place in get_spring_holiday_date_places(SPRING_HOLIDAYS_1):
-#         dates2 = sh2[place]
-#         yield {
-#             'label': '%s a %s: %s'%(dates, dates2, place),
-#             'value': '%s+%s'%(dates, dates2)
-#             }
-#
-# print(list(get_spring_holiday_checklist_options()))
+Praha 1 až   5, Blansko, Brno-město, Brno-venkov, Břeclav, Hodonín, Vyškov, Znojmo,   Domažlice, Tachov, Louny, Karviná
+
+1. 3. - 7. 3. 2021
+
+Praha 6 až   10, Cheb, Karlovy Vary, Sokolov, Nymburk, Jindřichův Hradec, Litoměřice,   Děčín, Přerov, Frýdek-Místek
+
+8. 3. - 14. 3. 2021
+
+Kroměříž,   Uherské Hradiště, Vsetín, Zlín, Praha-východ, Praha-západ, Mělník, Rakovník,   Plzeň-město, Plzeň-sever, Plzeň-jih, Hradec Králové, Teplice, Nový Jičín
+''' # z webu https://www.msmt.cz/vzdelavani/skolstvi-v-cr/organizace-skolniho-roku-2020-2021-v-zakladnich-skolach
+
+SPRING_HOLIDAYS_2021_2022 = '''7. 2. - 13. 2. 2022
+
+Kroměříž, Uherské Hradiště, Vsetín, Zlín, Praha-východ, Praha-západ, Mělník, Rakovník, Plzeň-město, Plzeň-sever, Plzeň-jih, Hradec Králové, Teplice, Nový Jičín
+
+14. 2. - 20. 2. 2022
+
+Česká Lípa, Jablonec nad Nisou, Liberec, Semily, Havlíčkův Brod, Jihlava, Pelhřimov, Třebíč, Žďár nad Sázavou, Kladno, Kolín, Kutná Hora, Písek, Náchod, Bruntál
+
+21. 2. - 27. 2. 2022
+
+Mladá Boleslav, Příbram, Tábor, Prachatice, Strakonice, Ústí nad Labem, Chomutov, Most, Jičín, Rychnov nad Kněžnou, Olomouc, Šumperk, Opava, Jeseník
+
+28. 2. – 6. 3. 2022
+
+Benešov, Beroun, Rokycany, České Budějovice, Český Krumlov, Klatovy, Trutnov, Pardubice, Chrudim, Svitavy, Ústí nad Orlicí, Ostrava-město, Prostějov
+
+7. 3. - 13. 3. 2022
+
+Praha 1 až 5, Blansko, Brno-město, Brno-venkov, Břeclav, Hodonín, Vyškov, Znojmo, Domažlice, Tachov, Louny, Karviná
+
+14. 3. - 20. 3. 2022
+
+Praha 6 až 10, Cheb, Karlovy Vary, Sokolov, Nymburk, Jindřichův Hradec, Litoměřice, Děčín, Přerov, Frýdek-Místek
+''' # z webu https://www.msmt.cz/vzdelavani/skolstvi-v-cr/organizace-skolniho-roku-2021-2022-v-zakladnich-skolach
+SPRING_HOLIDAY_TEXTS = (SPRING_HOLIDAYS_2020_2021, SPRING_HOLIDAYS_2021_2022)
+SPRING_HOLIDAY_LINE_RE = re.compile(
+    r'^(([0-9].*[0-9])|([^0-9\n].*[^0-9\n]))$', re.MULTILINE
+    )
+SpringHolidayRegistry = namedtuple('SpringHolidayRegistry', (
+    'options',          # Dash dropdown options, one per group of places
+    'value2intervals',  # option value => (first_ord, last_ord, desc) tuple
+    'search_index',     # sorted (search key, option index) tuples
+    ))
 
 # http://svatky.centrum.cz/svatky/statni-svatky/2020/
+# (The web app generates state holidays for any year, see STATE_HOLIDAYS.)
 
 EXC_DATES_STATE = '''2020-01-01	Nový rok
 2020-04-10	Velký pátek
@@ -298,82 +409,679 @@ EXC_DATES_SCHOOL = '''2020-10-29~2020-10-30	podzimní prázdniny
 EXC_DATES_SPRING_P1 = '''2021-02-22~2021-02-28	jarní prázdniny Praha 1–5
 '''
 
+# Czech state holidays (státní a ostatní svátky) by zákon č. 245/2000 Sb.,
+# Velký pátek since 2016. Month, day, description, first year:
+STATE_HOLIDAYS = (
+    (1,  1,  'Nový rok',                                         2000),
+    (5,  1,  'Svátek práce',                                     2000),
+    (5,  8,  'Den vítězství',                                    2000),
+    (7,  5,  'Den slovanských věrozvěstů Cyrila a Metoděje',     2000),
+    (7,  6,  'Den upálení mistra Jana Husa',                     2000),
+    (9,  28, 'Den české státnosti',                              2000),
+    (10, 28, 'Den vzniku samostatného československého státu',   2000),
+    (11, 17, 'Den boje za svobodu a demokracii',                 2000),
+    (12, 24, 'Štědrý den',                                       2000),
+    (12, 25, '1. svátek vánoční',                                2000),
+    (12, 26, '2. svátek vánoční',                                2000),
+    )
+# Days relative to Easter Sunday, description, first year:
+EASTER_HOLIDAYS = (
+    (-2, 'Velký pátek',                                         2016),
+    (1,  'Velikonoční pondělí',                                 2000),
+    )
+STATE_HOLIDAYS_FIRST_YEAR   = 2000
+STATE_HOLIDAYS_LAST_YEAR    = 2099  # range of the built-in 'state' table
+
+EXC_DATES_TABLES = {
+    'school':   EXC_DATES_SCHOOL,
+    }
+# Tables generated by functions instead of parsing (see table_exc_intervals):
+EXC_INTERVAL_TABLES = {
+    'state':    lambda: iter_state_holiday_intervals(
+        STATE_HOLIDAYS_FIRST_YEAR, STATE_HOLIDAYS_LAST_YEAR
+        ),
+    }
+EXC_DATES_TABLE_ORDER   = ('state', 'school')   # later ones take precedence
+HOLIDAY_PROFILE_CACHE_SIZE = 256
+# Increase the revision and update the date when the built-in holiday data
+# change (calendar feeds use the revision as SEQUENCE of all events):
+HOLIDAY_DATA_REVISION   = 1
+HOLIDAY_DATA_MODIFIED   = dt(2020, 9, 29)
+
 
 def weekdays_between_dates(wds, start, last):
+    """
+    Return the day ordinals (date.toordinal()) of the dates from `start` to
+    `last` (inclusive) falling on week days `wds` as a sorted array('i').
+    """
+    start_ord           = start.toordinal()
+    last_ord            = last.toordinal()
     start_wd            = start.weekday()
-    start_delta_days    = sorted([(wd-start_wd)%WEEK_DAYS for wd in wds])
-    shift_days          = start_delta_days[0]
-    base    = start+timedelta(shift_days) # first date from start on one of wds
-    base_delta_days     = [n-shift_days for n in start_delta_days[1:]]
-    base_delta_days.append(WEEK_DAYS)   # cycle: same week day as base
-    def acc_deltas():
-        prev = 0
-        for d in base_delta_days:
-            yield timedelta(days = d-prev)
-            prev = d
-    return list(takewhile(
-        lambda date: date<=last,
-        accumulate(chain(
-            (base,),
-            cycle(acc_deltas())
-            ))
-        ))
+    start_delta_days    = sorted({(wd-start_wd)%WEEK_DAYS for wd in wds})
+    date_ords           = array('i')
+    for week_ord in range(start_ord, last_ord+1, WEEK_DAYS):
+        for delta in start_delta_days:
+            if week_ord+delta > last_ord:
+                break
+            date_ords.append(week_ord+delta)
+    return date_ords
 
-def dates_except(dates, exc_dates2desc):
-    dates_exc    = [
-        date
-        for date in dates if date not in exc_dates2desc
-        ]
-    exc_desc     = [
-        (date, exc_dates2desc[date])
-        for date in dates if date in exc_dates2desc
-        ]
+def ord2wd(date_ord):
+    """
+    Return the week day (0 = Monday) of a day ordinal (date.toordinal()).
+    """
+    return (date_ord+6)%WEEK_DAYS
+
+def ord2date(date_ord):
+    """
+    Convert a day ordinal to a datetime.datetime object (for output).
+    """
+    return dt.fromordinal(date_ord)
+
+def _count_wd_days(first_ord, last_ord, wd):
+    """
+    Count the days falling on week day `wd` among ordinals first_ord…last_ord.
+    """
+    r = (wd+1)%WEEK_DAYS    # ordinal residue of the week day
+    return (last_ord-r)//WEEK_DAYS - (first_ord-1-r)//WEEK_DAYS
+
+class ExcDates:
+    """
+    Exception dates (holidays) with descriptions, usable as a read-only
+    date=>description mapping.
+
+    The dates are kept as sorted, disjoint and coalesced intervals of day
+    ordinals, so the memory and the time to build the object depend on
+    the number of intervals, not on the number of days they cover.
+    Membership and description lookup use bisection, counting lessons
+    uses per-week-day prefix sums over the intervals.
+
+    The object is built from (first_ord, last_ord, desc) intervals. If the
+    intervals overlap, the later ones take precedence (they overwrite the
+    descriptions of the earlier ones for the days they cover).
+    """
+
+    def __init__(self, intervals=()):
+        starts  = []
+        ends    = []
+        descs   = []
+        for first_ord, last_ord, desc in intervals:
+            if first_ord > last_ord:
+                raise ValueError('Neplatný interval: %i–%i'%
+                    (first_ord, last_ord))
+            # intervals [i, j) overlap [first_ord, last_ord]:
+            i = bisect_left(ends, first_ord)
+            j = bisect_right(starts, last_ord)
+            new_starts  = [first_ord]
+            new_ends    = [last_ord]
+            new_descs   = [desc]
+            if i < j:
+                if starts[i] < first_ord:
+                    new_starts.insert(0, starts[i])
+                    new_ends.insert(0, first_ord-1)
+                    new_descs.insert(0, descs[i])
+                if ends[j-1] > last_ord:
+                    new_starts.append(last_ord+1)
+                    new_ends.append(ends[j-1])
+                    new_descs.append(descs[j-1])
+            starts[i:j] = new_starts
+            ends[i:j]   = new_ends
+            descs[i:j]  = new_descs
+
+        # coalesce adjacent intervals with the same description:
+        self._starts    = array('i')
+        self._ends      = array('i')
+        self._descs     = []
+        for start, end, desc in zip(starts, ends, descs):
+            if (self._descs and self._descs[-1] == desc and
+                self._ends[-1]+1 == start):
+                self._ends[-1] = end
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+                self._descs.append(desc)
+        self._descs = tuple(self._descs)
+        self._digest = None
+
+        # _cum[wd][i] = number of days on week day wd in intervals 0…i-1
+        self._cum = tuple(array('i', [0]) for __ in range(WEEK_DAYS))
+        for start, end in zip(self._starts, self._ends):
+            for wd, cum in enumerate(self._cum):
+                cum.append(cum[-1] + _count_wd_days(start, end, wd))
+
+    @classmethod
+    def from_dates2desc(cls, exc_dates2desc):
+        """
+        Build the object from a date=>description dictionary.
+        """
+        return cls(
+            (date.toordinal(), date.toordinal(), desc)
+            for date, desc in sorted(exc_dates2desc.items())
+            )
+
+    def _find(self, date_ord):
+        """
+        Return the index of the interval containing `date_ord` or -1.
+        """
+        i = bisect_right(self._starts, date_ord)-1
+        if i >= 0 and date_ord <= self._ends[i]:
+            return i
+        return -1
+
+    def __contains__(self, date):
+        return self._find(date.toordinal()) >= 0
+
+    def __getitem__(self, date):
+        i = self._find(date.toordinal())
+        if i < 0:
+            raise KeyError(date)
+        return self._descs[i]
+
+    def get(self, date, default=None):
+        i = self._find(date.toordinal())
+        return self._descs[i] if i >= 0 else default
+
+    def intervals(self, first_ord=None):
+        """
+        Iterate the (first_ord, last_ord, desc) intervals in order (only
+        those ending on or after `first_ord` if given).
+        """
+        intervals = zip(self._starts, self._ends, self._descs)
+        if first_ord is None:
+            return intervals
+        return islice(intervals, bisect_left(self._ends, first_ord), None)
+
+    def digest(self):
+        """
+        Return a hex digest identifying the exception dates and descriptions
+        (equal for equal objects).
+        """
+        if self._digest is None:
+            self._digest = hashlib.sha256(
+                repr(tuple(self.intervals())).encode()
+                ).hexdigest()
+        return self._digest
+
+    def _count_wd_until(self, date_ord, wd):
+        """
+        Count exception days on week day `wd` up to `date_ord` (inclusive):
+        a bisection for the interval and a prefix sum of the ones before.
+        """
+        i = bisect_right(self._starts, date_ord)
+        if not i:
+            return 0
+        n = self._cum[wd][i-1]
+        return n + _count_wd_days(
+            self._starts[i-1], min(self._ends[i-1], date_ord), wd
+            )
+
+    def count_wd(self, first_ord, last_ord):
+        """
+        Count exception days among the ordinals first_ord, first_ord+7, …,
+        last_ord. Both ordinals must fall on the same week day.
+        """
+        wd = ord2wd(first_ord)
+        return (self._count_wd_until(last_ord, wd) -
+            self._count_wd_until(first_ord-1, wd))
+
+def count_lessons(wds, start, last, exc_dates):
+    """
+    Count the dates from `start` to `last` (inclusive) falling on week days
+    `wds` and not in `exc_dates` (an `ExcDates` object) without generating
+    them. The time does not depend on the length of the course, it is
+    O(log k) for k exception intervals (two bisections per week day).
+    """
+    start_ord   = start.toordinal()
+    last_ord    = last.toordinal()
+    start_wd    = start.weekday()
+    last_wd     = last.weekday()
+    n = 0
+    for wd in set(wds):
+        first_ord   = start_ord + (wd-start_wd)%WEEK_DAYS
+        wd_last_ord = last_ord - (last_wd-wd)%WEEK_DAYS
+        if first_ord > wd_last_ord:
+            continue
+        n += ((wd_last_ord-first_ord)//WEEK_DAYS + 1 -
+            exc_dates.count_wd(first_ord, wd_last_ord))
+    return n
+
+def count_lessons_parts(wds, start_date, last_date, part_date, exc_dates):
+    """
+    Count the lessons in the whole course and before `part_date` (the first
+    part) without generating any dates. Return a tuple (n, n1).
+    """
+    n   = count_lessons(wds, start_date, last_date, exc_dates)
+    if part_date:
+        n1 = count_lessons(
+            wds, start_date, min(last_date, part_date-ONE_DAY), exc_dates
+            )
+    else:
+        n1 = n
+    return (n, n1)
+
+def dates_except(date_ords, exc_dates2desc):
+    """
+    Split sorted day ordinals `date_ords` into an array('i') of ordinals that
+    are not exceptions and a list of (ordinal, description) exceptions.
+    Walks the dates and the exception intervals together in one merge pass
+    starting at the interval of the first date.
+    """
+    if not isinstance(exc_dates2desc, ExcDates):
+        exc_dates2desc = ExcDates.from_dates2desc(exc_dates2desc)
+    dates_exc   = array('i')
+    exc_desc    = []
+    date_ords   = iter(date_ords)
+    first_ord   = next(date_ords, None)
+    if first_ord is None:
+        return (dates_exc, exc_desc)
+    date_ords   = chain((first_ord,), date_ords)
+    intervals   = exc_dates2desc.intervals(first_ord)
+    exc_start, exc_end, desc = next(intervals, (None, None, None))
+    for date_ord in date_ords:
+        while exc_end is not None and exc_end < date_ord:
+            exc_start, exc_end, desc = next(intervals, (None, None, None))
+        if exc_end is None:
+            # no more exceptions:
+            dates_exc.append(date_ord)
+            dates_exc.extend(date_ords)
+            break
+        if exc_start <= date_ord:
+            exc_desc.append((date_ord, desc))
+        else:
+            dates_exc.append(date_ord)
     return (dates_exc, exc_desc)
 
 
+# Stage tracing: `compute`, `iter_txt_output` and `iter_icalendar` report
+# their stages to a tracer. The default `NULL_TRACER` does nothing.
+
+class NullTracer:
+    """
+    A tracer that does nothing, with (almost) no overhead.
+    """
+
+    def stage(self, name):
+        """
+        Return a context manager measuring an eager stage. Its `items`
+        attribute can be set to the number of items the stage produced.
+        """
+        return _NullStage()
+
+    def iter_stage(self, name, iterable):
+        """
+        Return an iterator over `iterable` measured as a lazy stage (only the
+        time spent producing the items counts, not the time of the consumer).
+        """
+        return iterable
+
+
+class _NullStage:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class StageTracer(NullTracer):
+    """
+    A tracer reporting a record for each stage to `sink` (a callable, by
+    default `self.records.append`). Records are dicts with the keys 'stage'
+    (name), 'seconds', 'items', 'alloc_bytes' (net allocated memory) and
+    'peak_bytes' (peak memory over the stage start). Memory is measured only
+    while `tracemalloc` is tracing, otherwise it is None.
+    """
+
+    def __init__(self, sink=None):
+        self.records    = []
+        self.sink       = sink or self.records.append
+
+    def stage(self, name):
+        return _TracedStage(self.sink, name)
+
+    def iter_stage(self, name, iterable):
+        stage       = _TracedStage(self.sink, name)
+        stage.items = 0
+        iterator    = iter(iterable)
+        try:
+            while True:
+                stage.resume()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    stage.pause()
+                stage.items += 1
+                yield item
+        finally:
+            stage.report()
+
+
+class _TracedStage:
+
+    def __init__(self, sink, name):
+        self.sink       = sink
+        self.name       = name
+        self.items      = None
+        self.seconds    = 0.0
+        self.alloc_bytes = self.peak_bytes = (
+            0 if tracemalloc.is_tracing() else None
+            )
+
+    def resume(self):
+        if self.alloc_bytes is not None:
+            if hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+                tracemalloc.reset_peak()
+            self._start_memory = tracemalloc.get_traced_memory()[0]
+        self._start = time.perf_counter()
+
+    def pause(self):
+        self.seconds += time.perf_counter() - self._start
+        if self.alloc_bytes is not None:
+            memory, peak_memory = tracemalloc.get_traced_memory()
+            self.alloc_bytes += memory - self._start_memory
+            self.peak_bytes = max(
+                self.peak_bytes, peak_memory - self._start_memory
+                )
+
+    def report(self):
+        self.sink({
+            'stage':        self.name,
+            'seconds':      self.seconds,
+            'items':        self.items,
+            'alloc_bytes':  self.alloc_bytes,
+            'peak_bytes':   self.peak_bytes,
+            })
+
+    def __enter__(self):
+        self.resume()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.pause()
+        self.report()
+
+
+NULL_TRACER = NullTracer()
+
+def format_stage_records(records):
+    """
+    Format stage records from `StageTracer` as a table (a string).
+    """
+    lines = ['%-12s %10s %8s %12s %12s\n'%(
+        'stage', 'ms', 'items', 'alloc B', 'peak B')]
+    for record in records:
+        lines.append('%-12s %10.3f %8s %12s %12s\n'%(
+            record['stage'], record['seconds']*1e3,
+            *('-' if record[key] is None else record[key]
+                for key in ('items', 'alloc_bytes', 'peak_bytes'))
+            ))
+    return ''.join(lines)
+
+
+ICAL_SAFE_TABLE = {
+    **{c: ' ' for c in range(0x1a)},
+    **{ord(c): '\\'+c for c in '\\;,'}
+    }
+
 def ical_make_text_safe(s):
     r""" Replace or escape characters for an iCalendar text.
     Control chars incl. \n are replaced with a space (to make our lives
     easier), '\\', ';' and ',' are escaped.
     """
-    return re.sub(r'[\x00-\x19]', ' ', re.sub(r'([\\;,])', r'\\\1', s))
+    return s.translate(ICAL_SAFE_TABLE)
 
-def except_dates2desc(exc_dates):
-    exc_dict = {}
+def ical_ymd(date_ord):
+    """
+    Format a day ordinal as an iCalendar date (YYYYMMDD).
+    """
+    date = ord2date(date_ord)
+    return '%04i%02i%02i'%(date.year, date.month, date.day)
+
+def iter_except_date_intervals(exc_dates):
+    """
+    Parse exception date table lines `YYYY-MM-DD[~YYYY-MM-DD]<TAB>desc` into
+    (first_ord, last_ord, desc) intervals.
+    """
     for line in exc_dates.split('\n'):
         line = line.rstrip()
         if line:
             fields = line.split('\t')
             ds = fields[0]
-            if '~' not in ds:
-                dates = (ymd2date(ds),)
-            else:
-                d_from,__,d_to = ds.partition('~')
-                date_from = ymd2date(d_from)
-                date_to   = ymd2date(d_to)
-                dates = accumulate(chain(
-                    (date_from,), repeat(ONE_DAY, (date_to-date_from).days)
-                    ))
-            for date in dates:
-                # TODO may overwrite another exception
-                exc_dict[date] = fields[1]
-    return exc_dict
+            d_from, __, d_to = ds.partition('~')
+            first_ord = ymd2date(d_from).toordinal()
+            last_ord  = ymd2date(d_to).toordinal() if d_to else first_ord
+            yield (first_ord, last_ord, fields[1])
 
-def iter_icalendar(
-    dates_info, weekday2time_range, cal_name, event_summary_fmt, info_fmt_map_f
-    ):
+def except_dates2desc(exc_dates):
     """
-    Generate iCalendar file contents as an iterator over strings
-    (roughly lines).
+    Parse an exception date table into an `ExcDates` object (a read-only
+    date=>description mapping). Later lines take precedence over earlier
+    ones if they overlap.
+    """
+    return ExcDates(iter_except_date_intervals(exc_dates))
+
+# Holiday registry (compiled and cached exception dates):
+
+def easter_sunday(year):
+    """
+    Return the date of (Western) Easter Sunday in `year` (Gregorian
+    calendar) using the anonymous Gregorian computus (Meeus/Jones/Butcher).
+    """
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19*a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2*e + 2*i - h - k) % 7
+    m = (a + 11*h + 22*l) // 451
+    month, day = divmod(h + l - 7*m + 114, 31)
+    return dt(year, month, day+1)
+
+@lru_cache(maxsize=None)
+def state_holidays_year(year):
+    """
+    Return the Czech state holidays in `year` as a tuple (ordinals, descs)
+    of a sorted array('i') of day ordinals and a tuple of descriptions.
+    Computed on first use for each year.
+    """
+    if year < STATE_HOLIDAYS_FIRST_YEAR:
+        raise ValueError('Státní svátky jsou k dispozici až od roku %i.'%
+            STATE_HOLIDAYS_FIRST_YEAR)
+    easter_ord = easter_sunday(year).toordinal()
+    holidays = sorted(chain(
+        (
+            (dt(year, month, day).toordinal(), desc)
+            for month, day, desc, first_year in STATE_HOLIDAYS
+            if year >= first_year
+            ),
+        (
+            (easter_ord+delta, desc)
+            for delta, desc, first_year in EASTER_HOLIDAYS
+            if year >= first_year
+            )
+        ))
+    return (
+        array('i', (date_ord for date_ord, __ in holidays)),
+        tuple(desc for __, desc in holidays)
+        )
+
+def iter_state_holiday_intervals(first_year, last_year):
+    """
+    Generate (first_ord, last_ord, desc) intervals of Czech state holidays
+    in the years first_year…last_year.
+    """
+    for year in range(first_year, last_year+1):
+        ords, descs = state_holidays_year(year)
+        for date_ord, desc in zip(ords, descs):
+            yield (date_ord, date_ord, desc)
+
+@lru_cache(maxsize=None)
+def table_exc_intervals(name):
+    """
+    Return a tuple of (first_ord, last_ord, desc) intervals for the built-in
+    exception date table `name` (see `EXC_DATES_TABLES` and
+    `EXC_INTERVAL_TABLES`), compiled or generated on first use.
+    """
+    if name in EXC_INTERVAL_TABLES:
+        return tuple(EXC_INTERVAL_TABLES[name]())
+    return tuple(iter_except_date_intervals(EXC_DATES_TABLES[name]))
+
+def iter_spring_holiday_date_places(text):
+    """
+    Generate (range_str, places) tuples from an MŠMT spring holiday text
+    (see `SPRING_HOLIDAY_TEXTS`), `range_str` of the form `d. m.–d. m. yyyy`.
+    """
+    range_str = None
+    for match in SPRING_HOLIDAY_LINE_RE.finditer(text):
+        dates, places = match.group(2, 3)
+        if dates:
+            if range_str is not None:
+                raise ValueError('Chybí místa pro „%s“'%range_str)
+            range_str = re.sub(' [-–] ', '–', dates)
+        elif range_str is None:
+            raise ValueError('Chybí data pro „%s“'%places)
+        else:
+            yield (range_str, re.sub(' +', ' ', places.strip()))
+            range_str = None
+
+def search_key(s):
+    """
+    Normalize a string for searching (lower case without diacritics).
+    """
+    return ''.join(
+        c for c in unicodedata.normalize('NFKD', s.casefold())
+        if not unicodedata.combining(c)
+        )
+
+@lru_cache(maxsize=None)
+def spring_holiday_registry():
+    """
+    Compile `SPRING_HOLIDAY_TEXTS` (once) and return
+    a `SpringHolidayRegistry` of:
+
+    - options: a tuple of {'label', 'value'} dicts (Dash dropdown options),
+      one per group of places, value `d. m.–d. m. yyyy+d. m.–d. m. yyyy`
+    - value2intervals: a dict option value => a tuple of (first_ord,
+      last_ord, desc) intervals
+    - search_index: a sorted tuple of (search key, option index), a key for
+      each word of each place to the end of the place name
+    """
+    places2ranges = {}      # places => [range_str per school year]
+    for text in SPRING_HOLIDAY_TEXTS:
+        for range_str, places in iter_spring_holiday_date_places(text):
+            places2ranges.setdefault(places, []).append(range_str)
+    options         = []
+    value2intervals = {}
+    search_index    = []
+    for places, range_strs in places2ranges.items():
+        value = '+'.join(range_strs)
+        value2intervals[value] = tuple(
+            (*dm_dmy_range2interval(range_str), 'jarní prázdniny %s'%range_str)
+            for range_str in range_strs
+            )
+        for place in places.split(', '):
+            key = search_key(place)
+            search_index.extend(
+                (key[m.start():], len(options))
+                for m in re.finditer(r'\w+', key)
+                )
+        options.append({
+            'label': '%s: %s'%(' a '.join(range_strs), places),
+            'value': value
+            })
+    return SpringHolidayRegistry(
+        tuple(options), value2intervals, tuple(sorted(search_index))
+        )
+
+def spring_holiday_options(search=None, values=()):
+    """
+    Return a list of spring holiday options (see `spring_holiday_registry`)
+    with a place starting with `search` (or a word in it, ignoring case and
+    diacritics) or with a value in `values`. An empty `search` matches no
+    places, only the options with a value in `values` are returned (the
+    whole list is never sent to the browser).
     """
+    registry = spring_holiday_registry()
+    indexes = set()
+    if search and search.strip():
+        key = search_key(search.strip())
+        i = bisect_left(registry.search_index, (key,))
+        while (i < len(registry.search_index) and
+            registry.search_index[i][0].startswith(key)):
+            indexes.add(registry.search_index[i][1])
+            i += 1
+    if values:
+        values = set(values)
+        indexes.update(
+            i for i, option in enumerate(registry.options)
+            if option['value'] in values
+            )
+    return [registry.options[i] for i in sorted(indexes)]
 
-    event_summary_template = Template(event_summary_fmt)
+@lru_cache(maxsize=HOLIDAY_PROFILE_CACHE_SIZE)
+def spring_holidays_intervals(ranges_str):
+    """
+    Return a tuple of (first_ord, last_ord, desc) intervals for a spring
+    holiday value of the form `d. m.–d. m. yyyy+d. m.–d. m. yyyy` (one range
+    per school year), from `spring_holiday_registry` if it is there.
+    """
+    intervals = spring_holiday_registry().value2intervals.get(ranges_str)
+    if intervals is not None:
+        return intervals
+    range_str_1, __, range_str_2 = ranges_str.partition('+')
+    if not (range_str_1 and range_str_2):
+        raise ValueError('Neplatné jarní prázdniny: „%s“'%ranges_str)
+    return tuple(
+        (*dm_dmy_range2interval(range_str), 'jarní prázdniny %s'%range_str)
+        for range_str in (range_str_1, range_str_2)
+        )
 
-    yield ((
-        '''BEGIN:VCALENDAR
-PRODID:-//mojehodiny.nohejl.name//NONSGML mojehodiny 1.0//CS
-VERSION:2.0
-X-WR-CALNAME:%s
+@lru_cache(maxsize=HOLIDAY_PROFILE_CACHE_SIZE)
+def _holiday_profile(tables, spring_holidays, custom_holidays):
+    intervals = [
+        table_exc_intervals(name)
+        for name in EXC_DATES_TABLE_ORDER if name in tables
+        ]
+    intervals.extend(map(spring_holidays_intervals, spring_holidays))
+    if isinstance(custom_holidays, str):
+        intervals.append(date_desc_intervals(custom_holidays))
+    elif custom_holidays:
+        intervals.append(custom_holidays)
+    return ExcDates(chain.from_iterable(intervals))
+
+def holiday_profile(tables=(), spring_holidays=(), custom_holidays=None):
+    """
+    Return an `ExcDates` object for a combination of built-in tables (names
+    from `EXC_DATES_TABLES`), spring holiday values and custom holidays
+    (a string for `parse_date_desc` or already parsed (first_ord, last_ord,
+    desc) intervals, e.g. from `date_desc_intervals`). Later sources
+    take precedence: tables in `EXC_DATES_TABLE_ORDER`, spring holidays,
+    custom holidays.
+
+    The returned objects are shared and must not be modified. Recently used
+    combinations are cached (LRU).
+    """
+    if custom_holidays and not isinstance(custom_holidays, str):
+        custom_holidays = tuple(
+            (first_ord, last_ord, desc)
+            for first_ord, last_ord, desc in custom_holidays
+            )
+    return _holiday_profile(
+        tuple(sorted(set(tables or ()))),
+        tuple(spring_holidays or ()),
+        custom_holidays or None
+        )
+
+ICAL_HEADER_START = 'BEGIN:VCALENDAR\r\n'\
+    'PRODID:-//mojehodiny.nohejl.name//NONSGML mojehodiny 1.0//CS\r\n'\
+    'VERSION:2.0\r\n'\
+    'X-WR-CALNAME:'
+ICAL_HEADER_END = '''
 X-WR-TIMEZONE:Europe/Prague
 X-WR-CALDESC:
 BEGIN:VTIMEZONE
@@ -393,36 +1101,463 @@ TZNAME:GMT+01:00
 TZOFFSETTO:+0100
 END:STANDARD
 END:VTIMEZONE
-'''%ical_make_text_safe(cal_name)).replace('\n','\r\n')
-        )
+'''.replace('\n', '\r\n')
+ICAL_HEADER_START_BYTES = ICAL_HEADER_START.encode()
+ICAL_HEADER_END_BYTES   = ICAL_HEADER_END.encode()
+# formatted once per calendar (UID line format, DTSTAMP, SEQUENCE), then
+# per event (date for the UID, summary, DTSTART and DTEND):
+ICAL_EVENT_FMT = (
+    'BEGIN:VEVENT\r\n'
+    '%s'
+    'DTSTAMP:%s\r\n'
+    'SEQUENCE:%i\r\n'
+    'STATUS:CONFIRMED\r\n'
+    'TRANSP:TRANSPARENT\r\n'
+    'SUMMARY:%%s\r\n'
+    'DTSTART:%%s%%s\r\n'
+    'DTEND:%%s%%s\r\n'
+    'END:VEVENT\r\n'
+    )
+ICAL_FOOTER = 'END:VCALENDAR\r\n'
+ICAL_CHUNK_SIZE = 1<<16 # characters
+ICAL_UID_DOMAIN = 'mojehodiny.nohejl.name'
+# DTSTAMP of the events unless given: generated calendars only change with
+# the holiday data (and the inputs), the same inputs give the same bytes
+ICAL_DTSTAMP = HOLIDAY_DATA_MODIFIED.strftime('%Y%m%dT%H%M%SZ')
+
+def ical_uid_prefix(*identity):
+    """
+    Return a prefix of event UIDs (a short hex digest) for the identity of
+    a calendar (e.g. its kind, name and start date). Event UIDs are the
+    prefix plus the event date (see `ical_uid_fmt`).
+    """
+    return hashlib.sha1(repr(identity).encode()).hexdigest()[:16]
+
+def ical_calendar_uid_prefix(kind, cal_name, start_date):
+    """
+    Return the UID prefix (see `ical_uid_prefix`) of a course (`kind`
+    'course') or exception ('exc') calendar: the identity of a course is the
+    calendar name and the start date, so the UIDs of lessons do not change
+    with the holidays, time ranges or the end date.
+    """
+    return ical_uid_prefix(kind, cal_name, start_date.strftime(YMD_FMT))
+
+def ical_uid_fmt(uid_prefix):
+    """
+    Return a '%s' format of an event UID line for a `uid_prefix` (or
+    None).
+    """
+    if not uid_prefix:
+        return None
+    return 'UID:%s-%%s@%s\r\n'%(uid_prefix, ICAL_UID_DOMAIN)
+
+def template_keys(fmt):
+    """
+    Return the set of placeholder names used in a `string.Template` format.
+    """
+    return {
+        match.group('named') or match.group('braced')
+        for match in Template.pattern.finditer(fmt)
+        } - {None}
 
-    for date, info in dates_info:
-        yield ("BEGIN:VEVENT\r\n"
-                    "SEQUENCE:0\r\n"
-                    "STATUS:CONFIRMED\r\n"
+@lru_cache(maxsize=HOLIDAY_PROFILE_CACHE_SIZE)
+def ical_summary_formatter(event_summary_fmt):
+    """
+    Compile a `string.Template` format into a function that maps a
+    dictionary to an iCalendar-safe text like
+    `ical_make_text_safe(Template(event_summary_fmt).safe_substitute(d))`.
+    """
+    literals    = []
+    keys        = []
+    literal     = ''
+    pos         = 0
+    for match in Template.pattern.finditer(event_summary_fmt):
+        literal += event_summary_fmt[pos:match.start()]
+        key = match.group('named') or match.group('braced')
+        if key is None:
+            literal += ('$' if match.group('escaped') is not None
+                else match.group())
+        else:
+            literals.append(ical_make_text_safe(literal))
+            keys.append((key, match.group()))
+            literal = ''
+        pos = match.end()
+    literals.append(ical_make_text_safe(literal+event_summary_fmt[pos:]))
+    if not keys:
+        constant = literals[0]
+        return lambda mapping: constant
+    def format_summary(mapping):
+        parts = [literals[0]]
+        for (key, orig), literal in zip(keys, literals[1:]):
+            parts.append(ical_make_text_safe(
+                str(mapping[key]) if key in mapping else orig
+                ))
+            parts.append(literal)
+        return ''.join(parts)
+    return format_summary
+
+def _iter_ical_event_chunks(
+    dates_info, weekday2time_range, event_summary_fmt, info_fmt_map_f,
+    chunk_size, uid_prefix=None, sequence=0, dtstamp=ICAL_DTSTAMP
+    ):
+    """
+    Generate iCalendar events and the calendar end as strings of about
+    `chunk_size` characters.
+    """
+    format_summary  = ical_summary_formatter(event_summary_fmt)
+    # without a UID the date is formatted as an empty string:
+    event_fmt       = ICAL_EVENT_FMT%(
+        ical_uid_fmt(uid_prefix) or '%.0s', dtstamp, sequence
+        )
+    wd2suffixes     = [('', '')]*WEEK_DAYS
+    if weekday2time_range:
+        for wd, time_range in weekday2time_range.items():
+            if time_range:
+                wd2suffixes[wd] = (
+                    'T%02i%02i00'%time_range[0], 'T%02i%02i00'%time_range[1]
                     )
-        yield "TRANSP:TRANSPARENT\r\n"
-        yield ("SUMMARY:"+
-            ical_make_text_safe(event_summary_template.safe_substitute(
-                info_fmt_map_f(info)))+
-            '\r\n')
-        ymd = date.strftime('%Y%m%d')
-
-        time_range = weekday2time_range and weekday2time_range[date.weekday()]
+    events  = []
+    size    = 0
+    for date_ord, info in dates_info:
+        ymd = ical_ymd(date_ord)
+        start_suffix, end_suffix = wd2suffixes[ord2wd(date_ord)]
+        event = event_fmt%(
+            ymd, format_summary(info_fmt_map_f(info)),
+            ymd, start_suffix, ymd, end_suffix
+            )
+        events.append(event)
+        size += len(event)
+        if size >= chunk_size:
+            yield ''.join(events)
+            events.clear()
+            size = 0
+    events.append(ICAL_FOOTER)
+    yield ''.join(events)
+
+def iter_icalendar(
+    dates_info, weekday2time_range, cal_name, event_summary_fmt, info_fmt_map_f,
+    chunk_size=ICAL_CHUNK_SIZE, tracer=NULL_TRACER, uid_prefix=None,
+    sequence=0, dtstamp=ICAL_DTSTAMP
+    ):
+    """
+    Generate iCalendar file contents as an iterator over strings
+    (chunks of about `chunk_size` characters). `dates_info` is an iterable
+    of (day ordinal, info) tuples, `info_fmt_map_f(info)` returns a mapping
+    for `event_summary_fmt`. The rendering is traced as the stage 'ics'.
+
+    Events get UIDs if `uid_prefix` is given (see `ical_uid_prefix`), the
+    SEQUENCE number `sequence` and the DTSTAMP `dtstamp` (a UTC
+    `YYYYMMDDTHHMMSSZ` string).
+    """
+    return tracer.iter_stage('ics', chain(
+        (ICAL_HEADER_START + ical_make_text_safe(cal_name) + ICAL_HEADER_END,),
+        _iter_ical_event_chunks(
+            dates_info, weekday2time_range, event_summary_fmt,
+            info_fmt_map_f, chunk_size, uid_prefix, sequence, dtstamp
+            )
+        ))
+
+def iter_icalendar_bytes(
+    dates_info, weekday2time_range, cal_name, event_summary_fmt, info_fmt_map_f,
+    chunk_size=ICAL_CHUNK_SIZE, uid_prefix=None, sequence=0,
+    dtstamp=ICAL_DTSTAMP
+    ):
+    """
+    Generate iCalendar file contents as an iterator over UTF-8 encoded
+    chunks (bytes) for streaming.
+    """
+    yield ICAL_HEADER_START_BYTES
+    yield ical_make_text_safe(cal_name).encode()
+    yield ICAL_HEADER_END_BYTES
+    for chunk in _iter_ical_event_chunks(
+        dates_info, weekday2time_range, event_summary_fmt, info_fmt_map_f,
+        chunk_size, uid_prefix, sequence, dtstamp
+        ):
+        yield chunk.encode()
+
+def write_icalendar(f, *args, **kwargs):
+    """
+    Write iCalendar file contents to a binary file-like object `f` in large
+    chunks. Other arguments are the same as for `iter_icalendar_bytes`.
+    """
+    f.writelines(iter_icalendar_bytes(*args, **kwargs))
+
+def icalendar_bytes(*args, **kwargs):
+    """
+    Return the whole iCalendar file contents as UTF-8 encoded bytes. The
+    arguments are the same as for `iter_icalendar_bytes`.
+    """
+    return b''.join(iter_icalendar_bytes(*args, **kwargs))
+
+ICAL_RRULE_EVENT_FMT = (
+    'BEGIN:VEVENT\r\n'
+    '%s'                # UID (optional)
+    'DTSTAMP:%s\r\n'
+    'SEQUENCE:%i\r\n'
+    'STATUS:CONFIRMED\r\n'
+    'TRANSP:TRANSPARENT\r\n'
+    'SUMMARY:%s\r\n'
+    'DTSTART%s\r\n'
+    'DTEND%s\r\n'
+    'RRULE:FREQ=WEEKLY;UNTIL=%s\r\n'
+    '%s'
+    'END:VEVENT\r\n'
+    )
+DATE_NMP_KEYS = {'n', 'm', 'p'}
+
+def iter_icalendar_rrule(
+    dates, exc_dates, weekday2time_range, cal_name, event_summary_fmt,
+    tracer=NULL_TRACER, uid_prefix=None, sequence=0, dtstamp=ICAL_DTSTAMP
+    ):
+    """
+    Generate compact iCalendar file contents with one recurring event per
+    week day as an iterator over strings. `dates` are the (sorted) day
+    ordinals of the course, `exc_dates` the (sorted) day ordinals that the
+    course skips because of exceptions, they become EXDATEs. The summary is
+    the same for all events, so `event_summary_fmt` should not use any
+    placeholders. The rendering is traced as the stage 'ics_rrule'.
+
+    `uid_prefix`, `sequence` and `dtstamp` are the same as for
+    `iter_icalendar`, the UID of an event contains its first date.
+    """
+    return tracer.iter_stage('ics_rrule', _iter_icalendar_rrule(
+        dates, exc_dates, weekday2time_range, cal_name, event_summary_fmt,
+        uid_prefix, sequence, dtstamp
+        ))
+
+def _iter_icalendar_rrule(
+    dates, exc_dates, weekday2time_range, cal_name, event_summary_fmt,
+    uid_prefix=None, sequence=0, dtstamp=ICAL_DTSTAMP
+    ):
+    summary = ical_summary_formatter(event_summary_fmt)({})
+    uid_fmt = ical_uid_fmt(uid_prefix)
+    wd2dates = {}
+    for date_ord in dates:
+        wd2dates.setdefault(ord2wd(date_ord), []).append(date_ord)
+    wd2exc_dates = {}
+    for date_ord in exc_dates:
+        wd2exc_dates.setdefault(ord2wd(date_ord), []).append(date_ord)
+
+    yield ICAL_HEADER_START + ical_make_text_safe(cal_name) + ICAL_HEADER_END
+    events = []
+    for wd, wd_dates in sorted(wd2dates.items()):
+        first   = wd_dates[0]
+        last    = wd_dates[-1]
+        exc_ymds = [
+            ical_ymd(date_ord) for date_ord in wd2exc_dates.get(wd, ())
+            if first < date_ord < last
+            ]
+        time_range = weekday2time_range and weekday2time_range.get(wd)
         if time_range:
-            yield 'DTSTART:%sT%02i%02i00\r\n'%(ymd, *time_range[0])
-            yield 'DTEND:%sT%02i%02i00\r\n'%(ymd, *time_range[1])
+            start_suffix = 'T%02i%02i00'%time_range[0]
+            dtstart = ':%s%s'%(ical_ymd(first), start_suffix)
+            dtend   = ':%sT%02i%02i00'%(ical_ymd(first), *time_range[1])
+            until   = ical_ymd(last)+'T235959'
+            exdates = ''.join(
+                'EXDATE:%s%s\r\n'%(ymd, start_suffix) for ymd in exc_ymds
+                )
+        else:
+            dtstart = ';VALUE=DATE:%s'%ical_ymd(first)
+            dtend   = ';VALUE=DATE:%s'%ical_ymd(first+1)
+            until   = ical_ymd(last)
+            exdates = ''.join(
+                'EXDATE;VALUE=DATE:%s\r\n'%ymd for ymd in exc_ymds
+                )
+        events.append(ICAL_RRULE_EVENT_FMT%(
+            uid_fmt%ical_ymd(first) if uid_fmt else '', dtstamp, sequence,
+            summary, dtstart, dtend, until, exdates
+            ))
+    events.append(ICAL_FOOTER)
+    yield ''.join(events)
+
+ICAL_DATE_TIME_RE = re.compile(
+    r'([0-9]{4})([0-9]{2})([0-9]{2})(?:T([0-9]{2})([0-9]{2})([0-9]{2})Z?)?$'
+    )
+ICAL_DURATION_RE = re.compile(
+    r'\+?P(?:([0-9]+)W)?(?:([0-9]+)D)?'
+    r'(?:T(?:([0-9]+)H)?(?:([0-9]+)M)?(?:([0-9]+)S)?)?$'
+    )
+ICAL_TEXT_ESCAPE_RE = re.compile(r'\\(.)')
+ICAL_PROPERTY_RE = re.compile(r'((?:[^:"]|"[^"]*")*):(.*)$', re.DOTALL)
+DAY_SECONDS = 24*3600
+ICAL_DEFAULT_DESC = 'volno'    # of imported events without a SUMMARY
+
+def iter_unfold_ical_lines(lines):
+    """
+    Unfold iCalendar content lines (continuation lines start with a space or
+    a tab) from an iterable of strings (e.g. a text file). Generate
+    (line number, line) tuples, the number of the first physical line.
+    """
+    parts   = None
+    line_no = 0
+    for line_no, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t'):
+            if parts is not None:
+                parts.append(line[1:])
+            continue
+        if parts is not None:
+            yield (first_no, ''.join(parts) if len(parts) > 1 else parts[0])
+        parts       = [line]
+        first_no    = line_no
+    if parts is not None:
+        yield (first_no, ''.join(parts))
+
+def ical_unescape_text(s):
+    """
+    Unescape an iCalendar text value, newlines become spaces.
+    """
+    if '\\' not in s:
+        return s
+    return ICAL_TEXT_ESCAPE_RE.sub(
+        lambda m: ' ' if m.group(1) in 'nN' else m.group(1), s
+        )
+
+def ical_date_time(value):
+    """
+    Parse an iCalendar DATE or DATE-TIME value (local, floating or UTC,
+    the time zone is ignored) into a tuple (day ordinal, seconds of the day,
+    is date).
+    """
+    match = ICAL_DATE_TIME_RE.match(value)
+    if not match:
+        raise ValueError('Neplatné datum: „%s“'%value)
+    y, m, d, hh, mm, ss = match.groups()
+    try:
+        date_ord = dt(int(y), int(m), int(d)).toordinal()
+    except ValueError:
+        raise ValueError('Neplatné datum: „%s“'%value) from None
+    if hh is None:
+        return (date_ord, 0, True)
+    # a leap second (60) is allowed:
+    if int(hh) > 23 or int(mm) > 59 or int(ss) > 60:
+        raise ValueError('Neplatný čas: „%s“'%value)
+    return (date_ord, int(hh)*3600 + int(mm)*60 + int(ss), False)
+
+def ical_duration_seconds(value):
+    """
+    Parse a (non-negative) iCalendar DURATION value into seconds.
+    """
+    match = ICAL_DURATION_RE.match(value)
+    if not match or not any(match.groups()):
+        raise ValueError('Neplatná délka: „%s“'%value)
+    w, d, hh, mm, ss = (int(g) if g else 0 for g in match.groups())
+    return ((w*7 + d)*24 + hh)*3600 + mm*60 + ss
+
+def ical_event_interval(start, end, duration):
+    """
+    Return the (first_ord, last_ord) interval of the days of an event with
+    DTSTART, DTEND and DURATION values (`end` and `duration` may be None)
+    or None if the event does not cover a whole day. All-day (DATE) events
+    take all their days, timed events only the days they cover completely
+    (e.g. 10:00 to 10:00 the next day covers none). DTEND is exclusive.
+    """
+    first_ord, start_sec, is_date = ical_date_time(start)
+    if end is not None:
+        end_ord, end_sec, __ = ical_date_time(end)
+    elif duration is not None:
+        end_ord, end_sec = divmod(
+            first_ord*DAY_SECONDS + start_sec + ical_duration_seconds(duration),
+            DAY_SECONDS
+            )
+    elif is_date:
+        end_ord, end_sec = first_ord+1, 0
+    else:
+        return None
+    if is_date:
+        last_ord = end_ord if end_sec else end_ord-1
+        return (first_ord, max(first_ord, last_ord))
+    if start_sec:
+        first_ord += 1
+    last_ord = end_ord-1
+    if first_ord <= last_ord:
+        return (first_ord, last_ord)
+    return None
+
+def iter_ical_intervals(lines, errors):
+    """
+    Parse an iCalendar file (an iterable of lines, e.g. a text file) as
+    a stream and generate (first_ord, last_ord, desc) intervals of its
+    all-day and multi-day events (VEVENT with DTSTART, DTEND or DURATION
+    and SUMMARY, `ICAL_DEFAULT_DESC` without it), e.g. for
+    `holiday_profile` (see `ical_event_interval`). Cancelled events and
+    events that do not cover a whole day are skipped, recurrence rules are
+    not expanded.
+
+    Invalid events are skipped, (line number, message) tuples are appended
+    to the list `errors`.
+    """
+    in_event = False
+    for line_no, line in iter_unfold_ical_lines(lines):
+        if not in_event:
+            if line.upper() == 'BEGIN:VEVENT':
+                in_event    = True
+                event_no    = line_no
+                depth       = 0     # of nested components (VALARM)
+                start = end = duration = summary = status = None
+            continue
+        colon = line.find(':')
+        if colon < 0:
+            continue
+        name_params = line[:colon]
+        if '"' in name_params:
+            match = ICAL_PROPERTY_RE.match(line)
+            if not match:
+                continue
+            name_params = match.group(1)
+            value = match.group(2)
         else:
-            yield 'DTSTART:%s\r\n'%ymd
-            yield 'DTEND:%s\r\n'%ymd
-        yield 'END:VEVENT\r\n'
-    yield 'END:VCALENDAR\r\n'
+            value = line[colon+1:]
+        name = name_params.partition(';')[0].upper()
+        if name == 'BEGIN':
+            depth += 1
+        elif name == 'END':
+            if depth:
+                depth -= 1
+                continue
+            in_event = False
+            if status == 'CANCELLED':
+                continue
+            if start is None:
+                errors.append((event_no, 'Událost nemá začátek (DTSTART).'))
+                continue
+            try:
+                interval = ical_event_interval(start, end, duration)
+            except ValueError as error:
+                errors.append((event_no, error.args[0]))
+                continue
+            if interval is not None:
+                yield (
+                    *interval,
+                    ical_unescape_text(summary or '').strip() or
+                        ICAL_DEFAULT_DESC
+                    )
+        elif depth:
+            continue
+        elif name == 'DTSTART':
+            start = value.strip()
+        elif name == 'DTEND':
+            end = value.strip()
+        elif name == 'DURATION':
+            duration = value.strip()
+        elif name == 'SUMMARY':
+            summary = value
+        elif name == 'STATUS':
+            status = value.strip().upper()
+    if in_event:
+        errors.append((event_no, 'Neukončená událost (chybí END:VEVENT).'))
 
-def iter_txt_output(dates, exc_desc, part_date, n, n1):
+def iter_txt_output(dates, exc_desc, part_date, n, n1, tracer=NULL_TRACER):
     """
     Generate text (Markdown) summary output as an iterator over strings
-    (roughly lines).
+    (roughly lines). `dates` are day ordinals, `exc_desc` (ordinal,
+    description) tuples. The rendering is traced as the stage 'txt'.
     """
+    return tracer.iter_stage(
+        'txt', _iter_txt_output(dates, exc_desc, part_date, n, n1)
+        )
+
+def _iter_txt_output(dates, exc_desc, part_date, n, n1):
     yield '### Počty hodin:\n\n'
     yield ' * Celý kurz:    %i\n'%n
     if part_date:
@@ -430,14 +1565,14 @@ def iter_txt_output(dates, exc_desc, part_date, n, n1):
         yield ' * Od %s:   %i\n'%(part_date.strftime(OUTPUT_FMT), n-n1)
     yield '\n'
     yield '### Data kurzu:\n\n'
-    for i, date in enumerate(dates):
-        yield ' %i. %s %s\n'%(i+1, WD_ABBRS[date.weekday()],
-            date.strftime(OUTPUT_FMT))
+    for i, date_ord in enumerate(dates):
+        yield ' %i. %s %s\n'%(i+1, WD_ABBRS[ord2wd(date_ord)],
+            ord2date(date_ord).strftime(OUTPUT_FMT))
     yield '### Data volna\n\n'
     if exc_desc:
-        for date, desc in exc_desc:
-            yield ' * %s %s %s\n'%(WD_ABBRS[date.weekday()],
-                date.strftime(OUTPUT_FMT), desc)
+        for date_ord, desc in exc_desc:
+            yield ' * %s %s %s\n'%(WD_ABBRS[ord2wd(date_ord)],
+                ord2date(date_ord).strftime(OUTPUT_FMT), desc)
     else:
         yield 'Kurz nevychází na žádné dny volna.\n'
     yield '\n'
@@ -456,43 +1591,404 @@ def iter_date_numbering_nmp(total, part1):
         p = 1 if is_part1 else 2
         yield (n, m, p)
 
+def compute_dates(start_date, last_date, part_date, exc_dates, weekdays):
+    """
+    Compute the dates of a course eagerly. Return a tuple (dates, exc_desc,
+    n, n1) like `dates_except` and `count_lessons_parts`: the day ordinals
+    of the lessons (array('i')), (ordinal, description) exceptions, and the
+    numbers of lessons in the whole course and before `part_date`.
+    """
+    dates, exc_desc = dates_except(
+        weekdays_between_dates(weekdays, start_date, last_date), exc_dates
+        )
+    n   = len(dates)
+    n1  = bisect_left(dates, part_date.toordinal()) if part_date else n
+    return (dates, exc_desc, n, n1)
+
 def compute(
     start_date,last_date, part_date, exc_dates2desc, weekdays, wd2time_range,
     cal_name=None, event_summary=None,
-    exc_cal_name=None, exc_event_summary=None
+    exc_cal_name=None, exc_event_summary=None,
+    compact=False, tracer=NULL_TRACER,
+    uid_prefix=None, exc_uid_prefix=None, sequence=0
     ):
     """
     Do all the calendar computations and return a tuple of iterators with the
     output.
+
+    The counts are computed upfront using an `ExcDates` index (pass an
+    `ExcDates` object as `exc_dates2desc` to reuse it), the lists of dates
+    are only generated once any of the iterators is consumed. Dates are
+    kept as day ordinals in compact arrays and converted to date objects
+    only in the output functions.
+
+    If `compact` is true and `event_summary` does not use `$n`, `$m` or `$p`,
+    the course calendar contains one recurring event per week day instead of
+    one event per lesson (see `iter_icalendar_rrule`).
+
+    The stages ('exc_index', 'count', 'weekdays', 'exceptions' and the
+    rendering stages of the output functions) are reported to `tracer`
+    (e.g. a `StageTracer`) as they run.
+
+    Events have UIDs with the prefixes `uid_prefix` (the course calendar)
+    and `exc_uid_prefix` (the exception calendar), by default from
+    `ical_calendar_uid_prefix`, pass '' for no UIDs. `sequence` is the
+    SEQUENCE of all the events (a revision of the whole calendar, not of
+    single lessons).
     """
-    wd_dates        = weekdays_between_dates(weekdays, start_date, last_date)
-    dates, exc_desc = dates_except(wd_dates, exc_dates2desc)
+    if not isinstance(exc_dates2desc, ExcDates):
+        with tracer.stage('exc_index'):
+            exc_dates2desc = ExcDates.from_dates2desc(exc_dates2desc)
+    if uid_prefix is None and cal_name:
+        uid_prefix = ical_calendar_uid_prefix('course', cal_name, start_date)
+    if exc_uid_prefix is None and exc_cal_name:
+        exc_uid_prefix = ical_calendar_uid_prefix(
+            'exc', exc_cal_name, start_date
+            )
+    with tracer.stage('count') as stage:
+        n, n1   = count_lessons_parts(
+            weekdays, start_date, last_date, part_date, exc_dates2desc
+            )
+        stage.items = n
 
-    n   = len(dates)
-    if part_date:
-        dates1 = list(takewhile(lambda date: date<part_date, dates))
-        n1  = len(dates1)
-    else:
-        n1  = n
-    txt     = iter_txt_output(dates, exc_desc, part_date, n, n1)
-    if cal_name and event_summary:
-        dates_nmp = zip(dates, iter_date_numbering_nmp(n, n1))
-        ical = iter_icalendar(
-            dates_nmp, wd2time_range, cal_name, event_summary, date_nmp_fmt_map
+    @lru_cache(maxsize=None)
+    def dates_exc_desc():
+        with tracer.stage('weekdays') as stage:
+            wd_dates = weekdays_between_dates(weekdays, start_date, last_date)
+            stage.items = len(wd_dates)
+        with tracer.stage('exceptions') as stage:
+            dates, exc_desc = dates_except(wd_dates, exc_dates2desc)
+            stage.items = len(exc_desc)
+        return (dates, exc_desc)
+
+    def iter_txt():
+        dates, exc_desc = dates_exc_desc()
+        yield from iter_txt_output(
+            dates, exc_desc, part_date, n, n1, tracer=tracer
+            )
+    # the dates are computed before the rendering (its stage) starts:
+    def iter_ical():
+        dates = dates_exc_desc()[0]
+        yield from iter_icalendar(
+            zip(dates, iter_date_numbering_nmp(n, n1)), wd2time_range,
+            cal_name, event_summary, date_nmp_fmt_map, tracer=tracer,
+            uid_prefix=uid_prefix, sequence=sequence
             )
+    def iter_exc_ical():
+        exc_desc = dates_exc_desc()[1]
+        yield from iter_icalendar(
+            exc_desc, None, exc_cal_name, exc_event_summary, exc_s_fmt_map,
+            tracer=tracer, uid_prefix=exc_uid_prefix, sequence=sequence
+            )
+
+    def iter_ical_rrule():
+        dates, exc_desc = dates_exc_desc()
+        yield from iter_icalendar_rrule(
+            dates, [date for date, __ in exc_desc], wd2time_range,
+            cal_name, event_summary, tracer=tracer,
+            uid_prefix=uid_prefix, sequence=sequence
+            )
+
+    txt     = iter_txt()
+    if (cal_name and event_summary and compact and
+        not (template_keys(event_summary) & DATE_NMP_KEYS)):
+        ical = iter_ical_rrule()
+    elif cal_name and event_summary:
+        ical = iter_ical()
     else:
         ical = None
     if exc_cal_name and exc_event_summary:
-        exc_ical = iter_icalendar(
-            exc_desc, None, exc_cal_name, exc_event_summary, exc_s_fmt_map
-            )
+        exc_ical = iter_exc_ical()
     else:
         exc_ical = None
 
     return (txt, ical, exc_ical)
 
-# "main" script for Google Colab (also works for CLI):
+OUTPUT_FORMAT_VERSION = 2   # of `compute`, a part of `compute_key`
+
+def compute_key(
+    start_date,last_date, part_date, exc_dates, weekdays, wd2time_range,
+    cal_name=None, event_summary=None,
+    exc_cal_name=None, exc_event_summary=None,
+    compact=False, uid_prefix=None, exc_uid_prefix=None, sequence=0
+    ):
+    """
+    Return a content-addressed cache key (a hex digest) for the normalized
+    arguments of `compute` (`exc_dates` has to be an `ExcDates` object).
+    Arguments that do not change the output of `compute` are ignored.
+    """
+    weekdays = sorted(set(weekdays))
+    if not (cal_name and event_summary):
+        cal_name = event_summary = compact = uid_prefix = None
+    if not (exc_cal_name and exc_event_summary):
+        exc_cal_name = exc_event_summary = exc_uid_prefix = None
+    if not (cal_name or exc_cal_name):
+        sequence = None
+    normalized = (
+        OUTPUT_FORMAT_VERSION,
+        start_date.toordinal(), last_date.toordinal(),
+        part_date and part_date.toordinal(),
+        exc_dates.digest(),
+        weekdays,
+        [(wd2time_range or {}).get(wd) for wd in weekdays]
+            if cal_name else None,
+        cal_name, event_summary, bool(compact),
+        exc_cal_name, exc_event_summary,
+        uid_prefix, exc_uid_prefix, sequence
+        )
+    return hashlib.sha256(repr(normalized).encode()).hexdigest()
+
+class ResultCache:
+    """
+    Thread-safe LRU cache for computed outputs (strings or bytes) bounded by
+    the total size of the values (their `len`). Counts hits and misses.
+    """
+
+    def __init__(self, max_size):
+        self.max_size   = max_size
+        self.size       = 0
+        self.hits       = 0
+        self.misses     = 0
+        self._items     = OrderedDict()
+        self._lock      = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._items.get(key, None)
+            if value is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_size:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = value
+            self.size += len(value)
+            while self.size > self.max_size:
+                __, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def get_or_compute(self, key, compute_f):
+        """
+        Return the cached value for `key` or compute it by calling
+        `compute_f()` and cache it.
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute_f()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        """
+        Remove all values (the hit and miss counts are kept).
+        """
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits':     self.hits,
+                'misses':   self.misses,
+                'items':    len(self._items),
+                'size':     self.size,
+                'max_size': self.max_size,
+                }
+
+SQLITE_CACHE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    key         TEXT PRIMARY KEY,
+    value       NOT NULL,
+    size        INTEGER NOT NULL,
+    created     REAL NOT NULL,
+    accessed    REAL NOT NULL
+    );
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+CREATE TABLE IF NOT EXISTS results_size (
+    id          INTEGER PRIMARY KEY CHECK (id = 0),
+    size        INTEGER NOT NULL
+    );
+INSERT OR IGNORE INTO results_size VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results BEGIN
+    UPDATE results_size SET size = size + NEW.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results BEGIN
+    UPDATE results_size SET size = size - OLD.size WHERE id = 0;
+END;
+'''
+SQLITE_CACHE_TIMEOUT = 5        # seconds to wait for a write lock
+SQLITE_CACHE_ACCESS_RESOLUTION = 60 # seconds, see `SQLiteResultCache.get`
+
+class SQLiteResultCache(ResultCache):
+    """
+    A `ResultCache` in an SQLite database file shared by all processes
+    (e.g. web server workers) on a host, bounded by the total size of the
+    values and optionally by their age (`ttl` in seconds).
+
+    Values are written once (outputs are deterministic, the first value for
+    a key wins), the least recently used ones are evicted. The database is
+    in the WAL mode, so readers do not wait for writers. Database errors
+    are counted and treated as misses. Hits and misses are counted per
+    process.
+    """
+
+    def __init__(self, path, max_size, ttl=None):
+        self.path       = path
+        self.max_size   = max_size
+        self.ttl        = ttl
+        self.hits       = 0
+        self.misses     = 0
+        self.errors     = 0
+        self._local     = threading.local()
+        self._lock      = threading.Lock()     # for the counters
+
+    def _connection(self):
+        """
+        Return the connection of the current thread (and process).
+        """
+        pid_connection = getattr(self._local, 'pid_connection', None)
+        if pid_connection is None or pid_connection[0] != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=SQLITE_CACHE_TIMEOUT, isolation_level=None
+                )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SQLITE_CACHE_SCHEMA)
+            pid_connection = self._local.pid_connection = (
+                os.getpid(), connection
+                )
+        return pid_connection[1]
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key, default=None):
+        """
+        Return the value for `key`. The access time used for eviction is
+        only updated when it is older than `SQLITE_CACHE_ACCESS_RESOLUTION`,
+        so that most hits are reads only.
+        """
+        now = time.time()
+        try:
+            connection = self._connection()
+            row = connection.execute(
+                'SELECT value, created, accessed FROM results WHERE key = ?',
+                (key,)
+                ).fetchone()
+            if row is not None and self.ttl and row[1] < now-self.ttl:
+                row = None
+            if row is not None and (
+                row[2] < now-SQLITE_CACHE_ACCESS_RESOLUTION
+                ):
+                connection.execute(
+                    'UPDATE results SET accessed = ? WHERE key = ?',
+                    (now, key)
+                    )
+        except sqlite3.Error:
+            self._count('errors')
+            row = None
+        if row is None:
+            self._count('misses')
+            return default
+        self._count('hits')
+        return row[0]
+
+    def put(self, key, value):
+        if len(value) > self.max_size:
+            return
+        now = time.time()
+        try:
+            connection = self._connection()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                if self.ttl:
+                    # an expired value of the key would keep the new one out:
+                    connection.execute(
+                        'DELETE FROM results WHERE key = ? AND created < ?',
+                        (key, now-self.ttl)
+                        )
+                inserted = connection.execute(
+                    'INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?)',
+                    (key, value, len(value), now, now)
+                    ).rowcount
+                if inserted:
+                    self._evict(connection, now, key)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        except sqlite3.Error:
+            self._count('errors')
+
+    def _evict(self, connection, now, key):
+        """
+        Delete expired values and then the least recently used ones (except
+        the just inserted `key`) until the size fits (within a write
+        transaction).
+        """
+        if self.ttl:
+            connection.execute(
+                'DELETE FROM results WHERE created < ?', (now-self.ttl,)
+                )
+        excess = connection.execute(
+            'SELECT size FROM results_size'
+            ).fetchone()[0] - self.max_size
+        if excess <= 0:
+            return
+        evicted = []
+        rows    = connection.execute(
+            'SELECT key, size FROM results WHERE key != ? ORDER BY accessed',
+            (key,)
+            )
+        for evicted_key, size in rows:
+            evicted.append((evicted_key,))
+            excess -= size
+            if excess <= 0:
+                break
+        rows.close()
+        connection.executemany('DELETE FROM results WHERE key = ?', evicted)
+
+    def clear(self):
+        try:
+            self._connection().execute('DELETE FROM results')
+        except sqlite3.Error:
+            self._count('errors')
+
+    def stats(self):
+        try:
+            items, size = self._connection().execute(
+                'SELECT (SELECT COUNT(*) FROM results), size FROM results_size'
+                ).fetchone()
+        except sqlite3.Error:
+            items = size = None
+        with self._lock:
+            return {
+                'hits':     self.hits,
+                'misses':   self.misses,
+                'errors':   self.errors,
+                'items':    items,
+                'size':     size,
+                'max_size': self.max_size,
+                'ttl':      self.ttl,
+                }
+
+# "main" script for Google Colab (also works for CLI, `--profile` prints
+# the time, items and memory of the computation stages to stderr):
 if __name__ == '__main__':
+    profile             = '--profile' in sys.argv[1:]
+    tracer              = StageTracer() if profile else NULL_TRACER
+    if profile:
+        tracemalloc.start()
     weekdays_mo_fri     = [
         hodina_v_po, hodina_v_út, hodina_v_st, hodina_v_čt, hodina_v_pá
         ]
@@ -501,14 +1997,16 @@ if __name__ == '__main__':
     start_date          = ymd2date(začátek_školního_roku)
     part_date           = ymd2date(předěl_roku)
     last_date           = ymd2date(konec_školního_roku)
-    exc_dates2desc      = except_dates2desc(
-        EXC_DATES_STATE if vynechávat=='jen svátky'
-        else EXC_DATES_SCHOOL + EXC_DATES_SPRING_P1 + EXC_DATES_STATE)
+    with tracer.stage('exc_dates'):
+        exc_dates2desc  = except_dates2desc(
+            EXC_DATES_STATE if vynechávat=='jen svátky'
+            else EXC_DATES_SCHOOL + EXC_DATES_SPRING_P1 + EXC_DATES_STATE)
     iter_txt, iter_ical, iter_exc_ical = compute(
         start_date,last_date, part_date, exc_dates2desc,
         weekdays, wd2time_range,
         cal_name='mojehodiny', event_summary='mojehodiny $n $m $p',
-        exc_cal_name='nehodiny', exc_event_summary='nehodiny $s')
+        exc_cal_name='nehodiny', exc_event_summary='nehodiny $s',
+        tracer=tracer)
     for t in iter_txt:
         sys.stdout.write(t)
     if iter_ical:
@@ -519,3 +2017,6 @@ if __name__ == '__main__':
         with open('exc_mojehodiny.ics','w') as f:
             for i in iter_exc_ical:
                 f.write(i)
+    if profile:
+        tracemalloc.stop()
+        sys.stderr.write(format_stage_records(tracer.records))
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+
+"""
+JSON HTTP API for computing course dates without the web UI.
+
+`register_api(server, prefix)` adds two routes to a Flask server:
+
+- `POST <prefix>/course`: one course as a JSON object, returns a JSON object
+- `POST <prefix>/courses`: NDJSON (one course per line), returns NDJSON
+  (one result per non-empty line) streamed as the courses are computed
+
+A course is an object with the keys 'start', 'end' (Y-M-D dates), 'weekdays'
+(0 = Monday) and optionally 'part' (Y-M-D), 'holidays' (built-in table
+names, see `mojehodiny.EXC_DATES_TABLE_ORDER`), 'spring_holidays' (values as
+in the web app), 'custom_holidays' (a string for `parse_date_desc` or
+a list of [first Y-M-D, last Y-M-D, description] intervals, without
+a description 'volno <dates>' like for a pasted line) and 'id'
+(returned in the result). A result has the keys 'n', 'n1', 'n2' (numbers of
+lessons in the whole course, before and from the part date), 'dates' and
+'exceptions' (a list of {'date', 'desc'} objects), or 'error' (a message).
+
+Holiday profiles are cached (`mojehodiny.holiday_profile`), courses sharing
+them reuse the compiled structures.
+"""
+
+import json
+from functools import lru_cache
+
+import flask
+
+import mojehodiny as mh
+
+MAX_LINE_BYTES = 1<<20      # one NDJSON course
+MAX_COURSE_DAYS = 100*366
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+@lru_cache(maxsize=1<<16)
+def ord2ymd(date_ord):
+    """
+    Convert a day ordinal to a Y-M-D string.
+    """
+    return mh.ord2date(date_ord).strftime(mh.YMD_FMT)
+
+def api_date(value, key):
+    """
+    Parse a Y-M-D date string of a course field `key`.
+    """
+    try:
+        return mh.ymd2date(value)
+    except (TypeError, ValueError):
+        raise ValueError(
+            'Neplatné datum v položce „%s“: %s'%(key, json.dumps(value))
+            ) from None
+
+def api_custom_holidays(value):
+    """
+    Convert custom holidays of a course (a string or a list of [first,
+    last, desc] intervals, the description may be null or left out) to an
+    input of `mh.holiday_profile`.
+    """
+    if value is None or isinstance(value, str):
+        return value
+    try:
+        intervals = []
+        for first, last, *desc in value:
+            if len(desc) > 1:
+                raise ValueError
+            intervals.append((first, last, desc[0] if desc else None))
+    except (TypeError, ValueError):
+        raise ValueError(
+            'Položka „custom_holidays“ musí být řetězec nebo seznam '
+            '[od, do, popis] nebo [od, do].'
+            ) from None
+    custom_holidays = []
+    for first, last, desc in intervals:
+        first_ord = api_date(first, 'custom_holidays').toordinal()
+        last_ord = api_date(last, 'custom_holidays').toordinal()
+        if first_ord > last_ord:
+            raise ValueError(
+                'První datum v rozmezí následuje až po druhém: %s~%s'%
+                (first, last)
+                )
+        if desc is None:
+            # like a pasted line without a description:
+            desc = 'volno %s'%(first if first == last else '%s~%s'%(
+                first, last
+                ))
+        elif not isinstance(desc, str):
+            raise ValueError(
+                'Popis v položce „custom_holidays“ musí být řetězec: %s'%
+                json.dumps(desc)
+                )
+        custom_holidays.append((first_ord, last_ord, desc))
+    return custom_holidays
+
+def course_args(course):
+    """
+    Validate a course (a dict, see the module docstring) and return a tuple
+    of `mh.compute_dates` arguments. Raise ValueError with a message for
+    an invalid course.
+    """
+    if not isinstance(course, dict):
+        raise ValueError('Kurz musí být objekt JSON.')
+    for key in ('start', 'end', 'weekdays'):
+        if key not in course:
+            raise ValueError('Chybí položka „%s“.'%key)
+    start_date  = api_date(course['start'], 'start')
+    last_date   = api_date(course['end'], 'end')
+    part_date   = course.get('part') and api_date(course['part'], 'part')
+    if start_date > last_date:
+        raise ValueError('Začátek kurzu následuje až po jeho konci.')
+    if (last_date-start_date).days >= MAX_COURSE_DAYS:
+        raise ValueError('Kurz je delší než %i dní.'%MAX_COURSE_DAYS)
+    weekdays = course['weekdays']
+    if (not isinstance(weekdays, list) or not weekdays or
+        not all(
+            type(wd) is int and 0 <= wd < mh.WEEK_DAYS for wd in weekdays
+            ) or
+        len(set(weekdays)) != len(weekdays)):
+        raise ValueError(
+            'Položka „weekdays“ musí být neprázdný seznam různých celých '
+            'čísel 0–6.'
+            )
+    tables = course.get('holidays') or []
+    spring_holidays = course.get('spring_holidays') or []
+    if (not isinstance(tables, list) or
+        not all(table in mh.EXC_DATES_TABLE_ORDER for table in tables)):
+        raise ValueError(
+            'Položka „holidays“ musí být seznam z hodnot: %s.'%
+            ', '.join(mh.EXC_DATES_TABLE_ORDER)
+            )
+    if (not isinstance(spring_holidays, list) or
+        not all(isinstance(value, str) for value in spring_holidays)):
+        raise ValueError('Položka „spring_holidays“ musí být seznam řetězců.')
+    for value in spring_holidays:
+        try:
+            mh.spring_holidays_intervals(value)
+        except ValueError:
+            raise ValueError(
+                'Neplatné jarní prázdniny v položce „spring_holidays“: %s'%
+                json.dumps(value)
+                ) from None
+    exc_dates = mh.holiday_profile(
+        tables, spring_holidays,
+        api_custom_holidays(course.get('custom_holidays'))
+        )
+    return (start_date, last_date, part_date, exc_dates, weekdays)
+
+def course_result(course):
+    """
+    Compute the result (a JSON-serializable dict) for a course. Errors are
+    returned as {'error': message}.
+    """
+    try:
+        dates, exc_desc, n, n1 = mh.compute_dates(*course_args(course))
+    except ValueError as error:
+        result = {'error': error.args[0]}
+    else:
+        result = {
+            'n':            n,
+            'n1':           n1,
+            'n2':           n-n1,
+            'dates':        [ord2ymd(date_ord) for date_ord in dates],
+            'exceptions':   [
+                {'date': ord2ymd(date_ord), 'desc': desc}
+                for date_ord, desc in exc_desc
+                ],
+            }
+    if isinstance(course, dict) and 'id' in course:
+        result = {'id': course['id'], **result}
+    return result
+
+def iter_ndjson_results(stream):
+    """
+    Read NDJSON courses from a binary `stream` line by line and generate
+    NDJSON result lines (bytes). Memory is bounded by `MAX_LINE_BYTES`.
+    An unexpected error in one course is reported on its line, it does not
+    end the stream.
+    """
+    line_no = 0
+    while True:
+        line = stream.readline(MAX_LINE_BYTES+1)
+        if not line:
+            break
+        line_no += 1
+        if len(line) > MAX_LINE_BYTES and not line.endswith(b'\n'):
+            # skip the rest of the line:
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(MAX_LINE_BYTES)
+            result = {'error': 'Řádek je delší než %i bajtů.'%MAX_LINE_BYTES}
+        elif not line.strip():
+            continue
+        else:
+            try:
+                course = json.loads(line)
+            except ValueError as error:
+                result = {'error': 'Neplatný JSON: %s'%error}
+            else:
+                try:
+                    result = course_result(course)
+                except Exception as error:
+                    result = {'error': 'Kurz nelze spočítat (%s).'%
+                        type(error).__name__}
+                    if isinstance(course, dict) and 'id' in course:
+                        result = {'id': course['id'], **result}
+        result = {'line': line_no, **result}
+        yield json.dumps(
+            result, ensure_ascii=False, separators=(',', ':')
+            ).encode() + b'\n'
+
+def register_api(server, prefix):
+    """
+    Add the API routes (see the module docstring) to a Flask `server`.
+    """
+
+    @server.route(prefix + '/course', methods=['POST'])
+    def api_course():
+        course = flask.request.get_json(force=True, silent=True)
+        if course is None:
+            result = {'error': 'Neplatný JSON.'}
+        else:
+            result = course_result(course)
+        response = flask.Response(
+            json.dumps(result, ensure_ascii=False, separators=(',', ':')),
+            mimetype='application/json'
+            )
+        if 'error' in result:
+            response.status_code = 400
+        return response
+
+    @server.route(prefix + '/courses', methods=['POST'])
+    def api_courses():
+        return flask.Response(
+            flask.stream_with_context(
+                iter_ndjson_results(flask.request.stream)
+                ),
+            mimetype=NDJSON_MIMETYPE
+            )
@@ -1,10 +1,18 @@
 #!/usr/bin/env python
 
 from datetime import datetime as dt
+import os
+import io
 import re
-from itertools import chain
+import json
+import zlib
+import base64
+import hashlib
+from itertools import chain, islice
+from functools import lru_cache
 from urllib import parse as urllib_parse
 
+import flask
 import dash
 from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
@@ -12,6 +20,9 @@ import dash_html_components as html
 import dash_core_components as dcc
 
 import mojehodiny as mh
+import mojehodiny_metrics as mh_metrics
+import mojehodiny_compress as mh_compress
+import mojehodiny_api as mh_api
 
 def ymd_dt2dt(date_str):
     """
@@ -76,18 +87,40 @@ def markdown_subset_strip(md_str):
     return re.sub(r'(`|\*|\*\*)([^`*]+)\1', r'\2', md_str)
 
 
+# Trivial UI callbacks are set up as clientside (JavaScript) callbacks
+# generated from the definitions below. Set to False to use the server-side
+# (Python) versions instead:
+CLIENTSIDE_CALLBACKS = True
+TIME_RANGE_ERROR = '← chybný konec'
+
+def ui_callback(outputs, inputs, server_f, js_f):
+    """
+    Set up a trivial UI callback either as a clientside callback `js_f`
+    (JavaScript source of a function) or as a server-side callback
+    `server_f` (see `CLIENTSIDE_CALLBACKS`).
+    """
+    if CLIENTSIDE_CALLBACKS:
+        app.clientside_callback(js_f, outputs, inputs)
+    else:
+        app.callback(outputs, inputs)(server_f)
+
 def checklist_enables_inputs(checklist_id, input_ids):
     """
     Set up a callback for a weekday checklist: A weekday's checkbox enables
     time range inputs for the weekday's time range).
     """
-    @app.callback(
-        [Output(id, 'disabled') for id in input_ids],
-        [Input(checklist_id, 'value')]
-    )
     def update_inputs_enabled(checklist):
         disabled = not checklist
         return [disabled]*len(input_ids)
+    ui_callback(
+        [Output(id, 'disabled') for id in input_ids],
+        [Input(checklist_id, 'value')],
+        update_inputs_enabled,
+        '''function(checklist) {
+            var disabled = !(checklist && checklist.length);
+            return Array(%i).fill(disabled);
+        }'''%len(input_ids)
+        )
 
 def hm_range_ok(start_h, start_m, end_h, end_m):
     """
@@ -100,15 +133,24 @@ def time_range_inputs_displays_error(input_ids, error_id):
     Set up a callback for four time range inputs HH:MM-HH:MM.
     Invalid time range displays an error.
     """
-    @app.callback(
-        Output(error_id, 'children'),
-        [Input(id, 'value') for id in input_ids]
-    )
     def update_error(start_h, start_m, end_h, end_m):
         if (None in (start_h, start_m, end_h, end_m) or
             hm_range_ok(start_h, start_m, end_h, end_m)):
             return ''
-        return '← chybný konec'
+        return TIME_RANGE_ERROR
+    ui_callback(
+        Output(error_id, 'children'),
+        [Input(id, 'value') for id in input_ids],
+        update_error,
+        '''function(start_h, start_m, end_h, end_m) {
+            if ([start_h, start_m, end_h, end_m].some(
+                    function(v) { return v === null || v === undefined; }) ||
+                start_h*60+start_m < end_h*60+end_m) {
+                return '';
+            }
+            return %s;
+        }'''%json.dumps(TIME_RANGE_ERROR)
+        )
 
 def iter_wd_tr_ids():
     """
@@ -195,6 +237,8 @@ def week_day_check_time_range_pickers():
 
 # Setup the app and layout:
 
+ICS_UPLOAD_MAX_SIZE = 16<<20    # bytes
+
 
 APP_PATH = '/mojehodiny'
 APP_NAME = 'Moje hodiny'
@@ -205,14 +249,20 @@ APP_MD_DESC = (
     'Přesně to umí Moje hodiny a navíc vám vytvoří i **kalendář lekcí '
     '(a volna)** do počítače nebo telefonu.'
 )
-APP_MD_FOOTER = '''Verze 0.1.23 (2020-09-29). 🐨 2020 [Adam Nohejl](http://nohejl.name/). Zdroják je [![GitHub](/assets/GitHub-Mark-32px.png) na GitHubu](https://github.com/adno/mojehodiny).
+APP_MD_FOOTER = '''Verze 0.1.23 (2020-09-29). 🐨 2020 [Adam Nohejl](http://nohejl.name/). Zdroják je [![GitHub](%s) na GitHubu](https://github.com/adno/mojehodiny).
 
 Napsáno v Pythonu pomocí frameworku [Dash](https://dash.plotly.com/)
 bez jediné řádky JavaScriptu a jen s pár řádkami HTML, CSS a Markdownu.
 
 Hlášení chyb, nápady, postřehy a pochvaly prosím na mail
 [adam&#x40;nohejl.name](mailto:adam&#x40;nohejl.name).
-'''
+'''%(
+    # fingerprinted => cached as immutable (see `mh_compress.asset_url`):
+    '/assets/GitHub-Mark-32px.png?v=%s'%mh_compress.file_fingerprint(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets',
+            'GitHub-Mark-32px.png')
+        )
+    )
 APP_DESC = markdown_subset_strip(APP_MD_DESC)
 
 app = dash.Dash(
@@ -301,8 +351,8 @@ app.layout = html.Div([ # container
                 display_format='D. M. Y',
                 start_date_placeholder_text='začátek',
                 end_date_placeholder_text='konec',
-                min_date_allowed=dt(2020, 1, 1),
-                max_date_allowed=dt(2022, 12, 31),
+                min_date_allowed=dt(mh.STATE_HOLIDAYS_FIRST_YEAR, 1, 1),
+                max_date_allowed=dt(mh.STATE_HOLIDAYS_LAST_YEAR, 12, 31),
                 start_date=dt(school_year_start, 9, 1).date(),
                 end_date=dt(school_year_end, 6, 30).date()
                 ),
@@ -326,14 +376,14 @@ app.layout = html.Div([ # container
         html.Div([
             html.H2('Dny volna'),
             dcc.Checklist(id='holidays', options=[
-                {'label': 'Státní svátky 2020–2022', 'value': 'state'},
+                {'label': 'Státní svátky', 'value': 'state'},
                 {'label': 'Školní prázdniny 2020/21 a 2021/22 (celostátní)',
                     'value': 'school'}
                 ]),
             html.H3('Jarní prázdniny 2020/21 a 2021/22'),
             dcc.Dropdown(id='spring_holidays',
                 placeholder='Hledat podle místa…',
-                options=[{'label': '1. 2.–7. 2. 2021 a 14. 2.–20. 2. 2022: Česká Lípa, Jablonec nad Nisou, Liberec, Semily, Havlíčkův Brod, Jihlava, Pelhřimov, Třebíč, Žďár nad Sázavou, Kladno, Kolín, Kutná Hora, Písek, Náchod, Bruntál', 'value': '1. 2.–7. 2. 2021+14. 2.–20. 2. 2022'}, {'label': '8. 2.–14. 2. 2021 a 21. 2.–27. 2. 2022: Mladá Boleslav, Příbram, Tábor, Prachatice, Strakonice, Ústí nad Labem, Chomutov, Most, Jičín, Rychnov nad Kněžnou, Olomouc, Šumperk, Opava, Jeseník', 'value': '8. 2.–14. 2. 2021+21. 2.–27. 2. 2022'}, {'label': '15. 2.–21. 2. 2021 a 28. 2.–6. 3. 2022: Benešov, Beroun, Rokycany, České Budějovice, Český Krumlov, Klatovy, Trutnov, Pardubice, Chrudim, Svitavy, Ústí nad Orlicí, Ostrava-město, Prostějov', 'value': '15. 2.–21. 2. 2021+28. 2.–6. 3. 2022'}, {'label': '22. 2.–28. 2. 2021 a 7. 3.–13. 3. 2022: Praha 1 až 5, Blansko, Brno-město, Brno-venkov, Břeclav, Hodonín, Vyškov, Znojmo, Domažlice, Tachov, Louny, Karviná', 'value': '22. 2.–28. 2. 2021+7. 3.–13. 3. 2022'}, {'label': '1. 3.–7. 3. 2021 a 14. 3.–20. 3. 2022: Praha 6 až 10, Cheb, Karlovy Vary, Sokolov, Nymburk, Jindřichův Hradec, Litoměřice, Děčín, Přerov, Frýdek-Místek', 'value': '1. 3.–7. 3. 2021+14. 3.–20. 3. 2022'}, {'label': '8. 3.–14. 3. 2021 a 7. 2.–13. 2. 2022: Kroměříž, Uherské Hradiště, Vsetín, Zlín, Praha-východ, Praha-západ, Mělník, Rakovník, Plzeň-město, Plzeň-sever, Plzeň-jih, Hradec Králové, Teplice, Nový Jičín', 'value': '8. 3.–14. 3. 2021+7. 2.–13. 2. 2022'}],
+                options=[], # see update_spring_holiday_options
                 multi=True, optionHeight=120), # 90 enough on desktop, 120 on iPhone
             html.Div(id='holiday_warning', className='warning'),
             html.H3('Vlastní dny volna'),
@@ -349,12 +399,27 @@ app.layout = html.Div([ # container
                 className='fullwidth',
                 style={'height': 100},
             ),
-            html.Div(id='confirmed_custom_holidays',
-                hidden=True
-                ),
+            # {'intervals': parsed (first_ord, last_ord, desc) intervals}:
+            dcc.Store(id='confirmed_custom_holidays'),
+            dcc.Store(id='holiday_state'),
+            dcc.Store(id='course_state'),
             html.Button('Potvrdit', id='custom_holidays_submit', n_clicks=0),
             html.Span(id='custom_holidays_error', className='error'),
             html.Span(id='custom_holidays_warning', className='warning'),
+            markdown_subset_p(
+                'Dny volna můžete také importovat z kalendáře školy (soubor '
+                '`.ics`, použijí se celodenní a vícedenní události).'),
+            dcc.Upload(
+                id='ics_upload',
+                children=html.A('📅 Vybrat soubor .ics'),
+                accept='.ics,text/calendar',
+                max_size=ICS_UPLOAD_MAX_SIZE,
+                ),
+            # {'file': file name, 'key': imported intervals on the server
+            # (see `imported_intervals`)}:
+            dcc.Store(id='imported_holidays'),
+            html.Button('Odebrat import', id='ics_upload_clear', n_clicks=0),
+            html.Span(id='ics_upload_status'),
             ], className='six columns'),
         ], className='row'),
     html.Hr(),
@@ -384,6 +449,11 @@ app.layout = html.Div([ # container
                 )),
             dcc.Input(id='event_name', placeholder='Zorbing II #$n ($p/$m)',
                 className='fullwidth'),
+            dcc.Checklist(id='calendar_options', options=[
+                {'label': 'Kompaktní kalendář (opakované události, jen pokud '
+                    'název události nepoužívá $n, $p ani $m)',
+                    'value': 'compact'}
+                ]),
             html.Div(id='calendar_output_container',
                 className='output center'),
             html.H3('Kalendář volna'),
@@ -412,13 +482,303 @@ ALL_FIELD_OUTPUTS = ([
     Output('custom_holidays', 'value'),
     Output('custom_holidays_submit', 'n_clicks'),
     Output('calendar_name', 'value'), Output('event_name', 'value'),
+    Output('calendar_options', 'value'),
     Output('exc_calendar_name', 'value'), Output('exc_event_name', 'value')
     ]+
     [Output(id, 'value') for id in WD_CHECKLIST_IDS]+
     [Output(id, 'value') for id in WD_TIME_RANGE_IDS]
     )
 
-LIST_FIELD_IDS = {'holidays', 'spring_holidays', *WD_CHECKLIST_IDS}
+LIST_FIELD_IDS = {
+    'holidays', 'spring_holidays', 'calendar_options', *WD_CHECKLIST_IDS
+    }
+
+# Compact share link state (the `SHARE_PARAM` query parameter), version 1,
+# a base64url-encoded sequence of unsigned varints (LEB128, signed values
+# zigzag-encoded) and length-prefixed UTF-8 strings:
+#
+# - version, flags (`SHARE_FLAGS`)
+# - start date (days since `SHARE_EPOCH_ORD`), end and part date (days since
+#   the start date or the epoch), each only if flagged
+# - holidays (a bitfield of `mh.EXC_DATES_TABLE_ORDER`), spring holidays
+#   (a bitfield of the registry options, the number of other values and the
+#   values), weekdays (a bitfield)
+# - time ranges (a bitfield of the filled `WD_TIME_RANGE_IDS`, their values)
+# - the flagged `SHARE_STR_IDS` values
+# - if flagged, the length of the raw-deflated custom holidays: the number
+#   of intervals, (first day - previous first day, last day - first day,
+#   description) per interval
+#
+# Changing the order of the tables or the spring holiday options changes the
+# meaning of existing links, increase `SHARE_VERSION` then.
+
+SHARE_PARAM     = 's'
+SHARE_VERSION   = 1
+SHARE_EPOCH_ORD = dt(2020, 1, 1).toordinal()
+SHARE_STR_IDS   = (
+    'calendar_name', 'event_name', 'exc_calendar_name', 'exc_event_name'
+    )
+SHARE_FLAGS     = (
+    'start_date', 'end_date', 'part_date', 'compact', 'custom_holidays',
+    *SHARE_STR_IDS
+    )
+SHARE_FLAG      = {name: 1<<i for i, name in enumerate(SHARE_FLAGS)}
+
+def varint(n):
+    """
+    Encode an unsigned int as LEB128 bytes.
+    """
+    out = bytearray()
+    while n > 0x7f:
+        out.append(n&0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+    return out
+
+def zigzag(n):
+    """
+    Map a signed int to an unsigned one (0, -1, 1, -2, … => 0, 1, 2, 3, …).
+    """
+    return n<<1 if n >= 0 else (~n<<1)|1
+
+def read_varint(it):
+    """
+    Read an unsigned LEB128 int from an iterator of bytes.
+    """
+    n = shift = 0
+    for byte in it:
+        n |= (byte&0x7f) << shift
+        if byte < 0x80:
+            return n
+        shift += 7
+    raise ValueError('Neočekávaný konec dat')
+
+def read_zigzag(it):
+    """
+    Read a zigzag-encoded signed int from an iterator of bytes.
+    """
+    n = read_varint(it)
+    return ~(n>>1) if n&1 else n>>1
+
+def read_str(it):
+    """
+    Read a length-prefixed UTF-8 string from an iterator of bytes.
+    """
+    size = read_varint(it)
+    data = bytes(islice(it, size))
+    if len(data) != size:
+        raise ValueError('Neočekávaný konec dat')
+    return data.decode()
+
+def str_bytes(s):
+    """
+    Encode a string as length-prefixed UTF-8 bytes.
+    """
+    data = s.encode()
+    return varint(len(data)) + data
+
+def encode_share_state(
+    start_date, end_date, part_date, holidays, spring_holidays, intervals,
+    calendar_name, event_name, calendar_options,
+    exc_calendar_name, exc_event_name, wd_values, tr_values
+    ):
+    """
+    Encode the form state into a share token (see `SHARE_PARAM`),
+    `intervals` are the confirmed custom holidays (or None), `wd_values` and
+    `tr_values` the values of `WD_CHECKLIST_IDS` and `WD_TIME_RANGE_IDS`.
+    """
+    flags = 0
+    body = bytearray()
+    epoch_ord = SHARE_EPOCH_ORD
+    for name, date in zip(SHARE_FLAGS, (start_date, end_date, part_date)):
+        date = ymd_dt2dt(date)
+        if date:
+            flags |= SHARE_FLAG[name]
+            body += varint(zigzag(date.toordinal()-epoch_ord))
+            if name == 'start_date':
+                epoch_ord = date.toordinal()
+    body += varint(sum(
+        1<<i for i, name in enumerate(mh.EXC_DATES_TABLE_ORDER)
+        if name in (holidays or ())
+        ))
+    options = mh.spring_holiday_registry().options
+    values = set(spring_holidays or ())
+    other_values = values.difference(option['value'] for option in options)
+    body += varint(sum(
+        1<<i for i, option in enumerate(options) if option['value'] in values
+        ))
+    body += varint(len(other_values))
+    for value in sorted(other_values):
+        body += str_bytes(value)
+    body += varint(sum(1<<i for i, value in zip(WD_RANGE, wd_values) if value))
+    tr_ints = [
+        (i, value) for i, value in enumerate(tr_values)
+        if isinstance(value, int) and value >= 0
+        ]
+    body += varint(sum(1<<i for i, __ in tr_ints))
+    for __, value in tr_ints:
+        body += varint(value)
+    if calendar_options and 'compact' in calendar_options:
+        flags |= SHARE_FLAG['compact']
+    for name, value in zip(SHARE_STR_IDS,
+        (calendar_name, event_name, exc_calendar_name, exc_event_name)):
+        if value:
+            flags |= SHARE_FLAG[name]
+            body += str_bytes(value)
+    if intervals:
+        flags |= SHARE_FLAG['custom_holidays']
+        packed = bytearray(varint(len(intervals)))
+        previous_ord = epoch_ord
+        for first_ord, last_ord, desc in intervals:
+            packed += varint(zigzag(first_ord-previous_ord))
+            packed += varint(last_ord-first_ord)
+            packed += str_bytes(desc)
+            previous_ord = first_ord
+        deflate = zlib.compressobj(9, zlib.DEFLATED, -15)
+        packed = deflate.compress(packed) + deflate.flush()
+        body += varint(len(packed)) + packed
+    token = base64.urlsafe_b64encode(
+        bytes(varint(SHARE_VERSION) + varint(flags) + body)
+        )
+    return token.rstrip(b'=').decode()
+
+def decode_share_state(token):
+    """
+    Decode a share token (see `encode_share_state`) into a dict of
+    component id (or 'start_date', 'end_date') => value for the fields in
+    the token. Raise ValueError if the token is invalid.
+    """
+    try:
+        data = base64.urlsafe_b64decode(token + '='*(-len(token)%4))
+    except (TypeError, ValueError):
+        raise ValueError('Neplatný odkaz') from None
+    it = iter(data)
+    if read_varint(it) != SHARE_VERSION:
+        raise ValueError('Nepodporovaná verze odkazu')
+    flags = read_varint(it)
+    values = {}
+    epoch_ord = SHARE_EPOCH_ORD
+    for name in SHARE_FLAGS[:3]:
+        if flags & SHARE_FLAG[name]:
+            date_ord = epoch_ord+read_zigzag(it)
+            values[name] = mh.ord2date(date_ord)
+            if name == 'start_date':
+                epoch_ord = date_ord
+    bits = read_varint(it)
+    values['holidays'] = [
+        name for i, name in enumerate(mh.EXC_DATES_TABLE_ORDER) if bits>>i&1
+        ]
+    bits = read_varint(it)
+    values['spring_holidays'] = [
+        option['value']
+        for i, option in enumerate(mh.spring_holiday_registry().options)
+        if bits>>i&1
+        ]
+    values['spring_holidays'].extend(
+        read_str(it) for __ in range(read_varint(it))
+        )
+    bits = read_varint(it)
+    for i, id in zip(WD_RANGE, WD_CHECKLIST_IDS):
+        values[id] = [i] if bits>>i&1 else []
+    bits = read_varint(it)
+    for i, id in enumerate(WD_TIME_RANGE_IDS):
+        if bits>>i&1:
+            values[id] = read_varint(it)
+    values['calendar_options'] = (
+        ['compact'] if flags & SHARE_FLAG['compact'] else []
+        )
+    for name in SHARE_STR_IDS:
+        if flags & SHARE_FLAG[name]:
+            values[name] = read_str(it)
+    if flags & SHARE_FLAG['custom_holidays']:
+        size = read_varint(it)
+        packed = bytes(islice(it, size))
+        try:
+            packed = zlib.decompress(packed, -15)
+        except zlib.error as error:
+            raise ValueError('Neplatný odkaz: %s'%error) from None
+        packed_it = iter(packed)
+        intervals = []
+        first_ord = epoch_ord
+        for __ in range(read_varint(packed_it)):
+            first_ord += read_zigzag(packed_it)
+            last_ord = first_ord + read_varint(packed_it)
+            intervals.append((first_ord, last_ord, read_str(packed_it)))
+        values['custom_holidays'] = mh.format_date_desc(intervals)
+    return values
+
+def share_output_values(token):
+    """
+    Return the values of `ALL_FIELD_OUTPUTS` for a share token (an empty
+    form if the token is invalid).
+    """
+    try:
+        values = decode_share_state(token)
+    except (ValueError, OverflowError):
+        values = {}
+    output_values = []
+    for output in ALL_FIELD_OUTPUTS:
+        oid = output.component_id
+        if oid == 'custom_holidays_submit':
+            value = 1 if 'custom_holidays' in values else 0
+        elif oid == 'course_range':
+            value = values.get(output.component_property)
+        else:
+            value = values.get(oid, [] if oid in LIST_FIELD_IDS else None)
+        output_values.append(value)
+    return output_values
+
+def query_output_values(qs_param2values):
+    """
+    Return the values of `ALL_FIELD_OUTPUTS` for parsed query parameters of
+    the old format (a parameter per field).
+    """
+    output_values = []
+    # We use try-blocks for dates and ints, but we do not check for
+    # consistency.
+    for output in ALL_FIELD_OUTPUTS:
+        oid = output.component_id
+        if oid == 'custom_holidays_submit':
+            output_values.append(
+                1 if 'custom_holidays' in qs_param2values else 0
+                )
+            continue
+        check_date = False
+        if oid == 'course_range':
+            param = output.component_property # start_date or end_date
+            check_date = True
+        else:
+            if oid == 'part_date':
+                check_date = True
+            param = oid
+        value_list = qs_param2values.get(param, None)
+        if value_list is None:
+            output_values.append([] if (oid in LIST_FIELD_IDS) else None)
+        elif oid in LIST_FIELD_IDS:
+            if oid in WD_CHECKLIST_IDS:
+                try:
+                    value = [int(value_list[-1])]
+                except ValueError:
+                    value = []
+                output_values.append(value)
+            else:
+                output_values.append(value_list)
+        else:
+            if oid in WD_TIME_RANGE_IDS:
+                try:
+                    value = int(value_list[-1])
+                except ValueError:
+                    value = None
+                output_values.append(value)
+            else:
+                value = value_list[-1]
+                if check_date:
+                    try:
+                        value = ymd_dt2dt(value)
+                    except ValueError:
+                        value = None
+                output_values.append(value)
+    return output_values
 
 @app.callback(
     ALL_FIELD_OUTPUTS+[Output('url', 'pathname')],
@@ -436,51 +796,12 @@ def update_url(query, path):
     else:
         assert query.startswith('?')
         qs_param2values = urllib_parse.parse_qs(query[1:])
-        output_values = []
-        # We use try-blocks for dates and ints, but we do not check for
-        # consistency.
-        for output in ALL_FIELD_OUTPUTS:
-            oid = output.component_id
-            if oid == 'custom_holidays_submit':
-                output_values.append(
-                    1 if 'custom_holidays' in qs_param2values else 0
-                    )
-                continue
-            check_date = False
-            if oid == 'course_range':
-                param = output.component_property # start_date or end_date
-                check_date = True
-            else:
-                if oid == 'part_date':
-                    check_date = True
-                param = oid
-            value_list = qs_param2values.get(param, None)
-            if value_list is None:
-                output_values.append([] if (oid in LIST_FIELD_IDS) else None)
-            elif oid in LIST_FIELD_IDS:
-                if oid in WD_CHECKLIST_IDS:
-                    try:
-                        value = [int(value_list[-1])]
-                    except ValueError:
-                        value = []
-                    output_values.append(value)
-                else:
-                    output_values.append(value_list)
-            else:
-                if oid in WD_TIME_RANGE_IDS:
-                    try:
-                        value = int(value_list[-1])
-                    except ValueError:
-                        value = None
-                    output_values.append(value)
-                else:
-                    value = value_list[-1]
-                    if check_date:
-                        try:
-                            value = ymd_dt2dt(value)
-                        except ValueError:
-                            value = None
-                    output_values.append(value)
+        if SHARE_PARAM in qs_param2values:
+            output_values = share_output_values(
+                qs_param2values[SHARE_PARAM][-1]
+                )
+        else:
+            output_values = query_output_values(qs_param2values)
     # last: Output('url', 'pathname') => force our app path
     output_values.append(dash.no_update if path==APP_PATH else APP_PATH)
 
@@ -511,6 +832,20 @@ def update_part_date(start_date, end_date, part_date):
         return (start_date, end_date, warning)
     return [None]*3#4
 
+@app.callback(
+    Output('spring_holidays', 'options'),
+    [Input('spring_holidays', 'search_value'),
+     Input('spring_holidays', 'value')
+    ],
+    prevent_initial_call=True)
+def update_spring_holiday_options(search_value, spring_holidays):
+    """
+    Offer spring holidays of the places matching the search, keep the
+    selected ones (nothing else without a search). Not called on page load,
+    the dropdown starts with no options.
+    """
+    return mh.spring_holiday_options(search_value, spring_holidays or ())
+
 @app.callback(
     Output('holiday_warning', 'children'),
     [Input('holidays', 'value'),
@@ -527,20 +862,85 @@ def update_holiday_error(holidays, spring_holidays):
 
 @app.callback(
     [Output('custom_holidays_error', 'children'),
-        Output('confirmed_custom_holidays', 'children')],
+        Output('confirmed_custom_holidays', 'data')],
     [Input('custom_holidays_submit', 'n_clicks')],
     [State('custom_holidays', 'value'),
-        State('confirmed_custom_holidays', 'children')]
+        State('confirmed_custom_holidays', 'data')]
 )
 def confirm_custom_holidays(n_clicks, value, previously_confirmed):
+    """
+    Parse and confirm the custom holidays. The text is parsed only here,
+    other callbacks use the stored (first_ord, last_ord, desc) intervals.
+    """
     if n_clicks > 0 and value:
         try:
-            __ = list(mh.parse_date_desc(value)) # throw away the retval
-        except ValueError as error:
-            return (error.args[0], previously_confirmed)
-        return (None, value)
+            intervals = list(map(list, mh.date_desc_intervals(value)))
+        except mh.DateDescError as error:
+            return (
+                list(chain.from_iterable(
+                    (html.Br(), 'Řádek %i: %s'%error_info)
+                    for error_info in error.errors
+                    ))[1:],
+                previously_confirmed
+                )
+        return (None, {'intervals': intervals})
     return (None, None)
 
+@app.callback(
+    [Output('imported_holidays', 'data'),
+        Output('ics_upload_status', 'children')],
+    [Input('ics_upload', 'contents'),
+        Input('ics_upload_clear', 'n_clicks')],
+    [State('ics_upload', 'filename')]
+)
+def import_holidays(contents, n_clicks, file_name):
+    """
+    Import all-day and multi-day events of an uploaded iCalendar file as
+    holidays. The file is parsed as a stream of lines straight into
+    intervals (see `mh.iter_ical_intervals`), they are kept on the server
+    (`IMPORT_STORE`) under a hash of the file, only the key goes to the
+    browser and to the states.
+    """
+    triggered = dash.callback_context.triggered
+    if (not contents or
+        any(t['prop_id'] == 'ics_upload_clear.n_clicks' for t in triggered)):
+        return (None, None)
+    try:
+        data = base64.b64decode(contents.partition(',')[2])
+    except ValueError:
+        return (None, html.Span(
+            'Soubor „%s“ se nepodařilo načíst.'%file_name, className='error'
+            ))
+    errors = []
+    intervals = [
+        list(interval) for interval in mh.iter_ical_intervals(
+            io.TextIOWrapper(
+                io.BytesIO(data), encoding='utf-8-sig', errors='replace'
+                ),
+            errors
+            )
+        ]
+    if not intervals:
+        return (None, html.Span(
+            'V souboru „%s“ nejsou žádné celodenní ani vícedenní '
+            'události.'%file_name, className='error'
+            ))
+    status = ['Importováno %i událostí ze souboru „%s“.'%(
+        len(intervals), file_name
+        )]
+    if errors:
+        status.append(html.Span(
+            ' Přeskočeno %i neplatných událostí (řádek %i: %s).'%(
+                len(errors), *errors[0]
+                ),
+            className='warning'
+            ))
+    key = hashlib.sha256(data).hexdigest()
+    IMPORT_STORE.put(
+        key, json.dumps(intervals, separators=(',', ':'), ensure_ascii=False)
+        )
+    return ({'file': file_name, 'key': key}, status)
+
 @app.callback(
     [Output('custom_holidays_warning', 'children'),
         Output('custom_holidays_warning_in_output', 'children')],
@@ -569,29 +969,366 @@ def update_custom_holiday(value, custom_holiday_error, main_error):
         )
     return (changed_warning, secondary_error)
 
-def download_link(file_name, ics_iter):
-    download_url = (
-        'data:text/calendar;charset=utf-8,' +
-        urllib_parse.quote(''.join(ics_iter))
+ICS_KINDS = ('course', 'exc')
+FEED_MAX_AGE = 6*3600          # seconds
+FEED_KEY_CACHE_SIZE = 1<<15     # state tokens
+RESULT_CACHE_SIZE = 64<<20   # characters/bytes
+# Set MOJEHODINY_CACHE_DB to a file path to share the cache among all
+# worker processes on the host (an SQLite database):
+RESULT_CACHE_DB = os.environ.get('MOJEHODINY_CACHE_DB')
+RESULT_CACHE_DB_SIZE = 512<<20
+RESULT_CACHE_DB_TTL = 30*24*3600  # seconds
+# Imported calendars (see `import_holidays`) are kept in their own SQLite
+# database, state tokens only refer to them. Set MOJEHODINY_IMPORT_DB to
+# a file path shared by all worker processes (by default next to the app):
+IMPORT_DB = os.environ.get('MOJEHODINY_IMPORT_DB') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'mojehodiny_imports.db'
+    )
+IMPORT_DB_SIZE = 1<<30
+IMPORT_KEY_RE = re.compile(r'[0-9a-f]{64}$')
+IMPORTED_INTERVALS_CACHE_SIZE = 64
+IMPORT_MISSING_ERROR = (
+    'Importovaný kalendář už na serveru není, nahrajte ho prosím znovu.'
+    )
+# Set MOJEHODINY_STATS_TOKEN to serve /metrics and the cache statistics
+# to requests with an `Authorization: Bearer <token>` header:
+STATS_TOKEN = os.environ.get('MOJEHODINY_STATS_TOKEN')
+RESULT_CACHE = (
+    mh.SQLiteResultCache(
+        RESULT_CACHE_DB, RESULT_CACHE_DB_SIZE, RESULT_CACHE_DB_TTL
+        )
+    if RESULT_CACHE_DB else mh.ResultCache(RESULT_CACHE_SIZE)
+    )
+# least recently used imports are only evicted by other imports:
+IMPORT_STORE = mh.SQLiteResultCache(IMPORT_DB, IMPORT_DB_SIZE)
+
+def encode_state_token(state):
+    """
+    Encode a JSON-serializable state into a compact URL-safe token.
+    """
+    data = json.dumps(state, separators=(',', ':'), ensure_ascii=False)
+    token = base64.urlsafe_b64encode(zlib.compress(data.encode(), 9))
+    return token.rstrip(b'=').decode()
+
+def decode_state_token(token):
+    """
+    Decode a token created by `encode_state_token`. Raise ValueError if the
+    token is invalid.
+    """
+    try:
+        data = base64.urlsafe_b64decode(token + '='*(-len(token)%4))
+        return json.loads(zlib.decompress(data).decode())
+    except (zlib.error, UnicodeError, TypeError) as error:
+        raise ValueError('Neplatný token: %s'%error) from None
+
+def is_str_list(value):
+    return isinstance(value, list) and all(isinstance(s, str) for s in value)
+
+def is_interval_list(value):
+    """
+    Check custom holiday intervals of a state ([first_ord, last_ord, desc]).
+    """
+    return isinstance(value, list) and all(
+        isinstance(interval, list) and len(interval) == 3 and
+        type(interval[0]) is int and type(interval[1]) is int and
+        1 <= interval[0] <= interval[1] <= dt.max.toordinal() and
+        isinstance(interval[2], str)
+        for interval in value
+        )
+
+def is_wd_time_range_list(value):
+    """
+    Check the [weekday, time range or None] pairs of a state (a time range
+    is [[from_h, from_m], [to_h, to_m]]).
+    """
+    return isinstance(value, list) and all(
+        isinstance(pair, list) and len(pair) == 2 and
+        type(pair[0]) is int and 0 <= pair[0] < mh.WEEK_DAYS and (
+            pair[1] is None or
+            isinstance(pair[1], list) and len(pair[1]) == 2 and all(
+                isinstance(h_m, list) and len(h_m) == 2 and
+                all(type(x) is int for x in h_m)
+                for h_m in pair[1]
+                )
+            )
+        for pair in value
+        )
+
+def decode_calendar_state(token):
+    """
+    Decode a token of a state from `calendar_state` (part of a calendar URL)
+    and check the types of its values, so that crafted tokens fail as
+    invalid. Raise ValueError if the token is invalid.
+    """
+    state = decode_state_token(token)
+    if not (
+        isinstance(state, dict) and
+        all(
+            isinstance(state.get(key), str)
+            for key in ('start', 'end', 'name', 'summary')
+            ) and
+        (state.get('part') is None or isinstance(state['part'], str)) and
+        is_str_list(state.get('hol')) and is_str_list(state.get('spring')) and
+        (state.get('custom') is None or is_interval_list(state['custom'])) and
+        (
+            state.get('imported') is None or
+            isinstance(state['imported'], str) and
+            IMPORT_KEY_RE.match(state['imported'])
+            ) and
+        is_wd_time_range_list(state.get('wd')) and
+        type(state.get('compact')) is bool
+        ):
+        raise ValueError('Neplatný stav kalendáře.')
+    return state
+
+def ymd_str(date_str):
+    """
+    Normalize a date from a Dash component to a Y-M-D string (or None).
+    """
+    date = ymd_dt2dt(date_str)
+    return date and date.strftime('%Y-%m-%d')
+
+def holiday_state(
+    holidays, spring_holidays, custom_holidays, imported_holidays=None
+    ):
+    """
+    Return a JSON-serializable holiday selection (the input of
+    `mh.holiday_profile` with the key of imported intervals),
+    `custom_holidays` and `imported_holidays` are the data of the
+    confirmed_custom_holidays and imported_holidays stores (custom holidays
+    take precedence).
+    """
+    return {
+        'hol':      sorted(holidays or ()),
+        'spring':   list(spring_holidays or ()),
+        'custom':   (custom_holidays or {}).get('intervals') or None,
+        'imported': (imported_holidays or {}).get('key'),
+        }
+
+@lru_cache(maxsize=IMPORTED_INTERVALS_CACHE_SIZE)
+def imported_intervals(key):
+    """
+    Return the intervals of an imported calendar (see `import_holidays`) as
+    a tuple. Raise KeyError if they are not on the server (any more).
+    """
+    data = IMPORT_STORE.get(key)
+    if data is None:
+        raise KeyError(key)
+    return tuple(map(tuple, json.loads(data)))
+
+def course_state(start_date, end_date, part_date, holidays, wd2time_range):
+    """
+    Return a JSON-serializable course state with everything needed to compute
+    the course's dates (`holidays` is a state from `holiday_state`). An
+    imported calendar is only referred to by its key (the state is a part
+    of calendar URLs), see `course_state_compute_args`.
+    """
+    return {
+        'start':    ymd_str(start_date),
+        'end':      ymd_str(end_date),
+        'part':     ymd_str(part_date),
+        'hol':      holidays['hol'],
+        'spring':   holidays['spring'],
+        'custom':   holidays['custom'],
+        'imported': holidays.get('imported'),
+        'wd':       sorted(wd2time_range.items()),
+        }
+
+def calendar_state(course, cal_name, event_summary, compact=False):
+    """
+    Return a JSON-serializable state with everything needed to generate
+    a calendar (see `calendar_state_compute_args`) for a course state.
+    """
+    return {
+        **course,
+        'name':     cal_name,
+        'summary':  event_summary,
+        'compact':  bool(compact),
+        }
+
+def course_state_compute_args(state):
+    """
+    Return a tuple of `mh.compute` arguments (without calendar names) for
+    a state from `course_state` or `calendar_state`. Raise KeyError if its
+    imported calendar is not on the server (any more).
+    """
+    wd2time_range = {
+        wd: (tuple(map(tuple, time_range)) if time_range else None)
+        for wd, time_range in state['wd']
+        }
+    start_date  = mh.ymd2date(state['start'])
+    last_date   = mh.ymd2date(state['end'])
+    custom      = state['custom']
+    if state.get('imported'):
+        # only the imported intervals that overlap the course:
+        first_ord   = start_date.toordinal()
+        last_ord    = last_date.toordinal()
+        custom      = [
+            *(
+                interval
+                for interval in imported_intervals(state['imported'])
+                if interval[1] >= first_ord and interval[0] <= last_ord
+                ),
+            *(custom or ())
+            ]
+    exc_dates2desc = mh.holiday_profile(state['hol'], state['spring'], custom)
+    return (
+        start_date, last_date,
+        state['part'] and mh.ymd2date(state['part']),
+        exc_dates2desc,
+        wd2time_range.keys(), wd2time_range
+        )
+
+def calendar_state_compute_args(kind, state):
+    """
+    Return a tuple (args, kwargs) of `mh.compute` arguments for computing the
+    course (`kind` = 'course') or exception (`kind` = 'exc') calendar for
+    a state from `calendar_state`.
+    """
+    if kind == 'course':
+        kwargs = {
+            'cal_name': state['name'], 'event_summary': state['summary'],
+            'compact': state['compact']
+            }
+    else:
+        kwargs = {
+            'exc_cal_name': state['name'],
+            'exc_event_summary': state['summary']
+            }
+    return (course_state_compute_args(state), kwargs)
+
+def calendar_state_ics(kind, args, kwargs):
+    """
+    Compute a calendar for `mh.compute` arguments from
+    `calendar_state_compute_args` and return it as UTF-8 encoded bytes.
+    """
+    __, ical, exc_ical = mh.compute(*args, **kwargs)
+    return ''.join(ical if kind=='course' else exc_ical).encode()
+
+def download_link(kind, file_name, state):
+    """
+    Create a download link for a calendar that is generated on demand by
+    the `serve_ics` route and a subscription link for the `serve_feed`
+    route.
+    """
+    token = encode_state_token(state)
+    download_url = '%s/ics/%s/%s/%s'%(
+        APP_PATH, kind, token, urllib_parse.quote(file_name)
+        )
+    feed_url = 'webcal://%s%s/feed/%s/%s.ics'%(
+        flask.request.host, APP_PATH, kind, token
         )
-    return html.Strong([
-        'Ke stažení: ',
-        html.A('📅 '+file_name,
-            href=download_url,
-            download=urllib_parse.quote(file_name))
+    return html.Div([
+        html.Strong([
+            'Ke stažení: ',
+            html.A('📅 '+file_name,
+                href=download_url,
+                download=file_name)
+            ]),
+        html.Br(),
+        html.A('Odebírat (aktualizuje se při změnách volna)', href=feed_url)
         ])
 
-def urlenc_seq(list_or_something):
+@app.server.route(APP_PATH + '/ics/<kind>/<token>/<path:file_name>')
+def serve_ics(kind, token, file_name):
+    """
+    Generate and stream an iCalendar file for a state token.
+    """
+    if kind not in ICS_KINDS:
+        flask.abort(404)
+    try:
+        state = decode_calendar_state(token)
+        args, kwargs = calendar_state_compute_args(kind, state)
+        key = mh.compute_key(*args, **kwargs)
+    except (ValueError, KeyError, TypeError):
+        flask.abort(400)
+    response = flask.Response(
+        mimetype='text/calendar',
+        headers={
+            'Content-Disposition': "attachment; filename*=UTF-8''%s"%
+                urllib_parse.quote(file_name),
+            'Cache-Control': 'public, max-age=86400'
+            }
+        )
+    response.set_etag(key)
+    # weak: the compressed response has a weak ETag
+    if flask.request.if_none_match.contains_weak(key):
+        response.status_code = 304
+        return response
+    response.set_data(RESULT_CACHE.get_or_compute(
+        key+'.ics', lambda: calendar_state_ics(kind, args, kwargs)
+        ))
+    return response
+
+def feed_compute_args(kind, state):
     """
-    Transforms values to sequences (lists) that can be passed as values to
-    urllib_parse.urlencode(..., doseq=True) to create an URL encoding an
-    application state.
+    Return a tuple (args, kwargs) of `mh.compute` arguments for a calendar
+    feed: `calendar_state_compute_args` with `mh.HOLIDAY_DATA_REVISION` as
+    the SEQUENCE of all events (a global revision of the built-in holiday
+    data, the event UIDs are the same as in downloaded calendars).
     """
-    if isinstance(list_or_something, list):
-        return list_or_something    # a list or an empty list
-    if list_or_something is None or list_or_something == '':
-        return []                   # None or '' => an empty list
-    return [list_or_something]      # else: a single-value list
+    args, kwargs = calendar_state_compute_args(kind, state)
+    kwargs['sequence'] = mh.HOLIDAY_DATA_REVISION
+    return (args, kwargs)
+
+@lru_cache(maxsize=FEED_KEY_CACHE_SIZE)
+def feed_key(kind, token):
+    """
+    Return the `mh.compute_key` of a calendar feed (the key depends on the
+    holiday data and is cached per token, polling clients only cost a cache
+    lookup).
+    """
+    args, kwargs = feed_compute_args(kind, decode_calendar_state(token))
+    return mh.compute_key(*args, **kwargs)
+
+@app.server.route(APP_PATH + '/feed/<kind>/<token>.ics')
+def serve_feed(kind, token):
+    """
+    Serve a subscribable (webcal) iCalendar feed for a state token. Repeated
+    polls get 304 responses or the cached calendar. The ETag (the compute
+    key) changes with the holiday data revision and the output format,
+    a Last-Modified date would not, so there is none.
+    """
+    if kind not in ICS_KINDS:
+        flask.abort(404)
+    try:
+        key = feed_key(kind, token)
+    except (ValueError, KeyError, TypeError):
+        flask.abort(400)
+    response = flask.Response(
+        mimetype='text/calendar',
+        headers={'Cache-Control': 'public, max-age=%i'%FEED_MAX_AGE}
+        )
+    response.set_etag(key)
+    # weak ETag comparison (see `serve_ics`):
+    if flask.request.if_none_match.contains_weak(key):
+        response.status_code = 304
+        return response
+    def compute_feed():
+        return calendar_state_ics(
+            kind, *feed_compute_args(kind, decode_calendar_state(token))
+            )
+    response.set_data(RESULT_CACHE.get_or_compute(key+'.ics', compute_feed))
+    return response
+
+@app.server.route(APP_PATH + '/cache-stats')
+def serve_cache_stats():
+    """
+    Report result cache statistics (hits, misses, size) as JSON (only with
+    the `STATS_TOKEN`).
+    """
+    if not mh_metrics.bearer_token_matches(STATS_TOKEN):
+        flask.abort(404)
+    return flask.jsonify(RESULT_CACHE.stats())
+
+# JSON and NDJSON API (see `mh_api`):
+mh_api.register_api(app.server, APP_PATH + '/api/v1')
+
+# callback latency and payload histograms on /metrics (with STATS_TOKEN):
+METRICS = mh_metrics.instrument_dash(app, token=STATS_TOKEN)
+# compressed callback and other responses, precompressed immutable assets:
+mh_compress.compress_responses(app)
+mh_compress.precompress_assets(app)
 
 def url_with_updated_path_query(url, path, query):
     """
@@ -601,142 +1338,186 @@ def url_with_updated_path_query(url, path, query):
     # We ignore ;params and #fragment
     return f'{parsed.scheme}://{parsed.netloc}{path}?{query}'
 
+# The main outputs are computed in stages (holiday selection => course
+# state => text summary/calendar links), each stage is a callback that is
+# only triggered when its own inputs change. Intermediate states are kept in
+# dcc.Store components, the results in RESULT_CACHE.
+
 @app.callback(
     [Output('link', 'href'),
         Output('link_container', 'hidden'),
         # the 'hidden' property does not work with html.Button => use style:
-        Output('link_show', 'style'),
-        Output('output_container', 'children'),
-        Output('error_container', 'children'),
-        Output('calendar_output_container', 'children'),
-        Output('exc_calendar_output_container', 'children')
+        Output('link_show', 'style')
         ],
-    [Input('course_range', 'start_date'), Input('course_range', 'end_date'),
+    [Input('link_show', 'n_clicks_timestamp'),
+        Input('link_hide', 'n_clicks_timestamp'),
+        Input('course_range', 'start_date'), Input('course_range', 'end_date'),
         Input('part_date', 'date'),
         Input('holidays', 'value'), Input('spring_holidays', 'value'),
-        Input('confirmed_custom_holidays', 'children'),
+        Input('confirmed_custom_holidays', 'data'),
         Input('calendar_name', 'value'), Input('event_name', 'value'),
+        Input('calendar_options', 'value'),
         Input('exc_calendar_name', 'value'), Input('exc_event_name', 'value'),
-        Input('url','href'),
-        Input('link_show', 'n_clicks_timestamp'),
-        Input('link_hide', 'n_clicks_timestamp'),
         ]+[Input(id, 'value') for id in WD_CHECKLIST_IDS]+
         [Input(id, 'value') for id in WD_TIME_RANGE_IDS],
+    [State('url','href')]
      )
-
-def update_app(
+def update_link(
+    link_show_timestamp, link_hide_time_stamp,
     start_date, end_date, part_date,
     holidays, spring_holidays, custom_holidays,
-    calendar_name, event_name,
+    calendar_name, event_name, calendar_options,
     exc_calendar_name, exc_event_name,
-    current_url,
-    link_show_timestamp, link_hide_time_stamp,
     *args
     ):
     """
-    Update the app's main outputs (including a save/share link) based on all
-    the inputs.
+    Update the save/share link. The link is only updated while it is shown
+    or when it is shown or hidden.
     """
+    *args, current_url = args
     show_link = link_show_timestamp > link_hide_time_stamp
     # show_link is False if both == -1 (neither clicked)
+    triggered = dash.callback_context.triggered
+    link_toggled = any(
+        t['prop_id'] in ('link_show.n_clicks_timestamp',
+            'link_hide.n_clicks_timestamp')
+        for t in triggered
+        )
+    if not (show_link or link_toggled):
+        raise PreventUpdate
     if show_link:
-        app_state_kvs = (
-            ('start_date',              urlenc_seq(start_date)),
-            ('end_date',                urlenc_seq(end_date)),
-            ('part_date',               urlenc_seq(part_date)),
-            ('holidays',                urlenc_seq(holidays)),
-            ('spring_holidays',         urlenc_seq(spring_holidays)),
-            ('custom_holidays',         urlenc_seq(custom_holidays)),
-            ('calendar_name',           urlenc_seq(calendar_name)),
-            ('event_name',              urlenc_seq(event_name)),
-            ('exc_calendar_name',       urlenc_seq(exc_calendar_name)),
-            ('exc_event_name',          urlenc_seq(exc_event_name)),
-            *(
-                (id, urlenc_seq(arg)) for id, arg
-                in zip(chain(WD_CHECKLIST_IDS, WD_TIME_RANGE_IDS), args)
-                if arg is not None
-                # if clause leaves out all the empty WD_TIME_RANGE_IDS' args
-            )
+        token = encode_share_state(
+            start_date, end_date, part_date, holidays, spring_holidays,
+            custom_holidays and custom_holidays['intervals'],
+            calendar_name, event_name, calendar_options,
+            exc_calendar_name, exc_event_name,
+            args[:len(WD_CHECKLIST_IDS)], args[len(WD_CHECKLIST_IDS):]
             )
         app_state_url = url_with_updated_path_query(
             current_url,
             APP_PATH,
-            urllib_parse.urlencode(app_state_kvs, doseq=True)
+            urllib_parse.urlencode(((SHARE_PARAM, token),))
             )
     else:
         app_state_url = ''
-    link_container_button = (
+    return (
         app_state_url,
         not show_link,  # link container hidden <=> not show link
         SHOW_BUTTON_STYLE_HIDDEN if show_link else SHOW_BUTTON_STYLE_VISIBLE
         # show button hidden <=> show_link
         )
 
-    wd2time_range       = wd_cl_tr_values2dict(args)
+@app.callback(
+    Output('holiday_state', 'data'),
+    [Input('holidays', 'value'), Input('spring_holidays', 'value'),
+        Input('confirmed_custom_holidays', 'data'),
+        Input('imported_holidays', 'data')]
+    )
+def update_holiday_state(
+    holidays, spring_holidays, custom_holidays, imported_holidays
+    ):
+    """
+    Stage 1: the holiday selection.
+    """
+    return holiday_state(
+        holidays, spring_holidays, custom_holidays, imported_holidays
+        )
+
+@app.callback(
+    Output('course_state', 'data'),
+    [Input('course_range', 'start_date'), Input('course_range', 'end_date'),
+        Input('part_date', 'date'),
+        Input('holiday_state', 'data'),
+        ]+[Input(id, 'value') for id in WD_CHECKLIST_IDS]+
+        [Input(id, 'value') for id in WD_TIME_RANGE_IDS]
+    )
+def update_course_state(start_date, end_date, part_date, holidays, *args):
+    """
+    Stage 2: the course state (dates, week days, holidays) or an error.
+    """
     if not (start_date and end_date):
-        return (*link_container_button, None,)+(
-            html.Span('Není zadáno trvání kurzu.', className='error'),)*3
-    start_date = ymd_dt2dt(start_date)
-    end_date = ymd_dt2dt(end_date)
-    part_date = ymd_dt2dt(part_date)
+        return {'error': 'Není zadáno trvání kurzu.'}
+    wd2time_range = wd_cl_tr_values2dict(args)
     if not wd2time_range:
-        return (*link_container_button, None, *(
-            html.Span('Nejsou vybrány žádné dny v týdnu.', className='error'),
-            )*3)
-    if holidays:
-        exc_dates       = mh.EXC_DATES_STATE if ('state' in holidays) else ''
-        if 'school' in holidays:
-            exc_dates   += mh.EXC_DATES_SCHOOL
-        exc_dates2desc  = mh.except_dates2desc(exc_dates)
-    else:
-        exc_dates2desc  = {}
-    if spring_holidays:
-        for ranges_str in spring_holidays:
-            range_str_1, __, range_str_2 = ranges_str.partition('+')
-            assert range_str_1 and range_str_2, ranges_str
-            for range_str in (range_str_1, range_str_2):
-                dates   = mh.dm_dmy_range2dates(range_str)
-                desc    = 'jarní prázdniny %s'%range_str
-                for date in dates:
-                    exc_dates2desc[date] = desc
-    if custom_holidays:
-        for date_range, desc in mh.parse_date_desc(custom_holidays):
-            dates = mh.date_range2dates(date_range)
-            for date in dates:
-                exc_dates2desc[date] = desc
-
-    # Require both calendar and event name to generate a calendar, else ignore:
-    if not (calendar_name and event_name):
-        calendar_name = None
-        event_name = None
-    if not (exc_calendar_name and exc_event_name):
-        exc_calendar_name = None
-        exc_event_name = None
-
-    txt, ical, exc_ical = mh.compute(
-        start_date, end_date, part_date,
-        exc_dates2desc,
-        wd2time_range.keys(), wd2time_range,
-        cal_name=calendar_name, event_summary=event_name,
-        exc_cal_name=exc_calendar_name, exc_event_summary=exc_event_name,
+        return {'error': 'Nejsou vybrány žádné dny v týdnu.'}
+    if not holidays:
+        holidays = holiday_state(None, None, None)
+    if holidays.get('imported'):
+        try:
+            imported_intervals(holidays['imported'])
+        except KeyError:
+            return {'error': IMPORT_MISSING_ERROR}
+    return course_state(
+        start_date, end_date, part_date, holidays, wd2time_range
         )
 
-    return (
-        *link_container_button,
-        dcc.Markdown(''.join(txt)),
-        None,
-        download_link(calendar_name+'.ics', ical)
-            if calendar_name
-            else html.Span(
-                'Pro vytvoření kalendáře zadejte názvy kalendáře i události.',
-                className='error'),
-        download_link(exc_calendar_name+'.ics', exc_ical)
-            if exc_calendar_name
-            else html.Span(
-                'Pro vytvoření kalendáře zadejte názvy kalendáře i události.',
-                className='error')
+@app.callback(
+    [Output('output_container', 'children'),
+        Output('error_container', 'children')],
+    [Input('course_state', 'data')]
+    )
+def update_output(course):
+    """
+    Stage 3: the text summary of the course.
+    """
+    if not course:
+        raise PreventUpdate
+    if 'error' in course:
+        return (None, html.Span(course['error'], className='error'))
+    try:
+        compute_args = course_state_compute_args(course)
+    except KeyError:
+        return (None, html.Span(IMPORT_MISSING_ERROR, className='error'))
+    txt = RESULT_CACHE.get_or_compute(
+        mh.compute_key(*compute_args)+'.md',
+        lambda: ''.join(mh.compute(*compute_args)[0])
+        )
+    return (dcc.Markdown(txt), None)
+
+def calendar_output(kind, course, calendar_name, event_name, compact=False):
+    """
+    Return a download link for a calendar or an error.
+    """
+    if 'error' in course:
+        return html.Span(course['error'], className='error')
+    # Require both calendar and event name to generate a calendar:
+    if not (calendar_name and event_name):
+        return html.Span(
+            'Pro vytvoření kalendáře zadejte názvy kalendáře i události.',
+            className='error')
+    return download_link(kind, calendar_name+'.ics', calendar_state(
+        course, calendar_name, event_name, compact
+        ))
+
+@app.callback(
+    Output('calendar_output_container', 'children'),
+    [Input('course_state', 'data'),
+        Input('calendar_name', 'value'), Input('event_name', 'value'),
+        Input('calendar_options', 'value')]
+    )
+def update_calendar_output(course, calendar_name, event_name, calendar_options):
+    """
+    Stage 4: the course calendar.
+    """
+    if not course:
+        raise PreventUpdate
+    return calendar_output(
+        'course', course, calendar_name, event_name,
+        bool(calendar_options and 'compact' in calendar_options)
         )
 
+@app.callback(
+    Output('exc_calendar_output_container', 'children'),
+    [Input('course_state', 'data'),
+        Input('exc_calendar_name', 'value'), Input('exc_event_name', 'value')]
+    )
+def update_exc_calendar_output(course, exc_calendar_name, exc_event_name):
+    """
+    Stage 5: the exception calendar.
+    """
+    if not course:
+        raise PreventUpdate
+    return calendar_output('exc', course, exc_calendar_name, exc_event_name)
 
 if __name__ == '__main__':
     # host='0.0.0.0' => make available on LAN for testing
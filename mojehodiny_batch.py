@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+"""
+Vectorized batch computation of lesson dates and counts for many courses at
+once using NumPy (`datetime64[D]` arithmetic and boolean masks).
+
+The core module `mojehodiny` does not need NumPy, only this module does.
+"""
+
+from array import array
+from collections import namedtuple
+from datetime import datetime as dt
+
+import numpy as np
+
+import mojehodiny as mh
+
+EPOCH_ORD   = dt(1970, 1, 1).toordinal()  # datetime64[D] zero as an ordinal
+EPOCH_WD    = 3                             # 1970-01-01 was a Thursday
+
+BatchResult = namedtuple('BatchResult', (
+    'n',                # lessons per course
+    'n1',               # lessons per course before its part date
+    'lesson_offsets',   # lessons of course i: [offsets[i], offsets[i+1])
+    'lesson_date',      # datetime64[D]
+    'lesson_part',      # 1 or 2
+    'exc_offsets',      # exceptions of course i: [offsets[i], offsets[i+1])
+    'exc_date',         # datetime64[D]
+    'exc_desc',         # object array of descriptions
+    ))
+
+
+def weekdays2mask(wds):
+    """
+    Convert week days (0 = Monday) to a bit mask (bit 0 = Monday).
+    """
+    mask = 0
+    for wd in wds:
+        mask |= 1 << wd
+    return mask
+
+def _profile_exc_index(exc_dates, lo, n_days):
+    """
+    Return an array of interval indices (-1 = not an exception) for the days
+    lo…lo+n_days-1 (days since the epoch) and a matching array of
+    descriptions.
+    """
+    exc_index   = np.full(n_days, -1, dtype=np.int32)
+    descs       = []
+    for i, (first_ord, last_ord, desc) in enumerate(exc_dates.intervals()):
+        first   = max(first_ord-EPOCH_ORD-lo, 0)
+        last    = min(last_ord-EPOCH_ORD-lo, n_days-1)
+        if first <= last:
+            exc_index[first:last+1] = i
+        descs.append(desc)
+    return exc_index, np.array(descs+[None], dtype=object)
+
+def _gather_ranges(starts, counts):
+    """
+    Return concatenated ranges [starts[i], starts[i]+counts[i]) as one array
+    together with the offsets of the individual ranges.
+    """
+    offsets = np.zeros(len(counts)+1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    total   = int(offsets[-1])
+    index   = (np.repeat(starts-offsets[:-1], counts) +
+        np.arange(total, dtype=np.int64))
+    return index, offsets
+
+def compute_batch(
+    start_dates, last_dates, part_dates, weekday_masks, profile_indices,
+    profiles
+    ):
+    """
+    Compute lesson dates, exception dates and lesson counts for many courses
+    at once.
+
+    Courses are given as arrays (or sequences) of the same length: first and
+    last dates (anything convertible to `datetime64[D]`), part dates (NaT or
+    None for none), week day bit masks (see `weekdays2mask`) and indices
+    into `profiles`, a sequence of `mojehodiny.ExcDates` objects (holiday
+    profiles). Return a `BatchResult` with columnar arrays, the lessons and
+    exceptions of each course are ordered by date.
+    """
+    start   = np.asarray(start_dates, dtype='datetime64[D]').astype(np.int64)
+    last    = np.asarray(last_dates, dtype='datetime64[D]').astype(np.int64)
+    part_d  = np.asarray(part_dates, dtype='datetime64[D]')
+    masks   = np.asarray(weekday_masks, dtype=np.int64)
+    prof    = np.asarray(profile_indices, dtype=np.int64)
+    n_courses = len(start)
+    has_part = ~np.isnat(part_d)
+    # no part date => the whole course is the first part:
+    part    = np.where(has_part, part_d.astype(np.int64), last+1)
+    part    = np.minimum(part, last+1)
+
+    lo      = int(start.min()) if n_courses else 0
+    hi      = int(last.max()) if n_courses else -1
+    n_days  = max(hi-lo+1, 0)
+    days_wd = (np.arange(lo, lo+n_days) + EPOCH_WD) % mh.WEEK_DAYS
+    wd_bits = np.left_shift(1, days_wd)
+
+    lesson_start    = np.zeros(n_courses, dtype=np.int64)
+    n               = np.zeros(n_courses, dtype=np.int64)
+    n1              = np.zeros(n_courses, dtype=np.int64)
+    exc_start       = np.zeros(n_courses, dtype=np.int64)
+    exc_n           = np.zeros(n_courses, dtype=np.int64)
+    lesson_pos_parts    = []
+    exc_pos_parts       = []
+    exc_desc_parts      = []
+    lesson_base = 0
+    exc_base    = 0
+    profile_exc = {}
+
+    groups, group_of = np.unique(prof*128 + masks, return_inverse=True)
+    for g, key in enumerate(groups):
+        p, mask = divmod(int(key), 128)
+        if p not in profile_exc:
+            profile_exc[p] = _profile_exc_index(profiles[p], lo, n_days)
+        exc_index, descs = profile_exc[p]
+        on_wd       = (wd_bits & mask) != 0
+        is_exc      = exc_index >= 0
+        lesson_pos  = np.flatnonzero(on_wd & ~is_exc)
+        exc_pos     = np.flatnonzero(on_wd & is_exc)
+
+        courses     = np.flatnonzero(group_of == g)
+        c_start     = start[courses]-lo
+        c_last      = last[courses]-lo
+        first       = np.searchsorted(lesson_pos, c_start)
+        stop        = np.searchsorted(lesson_pos, c_last, side='right')
+        part_stop   = np.searchsorted(lesson_pos, part[courses]-lo)
+        lesson_start[courses]   = lesson_base+first
+        n[courses]              = stop-first
+        n1[courses]             = np.clip(part_stop-first, 0, stop-first)
+        exc_first   = np.searchsorted(exc_pos, c_start)
+        exc_stop    = np.searchsorted(exc_pos, c_last, side='right')
+        exc_start[courses]  = exc_base+exc_first
+        exc_n[courses]      = exc_stop-exc_first
+
+        lesson_pos_parts.append(lesson_pos)
+        exc_pos_parts.append(exc_pos)
+        exc_desc_parts.append(descs[exc_index[exc_pos]])
+        lesson_base += len(lesson_pos)
+        exc_base    += len(exc_pos)
+
+    def concat(parts, dtype):
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+
+    all_lesson_pos  = concat(lesson_pos_parts, np.int64)
+    all_exc_pos     = concat(exc_pos_parts, np.int64)
+    all_exc_desc    = concat(exc_desc_parts, object)
+
+    lesson_index, lesson_offsets = _gather_ranges(lesson_start, n)
+    exc_gather, exc_offsets = _gather_ranges(exc_start, exc_n)
+    lesson_days = all_lesson_pos[lesson_index]+lo
+    exc_days    = all_exc_pos[exc_gather]+lo
+    lesson_part = np.where(
+        lesson_days < np.repeat(part, n), 1, 2).astype(np.int8)
+    return BatchResult(
+        n               = n,
+        n1              = n1,
+        lesson_offsets  = lesson_offsets,
+        lesson_date     = lesson_days.astype('datetime64[D]'),
+        lesson_part     = lesson_part,
+        exc_offsets     = exc_offsets,
+        exc_date        = exc_days.astype('datetime64[D]'),
+        exc_desc        = all_exc_desc[exc_gather],
+        )
+
+def course_dates(result, i):
+    """
+    Return the dates of course `i` from a `BatchResult` in the same form as
+    `mojehodiny.dates_except` (day ordinals): a tuple (dates, exc_desc, n, n1).
+    """
+    l_first, l_stop = result.lesson_offsets[i:i+2]
+    e_first, e_stop = result.exc_offsets[i:i+2]
+    dates       = array('i', (
+        result.lesson_date[l_first:l_stop].astype(np.int64)+EPOCH_ORD
+        ).tolist())
+    exc_ords    = (
+        result.exc_date[e_first:e_stop].astype(np.int64)+EPOCH_ORD
+        ).tolist()
+    exc_desc    = list(zip(exc_ords, result.exc_desc[e_first:e_stop]))
+    return (dates, exc_desc, int(result.n[i]), int(result.n1[i]))
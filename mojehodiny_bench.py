@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+
+"""
+Reproducible benchmarks of the core computation, parsing, output rendering
+and the web app callbacks.
+
+Inputs are generated with a fixed seed: courses from one week to ten years,
+0 to 1000 custom holiday lines and all week day subsets. Results are written
+to a JSON file, two result files (e.g. from two commits) can be compared:
+
+    $ python mojehodiny_bench.py -o new.json --compare old.json
+
+The web app callbacks are only benchmarked if Dash is installed.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+from statistics import median
+from datetime import timedelta, datetime as dt
+
+import mojehodiny as mh
+
+SEED = 20201001
+COURSE_START = dt(2020, 9, 1)
+COURSE_DAYS = (7, 30, 365, 3652)         # one week to ten years
+CUSTOM_HOLIDAY_LINES = (0, 10, 100, 1000)
+WEEKDAY_SUBSETS = tuple(
+    tuple(wd for wd in range(mh.WEEK_DAYS) if subset & (1 << wd))
+    for subset in range(1, 1 << mh.WEEK_DAYS)
+    )
+APP_WEEKDAYS = 5                        # the app has Monday to Friday only
+MIN_TIME = 0.2                          # seconds per repeat (roughly)
+REPEAT = 5
+DASH_UPDATE_PATH = '/_dash-update-component'
+
+
+def course_last_date(days):
+    return COURSE_START + timedelta(days-1)
+
+def random_custom_holidays(rng, n_lines, days):
+    """
+    Return a custom holiday text (for `mh.parse_date_desc`) of `n_lines`
+    random dates and date ranges within a course of `days` days in all the
+    supported formats.
+    """
+    lines = []
+    for i in range(n_lines):
+        first = COURSE_START + timedelta(rng.randrange(days))
+        last = first + timedelta(rng.randrange(7))
+        kind = rng.randrange(4)
+        if kind == 0:
+            date_part = '%i. %i. %i'%(first.day, first.month, first.year)
+        elif kind == 1:
+            date_part = first.strftime('%Y-%m-%d')
+        elif kind == 2:
+            date_part = '%i. %i. %i–%i. %i. %i'%(
+                first.day, first.month, first.year,
+                last.day, last.month, last.year)
+        else:
+            date_part = '%s~%s'%(
+                first.strftime('%Y-%m-%d'), last.strftime('%Y-%m-%d'))
+        lines.append('%s%svolno %i'%(date_part, rng.choice(';\t'), i))
+    return '\n'.join(lines)
+
+def random_exc_dates_table(rng, n_lines, days):
+    """
+    Return an exception date table (for `mh.except_dates2desc`) of the
+    built-in tables and `n_lines` random lines.
+    """
+    lines = []
+    for i in range(n_lines):
+        first = COURSE_START + timedelta(rng.randrange(days))
+        last = first + timedelta(rng.randrange(7))
+        lines.append('%s~%s\tvolno %i\n'%(
+            first.strftime('%Y-%m-%d'), last.strftime('%Y-%m-%d'), i))
+    return mh.EXC_DATES_STATE + mh.EXC_DATES_SCHOOL + ''.join(lines)
+
+def time_f(f, min_time=MIN_TIME, repeat=REPEAT):
+    """
+    Time calls of `f` (without arguments). Return a dict with the number of
+    calls per repeat and the minimal and median time per call in seconds.
+    """
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for __ in range(number):
+            f()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time/10 or number >= 1<<20:
+            break
+        number *= 2
+    number = max(1, int(number*min_time/max(elapsed, 1e-9)))
+    times = []
+    for __ in range(repeat):
+        t0 = time.perf_counter()
+        for __ in range(number):
+            f()
+        times.append((time.perf_counter() - t0)/number)
+    return {'calls': number, 'min_s': min(times), 'median_s': median(times)}
+
+def core_cases(rng):
+    """
+    Generate (name, params, f) benchmark cases of the core module.
+    """
+    for days in COURSE_DAYS:
+        last = course_last_date(days)
+        yield ('weekdays_between_dates',
+            {'days': days, 'weekday_subsets': len(WEEKDAY_SUBSETS)},
+            lambda last=last: [
+                mh.weekdays_between_dates(wds, COURSE_START, last)
+                for wds in WEEKDAY_SUBSETS
+                ])
+    for n_lines in CUSTOM_HOLIDAY_LINES:
+        text = random_custom_holidays(rng, n_lines, COURSE_DAYS[-1])
+        yield ('parse_date_desc', {'lines': n_lines},
+            lambda text=text: list(mh.parse_date_desc(text)))
+        table = random_exc_dates_table(rng, n_lines, COURSE_DAYS[-1])
+        yield ('except_dates2desc', {'lines': n_lines},
+            lambda table=table: mh.except_dates2desc(table))
+
+    for days in COURSE_DAYS:
+        last = course_last_date(days)
+        part = COURSE_START + timedelta(days//2)
+        for n_lines in CUSTOM_HOLIDAY_LINES:
+            exc_dates = mh.holiday_profile(
+                ('state', 'school'), (),
+                random_custom_holidays(rng, n_lines, days)
+                )
+            all_dates = [
+                mh.weekdays_between_dates(wds, COURSE_START, last)
+                for wds in WEEKDAY_SUBSETS
+                ]
+            yield ('dates_except',
+                {'days': days, 'lines': n_lines,
+                    'weekday_subsets': len(WEEKDAY_SUBSETS)},
+                lambda all_dates=all_dates, exc_dates=exc_dates: [
+                    mh.dates_except(dates, exc_dates) for dates in all_dates
+                    ])
+
+        weekdays = (0, 2, 4)
+        wd2time_range = {0: ((8, 0), (9, 30)), 2: None, 4: ((16, 0), (17, 0))}
+        exc_dates = mh.holiday_profile(('state', 'school'))
+        dates, exc_desc = mh.dates_except(
+            mh.weekdays_between_dates(weekdays, COURSE_START, last), exc_dates
+            )
+        n, n1 = mh.count_lessons_parts(
+            weekdays, COURSE_START, last, part, exc_dates
+            )
+        yield ('iter_txt_output', {'days': days},
+            lambda dates=dates, exc_desc=exc_desc, part=part, n=n, n1=n1:
+                ''.join(mh.iter_txt_output(dates, exc_desc, part, n, n1)))
+        yield ('iter_icalendar', {'days': days},
+            lambda dates=dates, n=n, n1=n1: ''.join(mh.iter_icalendar(
+                zip(dates, mh.iter_date_numbering_nmp(n, n1)),
+                wd2time_range, 'Kurz', 'Kurz $n/$m ($p)',
+                mh.date_nmp_fmt_map
+                )))
+
+def dash_update(client, app, output, values):
+    """
+    Run the Dash callback for `output` (a key of `app.callback_map`) with
+    input and state values from the dict `values` ('id.property' => value)
+    through the Flask test `client`. Return the JSON response.
+    """
+    callback = app.callback_map[output]
+    def props(deps, with_values):
+        return [
+            {'id': dep['id'], 'property': dep['property'],
+                **({'value': values.get('%s.%s'%(dep['id'], dep['property']))}
+                    if with_values else {})}
+            for dep in deps
+            ]
+    outputs = [
+        dict(zip(('id', 'property'), key.rsplit('.', 1)))
+        for key in output.strip('.').split('...')
+        ]
+    inputs = props(callback['inputs'], True)
+    response = client.post(DASH_UPDATE_PATH, json={
+        'output':           output,
+        'outputs':          outputs if output.startswith('..') else outputs[0],
+        'inputs':           inputs,
+        'changedPropIds':   ['%s.%s'%(i['id'], i['property']) for i in inputs],
+        'state':            props(callback.get('state', ()), True),
+        })
+    if response.status_code != 200:
+        raise RuntimeError('%s: HTTP %i'%(output, response.status_code))
+    return response.get_json()['response']
+
+def app_cases(rng):
+    """
+    Generate (name, params, f) benchmark cases of the web app callbacks
+    (the former `update_app`, now a chain of staged callbacks) run through
+    the Flask test client. Nothing is generated if Dash is not installed.
+
+    The `update_app` cases repeat the same update, so they measure the warm
+    caches. The `update_app_cold` cases clear the result and holiday profile
+    caches before each update, i.e. a state that has not been seen yet. The
+    app gets its own in-memory result cache (a shared `MOJEHODINY_CACHE_DB`
+    is never cleared, imported calendars are stored elsewhere).
+    """
+    try:
+        import mojehodiny_app as mh_app
+    except ImportError as error:
+        print('Skipping the web app benchmarks: %s'%error, file=sys.stderr)
+        return
+    mh_app.RESULT_CACHE = mh.ResultCache(mh_app.RESULT_CACHE_SIZE)
+    app = mh_app.app
+    client = app.server.test_client()
+    wd_values = {
+        '%s.value'%checklist_id: ([wd] if wd%2 == 0 else [])
+        for wd, checklist_id in enumerate(mh_app.WD_CHECKLIST_IDS)
+        }
+
+    def update_app(values):
+        confirmed = dash_update(client, app,
+            '..custom_holidays_error.children...'
+            'confirmed_custom_holidays.data..', values)
+        values['confirmed_custom_holidays.data'] = (
+            confirmed['confirmed_custom_holidays']['data'])
+        values['holiday_state.data'] = dash_update(client, app,
+            'holiday_state.data', values)['holiday_state']['data']
+        values['course_state.data'] = dash_update(client, app,
+            'course_state.data', values)['course_state']['data']
+        dash_update(client, app,
+            '..output_container.children...error_container.children..',
+            values)
+        dash_update(client, app, 'calendar_output_container.children', values)
+        dash_update(client, app, 'exc_calendar_output_container.children',
+            values)
+
+    def update_app_cold(values):
+        mh_app.RESULT_CACHE.clear()
+        mh._holiday_profile.cache_clear()
+        update_app(values)
+
+    for days in COURSE_DAYS:
+        for n_lines in CUSTOM_HOLIDAY_LINES:
+            values = {
+                'course_range.start_date':  COURSE_START.strftime('%Y-%m-%d'),
+                'course_range.end_date':
+                    course_last_date(days).strftime('%Y-%m-%d'),
+                'part_date.date':           None,
+                'holidays.value':           ['state', 'school'],
+                'spring_holidays.value':    [],
+                'custom_holidays.value':
+                    random_custom_holidays(rng, n_lines, days),
+                'custom_holidays_submit.n_clicks':  1 if n_lines else 0,
+                'calendar_name.value':      'Kurz',
+                'event_name.value':         'Kurz $n',
+                'calendar_options.value':   [],
+                'exc_calendar_name.value':  'Volno',
+                'exc_event_name.value':     'Volno $s',
+                **wd_values,
+                }
+            yield ('update_app', {'days': days, 'lines': n_lines},
+                lambda values=values: update_app(dict(values)))
+            yield ('update_app_cold', {'days': days, 'lines': n_lines},
+                lambda values=values: update_app_cold(dict(values)))
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            check=True, universal_newlines=True
+            ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(min_time=MIN_TIME, repeat=REPEAT, app=True, name_filter=None):
+    """
+    Run the benchmarks and return the results as a JSON-serializable dict.
+    """
+    rng = random.Random(SEED)
+    results = []
+    cases = core_cases(rng)
+    if app:
+        cases = (*cases, *app_cases(rng))
+    for name, params, f in cases:
+        if name_filter and name_filter not in name:
+            continue
+        result = {
+            'name': name, 'params': params, **time_f(f, min_time, repeat)
+            }
+        print('%-24s %-40s %10.3f ms'%(
+            name, json.dumps(params), result['min_s']*1e3), file=sys.stderr)
+        results.append(result)
+    return {
+        'meta': {
+            'seed':         SEED,
+            'git':          git_revision(),
+            'time':         dt.now().isoformat(timespec='seconds'),
+            'python':       platform.python_version(),
+            'platform':     platform.platform(),
+            'min_time':     min_time,
+            'repeat':       repeat,
+            },
+        'results': results,
+        }
+
+def compare(old, new):
+    """
+    Return lines comparing the minimal times of two result dicts.
+    """
+    def key(result):
+        return (result['name'], json.dumps(result['params'], sort_keys=True))
+    old_times = {key(result): result['min_s'] for result in old['results']}
+    lines = []
+    for result in new['results']:
+        old_time = old_times.get(key(result))
+        if old_time:
+            lines.append('%-24s %-40s %8.2fx'%(
+                *key(result), old_time/result['min_s']))
+    return lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-o', '--output', default='mojehodiny_bench.json',
+        help='result JSON file (default: %(default)s)')
+    parser.add_argument('--compare', metavar='OLD_JSON',
+        help='print speedups relative to an older result file')
+    parser.add_argument('--min-time', type=float, default=MIN_TIME,
+        help='seconds per repeat (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=REPEAT,
+        help='repeats per benchmark (default: %(default)s)')
+    parser.add_argument('--no-app', action='store_true',
+        help='skip the web app callbacks')
+    parser.add_argument('-k', metavar='NAME',
+        help='run only benchmarks with NAME in their name')
+    args = parser.parse_args(argv)
+
+    results = run(args.min_time, args.repeat, not args.no_app, args.k)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            print('\n'.join(compare(json.load(f), results)))
+
+if __name__ == '__main__':
+    main()
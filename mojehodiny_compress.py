@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+"""
+Response compression and static asset caching for a Dash app.
+
+`compress_responses(app)` compresses large enough responses (callbacks, ICS
+files, ...) with gzip or brotli (if the `brotli` package is installed),
+`precompress_assets(app)` compresses the files in the assets folder once at
+startup and serves them with long-lived immutable cache headers when they
+are requested with a fingerprint (Dash adds `?m=<mtime>` to CSS and JS
+assets, add `?v=<file_fingerprint(path)>` to other asset URLs).
+"""
+
+import os
+import gzip
+import hashlib
+import mimetypes
+import threading
+
+import flask
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = 1024
+# dynamic responses (fast) and static assets (compressed once, best):
+GZIP_LEVEL = 6
+BROTLI_LEVEL = 5
+ASSET_GZIP_LEVEL = 9
+ASSET_BROTLI_LEVEL = 11
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/calendar', 'text/markdown',
+    'text/javascript', 'application/javascript', 'application/json',
+    'application/x-ndjson', 'image/svg+xml',
+    }
+ASSET_MAX_AGE = 365*24*3600
+FINGERPRINT_ARGS = ('m', 'v')   # query arguments of fingerprinted URLs
+# responses with paths starting with these are immutable, their compressed
+# bodies are kept in memory:
+IMMUTABLE_PATH_PREFIXES = ('/_dash-component-suites/',)
+
+
+def encodings():
+    """
+    Return the supported content encodings in the order of preference.
+    """
+    return ('br', 'gzip') if brotli else ('gzip',)
+
+def compress(data, encoding, static=False):
+    """
+    Compress bytes `data` with a content `encoding` ('gzip' or 'br'). Use the
+    best (slow) compression for `static` data.
+    """
+    if encoding == 'br':
+        return brotli.compress(
+            data, quality=(ASSET_BROTLI_LEVEL if static else BROTLI_LEVEL)
+            )
+    # mtime=0: the same data always compress to the same bytes
+    return gzip.compress(
+        data, (ASSET_GZIP_LEVEL if static else GZIP_LEVEL), mtime=0
+        )
+
+def accepted_encoding(request, available=None):
+    """
+    Return the preferred content encoding accepted by the client (and in
+    `available` if given) or None.
+    """
+    for encoding in encodings():
+        if ((available is None or encoding in available) and
+            request.accept_encodings[encoding]):
+            return encoding
+    return None
+
+def file_fingerprint(path):
+    """
+    Return a short hash of a file's contents.
+    """
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+def compress_responses(app, min_size=COMPRESS_MIN_SIZE):
+    """
+    Compress responses of a Dash `app` of at least `min_size` bytes with
+    a compressible MIME type if the client accepts it.
+
+    Compressed responses get a weak ETag (the representation differs, the
+    content is the same), compare it with `if_none_match.contains_weak`.
+    """
+    immutable_cache = {}    # (path, encoding) => compressed body
+    immutable_lock = threading.Lock()
+
+    @app.server.after_request
+    def compress_response(response):
+        if (response.status_code != 200 or response.direct_passthrough or
+            response.is_streamed or
+            'Content-Encoding' in response.headers or
+            response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        request = flask.request
+        encoding = accepted_encoding(request)
+        if (encoding is None or
+            (response.content_length or 0) < min_size):
+            return response
+        if request.path.startswith(IMMUTABLE_PATH_PREFIXES):
+            key = (request.path, encoding)
+            with immutable_lock:
+                data = immutable_cache.get(key)
+            if data is None:
+                data = compress(response.get_data(), encoding, static=True)
+                with immutable_lock:
+                    immutable_cache[key] = data
+        else:
+            data = compress(response.get_data(), encoding)
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        etag, __ = response.get_etag()
+        if etag:
+            response.set_etag(etag, weak=True)
+        return response
+
+def precompress_assets(
+    app, min_size=COMPRESS_MIN_SIZE, max_age=ASSET_MAX_AGE
+    ):
+    """
+    Read and compress the assets of a Dash `app` once and serve them from
+    memory. Requests with a fingerprint (see `FINGERPRINT_ARGS`) are cached
+    for `max_age` seconds as immutable, others have to be revalidated.
+    """
+    folder = app.config.assets_folder
+    url_prefix = app.get_asset_url('')
+    assets = {}     # URL path => (mimetype, {encoding or None: (data, etag)})
+    for dir_path, __, file_names in os.walk(folder):
+        for file_name in file_names:
+            path = os.path.join(dir_path, file_name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            mimetype = mimetypes.guess_type(file_name)[0]
+            digest = hashlib.sha1(data).hexdigest()[:16]
+            variants = {None: (data, digest)}
+            if mimetype in COMPRESSIBLE_MIMETYPES and len(data) >= min_size:
+                for encoding in encodings():
+                    compressed = compress(data, encoding, static=True)
+                    if len(compressed) < len(data):
+                        variants[encoding] = (
+                            compressed, '%s-%s'%(digest, encoding)
+                            )
+            url_path = url_prefix + '/'.join(
+                os.path.relpath(path, folder).split(os.sep)
+                )
+            assets[url_path] = (mimetype or 'application/octet-stream',
+                variants)
+
+    @app.server.before_request
+    def serve_precompressed_asset():
+        request = flask.request
+        asset = assets.get(request.path)
+        if asset is None:
+            return None
+        mimetype, variants = asset
+        encoding = accepted_encoding(request, variants)
+        data, etag = variants[encoding]
+        response = flask.Response(data, mimetype=mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if len(variants) > 1:
+            response.vary.add('Accept-Encoding')
+        response.set_etag(etag)
+        if any(arg in request.args for arg in FINGERPRINT_ARGS):
+            response.headers['Cache-Control'] = (
+                'public, max-age=%i, immutable'%max_age
+                )
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+"""
+Latency and payload metrics of Dash callbacks in the Prometheus text format.
+
+`instrument_dash(app)` records, for a sample of callback requests, wall time,
+CPU time (of the request's thread), request body size and response size as
+histograms labelled by the callback function name. Only server-side
+callbacks are measured: clientside callbacks (e.g. the web app's per-weekday
+validators, see `CLIENTSIDE_CALLBACKS`) run in the browser and never reach
+the server. The metrics are only served to requests with a configured
+bearer token. Only the standard library (and Flask, which comes with Dash)
+is needed.
+"""
+
+import hmac
+import time
+import random
+import threading
+from bisect import bisect_left
+
+import flask
+
+SAMPLE_RATE = 0.1
+SECONDS_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+    )
+BYTES_BUCKETS = (256, 1<<10, 4<<10, 16<<10, 64<<10, 256<<10, 1<<20, 4<<20)
+# name, help, buckets:
+CALLBACK_METRICS = (
+    ('mojehodiny_callback_seconds',
+        'Wall time of Dash callback requests.', SECONDS_BUCKETS),
+    ('mojehodiny_callback_cpu_seconds',
+        'CPU time of Dash callback requests.', SECONDS_BUCKETS),
+    ('mojehodiny_callback_request_bytes',
+        'Body size of Dash callback requests.', BYTES_BUCKETS),
+    ('mojehodiny_callback_response_bytes',
+        'Body size of Dash callback responses.', BYTES_BUCKETS),
+    )
+
+
+class Histogram:
+    """
+    A cumulative histogram with fixed bucket upper bounds, a sum and a count.
+    Not thread-safe, see `CallbackMetrics`.
+    """
+
+    def __init__(self, buckets):
+        self.buckets    = tuple(buckets)
+        self.counts     = [0]*(len(self.buckets)+1)  # the last one is +Inf
+        self.sum        = 0
+        self.count      = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum        += value
+        self.count      += 1
+
+    def iter_prometheus(self, name, labels):
+        """
+        Generate Prometheus text format lines (without the HELP and TYPE
+        comments) for a metric `name` with a label string `labels`
+        (e.g. 'callback="f"').
+        """
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            yield '%s_bucket{%s,le="%s"} %i\n'%(
+                name, labels, bound, cumulative)
+        yield '%s_sum{%s} %r\n'%(name, labels, self.sum)
+        yield '%s_count{%s} %i\n'%(name, labels, self.count)
+
+
+class CallbackMetrics:
+    """
+    Thread-safe histograms (`CALLBACK_METRICS`) per callback name.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        self.sample_rate    = sample_rate
+        self._histograms    = {}    # callback name => list of Histograms
+        self._lock          = threading.Lock()
+
+    def sampled(self):
+        """
+        Decide whether to measure a request.
+        """
+        return random.random() < self.sample_rate
+
+    def observe(self, callback, *values):
+        """
+        Record values (in the order of `CALLBACK_METRICS`) for a callback.
+        """
+        with self._lock:
+            histograms = self._histograms.get(callback)
+            if histograms is None:
+                histograms = self._histograms[callback] = [
+                    Histogram(buckets) for __, __, buckets in CALLBACK_METRICS
+                    ]
+            for histogram, value in zip(histograms, values):
+                histogram.observe(value)
+
+    def iter_prometheus(self):
+        """
+        Generate the metrics in the Prometheus text format.
+        """
+        with self._lock:
+            yield '# HELP mojehodiny_callback_sample_rate '\
+                'Fraction of callback requests measured.\n'
+            yield '# TYPE mojehodiny_callback_sample_rate gauge\n'
+            yield 'mojehodiny_callback_sample_rate %r\n'%self.sample_rate
+            for i, (name, help_text, __) in enumerate(CALLBACK_METRICS):
+                yield '# HELP %s %s\n'%(name, help_text)
+                yield '# TYPE %s histogram\n'%name
+                for callback, histograms in sorted(self._histograms.items()):
+                    yield from histograms[i].iter_prometheus(
+                        name, 'callback="%s"'%prometheus_label_value(callback)
+                        )
+
+def prometheus_label_value(s):
+    """
+    Escape a Prometheus label value.
+    """
+    return s.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+def callback_name(app, output):
+    """
+    Return the name of the function of the Dash callback for `output`
+    (or `output` itself if there is no such callback).
+    """
+    f = app.callback_map.get(output, {}).get('callback')
+    f = getattr(f, '__wrapped__', f)
+    return getattr(f, '__name__', output)
+
+def bearer_token_matches(token):
+    """
+    Return whether the current request has an `Authorization: Bearer` header
+    with `token` (never if `token` is not set).
+    """
+    scheme, __, value = flask.request.headers.get(
+        'Authorization', ''
+        ).partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(
+        value.strip().encode(), token.encode()
+        )
+
+def instrument_dash(app, metrics=None, path='/metrics', token=None):
+    """
+    Measure the server-side callback requests of a Dash `app` (requests to
+    its `_dash-update-component` endpoint) and serve the metrics on
+    `path` (only to requests with the bearer `token`, not at all without
+    it). Return the `CallbackMetrics` object.
+    """
+    if metrics is None:
+        metrics = CallbackMetrics()
+    update_path = app.config.routes_pathname_prefix + '_dash-update-component'
+    server = app.server
+
+    @server.before_request
+    def start_measurement():
+        if flask.request.path == update_path and metrics.sampled():
+            flask.g.metrics_start = (time.perf_counter(), time.thread_time())
+
+    @server.after_request
+    def finish_measurement(response):
+        start = flask.g.pop('metrics_start', None)
+        if start is None:
+            return response
+        wall = time.perf_counter() - start[0]
+        cpu = time.thread_time() - start[1]
+        request = flask.request
+        output = (request.get_json(silent=True) or {}).get('output', '')
+        response_size = response.content_length
+        if response_size is None and not response.is_streamed:
+            response_size = len(response.get_data())
+        metrics.observe(
+            callback_name(app, output), wall, cpu,
+            request.content_length or 0, response_size or 0
+            )
+        return response
+
+    @server.route(path)
+    def serve_metrics():
+        if not bearer_token_matches(token):
+            flask.abort(404)
+        return flask.Response(
+            ''.join(metrics.iter_prometheus()),
+            mimetype='text/plain; version=0.0.4'
+            )
+
+    return metrics
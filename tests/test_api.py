@@ -0,0 +1,66 @@
+"""
+Validation of courses in the JSON API (`mojehodiny_api.course_result`,
+needs Flask).
+"""
+
+import pytest
+
+pytest.importorskip('flask')
+
+import mojehodiny as mh
+import mojehodiny_api as mh_api
+
+COURSE = {
+    'start':    '2021-09-01',
+    'end':      '2021-10-31',
+    'weekdays': [2],
+    }
+
+
+def exceptions(custom_holidays):
+    result = mh_api.course_result(
+        {**COURSE, 'custom_holidays': custom_holidays}
+        )
+    return result.get('exceptions', result)
+
+@pytest.mark.parametrize('interval, desc', [
+    (['2021-09-08', '2021-09-08', 'výlet'], 'výlet'),
+    (['2021-09-08', '2021-09-08', None], 'volno 2021-09-08'),
+    (['2021-09-08', '2021-09-08'], 'volno 2021-09-08'),
+    (['2021-09-07', '2021-09-09'], 'volno 2021-09-07~2021-09-09'),
+    ])
+def test_custom_holiday_description(interval, desc):
+    assert exceptions([interval]) == [{'date': '2021-09-08', 'desc': desc}]
+
+@pytest.mark.parametrize('interval', [
+    ['2021-09-08', '2021-09-08', 5],
+    ['2021-09-08', '2021-09-08', ['výlet']],
+    ])
+def test_custom_holiday_description_must_be_a_string(interval):
+    error = exceptions([interval])['error']
+    assert error.startswith('Popis v položce „custom_holidays“')
+
+@pytest.mark.parametrize('custom_holidays', [
+    [['2021-09-08']], [['2021-09-08', '2021-09-08', 'a', 'b']], [5], 5,
+    ])
+def test_invalid_custom_holidays(custom_holidays):
+    assert exceptions(custom_holidays)['error'].startswith(
+        'Položka „custom_holidays“'
+        )
+
+def test_spring_holidays():
+    value = mh.spring_holiday_registry().options[0]['value']
+    result = mh_api.course_result({
+        **COURSE, 'start': '2021-01-01', 'end': '2022-06-30',
+        'spring_holidays': [value, '1. 2.–7. 2. 2021+31. 1.–6. 2. 2022'],
+        })
+    assert 'error' not in result
+
+@pytest.mark.parametrize('value', [
+    'a', '1. 2.–7. 2. 2021', '30. 2.–7. 3. 2021+31. 1.–6. 2. 2022',
+    ])
+def test_invalid_spring_holidays(value):
+    result = mh_api.course_result({**COURSE, 'spring_holidays': [value]})
+    assert result['error'].startswith(
+        'Neplatné jarní prázdniny v položce „spring_holidays“'
+        )
@@ -0,0 +1,63 @@
+"""
+Parity of the vectorized `mojehodiny_batch.compute_batch` with the core
+`mojehodiny.compute_dates` (needs NumPy).
+"""
+
+import random
+from datetime import timedelta, datetime as dt
+
+import pytest
+
+pytest.importorskip('numpy')
+
+import mojehodiny as mh
+import mojehodiny_batch as mh_batch
+
+PROFILES = (
+    mh.holiday_profile(),
+    mh.holiday_profile(['state']),
+    mh.holiday_profile(['state', 'school']),
+    mh.holiday_profile(
+        ['state', 'school'], (),
+        '2.11.2020-6.11.2020; podzim\n2020-12-21~2021-01-08; zima'
+        ),
+    )
+
+
+def random_courses(rng, n_courses):
+    """
+    Generate (start_date, last_date, part_date, weekdays, profile index)
+    tuples.
+    """
+    for __ in range(n_courses):
+        start_date  = dt(2020, 8, 1) + timedelta(rng.randrange(400))
+        last_date   = start_date + timedelta(rng.randrange(400))
+        part_date   = rng.choice((
+            None, start_date, last_date, last_date + timedelta(7),
+            start_date + timedelta(rng.randrange(400)),
+            ))
+        weekdays    = sorted(
+            rng.sample(range(mh.WEEK_DAYS), rng.randint(1, 5))
+            )
+        yield (
+            start_date, last_date, part_date, weekdays,
+            rng.randrange(len(PROFILES))
+            )
+
+def test_compute_batch_matches_compute_dates():
+    courses = list(random_courses(random.Random(12), 200))
+    result = mh_batch.compute_batch(
+        [start for start, *__ in courses],
+        [last for __, last, *__ in courses],
+        [part for __, __, part, *__ in courses],
+        [mh_batch.weekdays2mask(wds) for *__, wds, __ in courses],
+        [prof for *__, prof in courses],
+        PROFILES
+        )
+    for i, (start, last, part, wds, prof) in enumerate(courses):
+        expected = mh.compute_dates(start, last, part, PROFILES[prof], wds)
+        assert mh_batch.course_dates(result, i) == expected
+
+def test_compute_batch_empty():
+    result = mh_batch.compute_batch([], [], [], [], [], PROFILES)
+    assert len(result.n) == 0
@@ -0,0 +1,127 @@
+"""
+Calendar download and feed routes of `mojehodiny_app` for valid, stale and
+crafted state tokens (needs Dash).
+"""
+
+import json
+
+import pytest
+
+pytest.importorskip('dash')
+
+import mojehodiny as mh
+import mojehodiny_app as mh_app
+
+STATE = {
+    'start':    '2021-09-01',
+    'end':      '2022-06-30',
+    'part':     '2022-02-01',
+    'hol':      ['state', 'school'],
+    'spring':   [],
+    'custom':   [[738090, 738092, 'podzim']],
+    'wd':       [[0, [[16, 30], [17, 15]]], [3, None]],
+    'name':     'Kroužek',
+    'summary':  'Kroužek #$n',
+    'compact':  False,
+    }
+CRAFTED_STATES = [
+    None, [], 'x',
+    {**STATE, 'start': 5},
+    {**STATE, 'name': 5},
+    {**STATE, 'summary': ['x']},
+    {**STATE, 'hol': 'state'},
+    {**STATE, 'spring': [5]},
+    {**STATE, 'custom': [[10**30, 10**30, 'x']]},
+    {**STATE, 'custom': [[738092, 738090, 'x']]},
+    {**STATE, 'custom': [[738090, 738092, 5]]},
+    {**STATE, 'wd': [['a', None]]},
+    {**STATE, 'wd': [[0, [[16.5, 0], [17, 0]]]]},
+    {**STATE, 'compact': 'yes'},
+    {**STATE, 'imported': 5},
+    ]
+IMPORT_KEY = '0123456789abcdef'*4
+
+
+@pytest.fixture(scope='module')
+def client():
+    return mh_app.app.server.test_client()
+
+def route_urls(kind, state):
+    token = mh_app.encode_state_token(state)
+    return (
+        '%s/ics/%s/%s/kurz.ics'%(mh_app.APP_PATH, kind, token),
+        '%s/feed/%s/%s.ics'%(mh_app.APP_PATH, kind, token),
+        )
+
+@pytest.mark.parametrize('kind', mh_app.ICS_KINDS)
+def test_calendar_etag(client, kind):
+    for url in route_urls(kind, STATE):
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.data.startswith(b'BEGIN:VCALENDAR\r\n')
+        etag = response.headers['ETag']
+        response = client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 304
+
+@pytest.mark.parametrize('kind', mh_app.ICS_KINDS)
+def test_stale_creation_time_is_ignored(client, kind):
+    for url, stale_url in zip(
+        route_urls(kind, STATE),
+        route_urls(kind, {**STATE, 'created': 10**30})
+        ):
+        response = client.get(url)
+        stale_response = client.get(stale_url)
+        assert stale_response.headers['ETag'] == response.headers['ETag']
+        assert stale_response.data == response.data
+
+@pytest.mark.parametrize('state', CRAFTED_STATES)
+def test_crafted_token_is_bad_request(client, state):
+    for kind in mh_app.ICS_KINDS:
+        for url in route_urls(kind, state):
+            assert client.get(url).status_code == 400
+
+@pytest.fixture
+def import_store(monkeypatch, tmp_path):
+    """
+    A temporary `mh_app.IMPORT_STORE` with an imported calendar of 3000
+    weekly one-day events from Monday 2021-09-06 (43 of them fall in the
+    course of `STATE`).
+    """
+    store = mh.SQLiteResultCache(str(tmp_path/'imports.db'), 1<<30)
+    monkeypatch.setattr(mh_app, 'IMPORT_STORE', store)
+    mh_app.imported_intervals.cache_clear()
+    first_ord = 738039
+    store.put(IMPORT_KEY, json.dumps([
+        [date_ord, date_ord, 'import %i'%i]
+        for i, date_ord in enumerate(range(first_ord, first_ord+3000*7, 7))
+        ]))
+    yield store
+    mh_app.imported_intervals.cache_clear()
+
+def test_imported_calendar_is_resolved_on_the_server(client, import_store):
+    state = {**STATE, 'summary': '$s', 'imported': IMPORT_KEY}
+    download_url, feed_url = route_urls('exc', state)
+    assert len(feed_url) < 2*len(route_urls('exc', STATE)[1])
+    response = client.get(download_url)
+    assert response.status_code == 200
+    assert b'SUMMARY:import 0\r\n' in response.data
+    assert b'SUMMARY:import 42\r\n' in response.data
+    assert b'SUMMARY:import 43\r\n' not in response.data
+    assert client.get(feed_url).status_code == 200
+    # results and imports are stored separately:
+    mh_app.RESULT_CACHE.clear()
+    mh_app.imported_intervals.cache_clear()
+    assert client.get(download_url).data == response.data
+
+def test_missing_imported_calendar(client, import_store):
+    import_store.clear()
+    for kind in mh_app.ICS_KINDS:
+        for url in route_urls(kind, {**STATE, 'imported': IMPORT_KEY}):
+            assert client.get(url).status_code == 400
+    assert mh_app.decode_calendar_state(
+        mh_app.encode_state_token({**STATE, 'imported': IMPORT_KEY})
+        )
+    with pytest.raises(ValueError):
+        mh_app.decode_calendar_state(
+            mh_app.encode_state_token({**STATE, 'imported': '../x'})
+            )
@@ -0,0 +1,84 @@
+"""
+Parity of `mojehodiny.compute` with the text and iCalendar output of the
+original implementation (`data/compute_baseline.json`, generated before the
+computation was reworked). The original calendars had no UIDs and DTSTAMPs,
+so those lines are ignored.
+"""
+
+import os
+import re
+import json
+from datetime import datetime as dt
+
+import pytest
+
+import mojehodiny as mh
+
+BASELINE_PATH = os.path.join(
+    os.path.dirname(__file__), 'data', 'compute_baseline.json'
+    )
+with open(BASELINE_PATH, encoding='utf-8') as f:
+    BASELINE = json.load(f)
+NEW_PROPERTIES_RE = re.compile(r'(?:UID|DTSTAMP):[^\r]*\r\n')
+LESSON_LINE_RE = re.compile(r'^ [0-9]+\. \S+ (.*)$', re.MULTILINE)
+EXC_LINE_RE = re.compile(
+    r'^ \* \S+ ([0-9]{2}\. [0-9]{2}\. [0-9]{4}) (.*)$', re.MULTILINE
+    )
+
+
+def baseline_args(case):
+    """
+    Return the `mh.compute` arguments of a baseline case.
+    """
+    ymd = lambda s: s and dt.strptime(s, mh.YMD_FMT)
+    exc_dates = mh.except_dates2desc(
+        ''.join(getattr(mh, table) for table in case['tables'])
+        )
+    wd2time_range = case['time_ranges'] and {
+        int(wd): time_range and tuple(map(tuple, time_range))
+        for wd, time_range in case['time_ranges'].items()
+        }
+    return (
+        ymd(case['start']), ymd(case['end']), ymd(case['part']),
+        exc_dates, case['weekdays'], wd2time_range, *(case['names'] or ())
+        )
+
+def ord2output(date_ord):
+    return mh.ord2date(date_ord).strftime(mh.OUTPUT_FMT)
+
+def joined(chunks):
+    return chunks and ''.join(chunks)
+
+@pytest.mark.parametrize('case', BASELINE)
+def test_compute_matches_baseline(case):
+    txt, ical, exc_ical = mh.compute(*baseline_args(case))
+    assert joined(txt) == case['txt']
+    for chunks, expected in (
+        (ical, case['ical']), (exc_ical, case['exc_ical'])
+        ):
+        output = joined(chunks)
+        assert (output and NEW_PROPERTIES_RE.sub('', output)) == expected
+
+@pytest.mark.parametrize('case', BASELINE)
+def test_compute_without_uids(case):
+    __, ical, __ = mh.compute(
+        *baseline_args(case), uid_prefix='', exc_uid_prefix=''
+        )
+    output = joined(ical)
+    assert output is None or 'UID:' not in output
+
+@pytest.mark.parametrize('case', BASELINE)
+def test_compute_dates_matches_baseline_text(case):
+    args = baseline_args(case)
+    dates, exc_desc, n, n1 = mh.compute_dates(*args[:5])
+    assert [
+        ord2output(date_ord) for date_ord in dates
+        ] == LESSON_LINE_RE.findall(case['txt'])
+    assert [
+        (ord2output(date_ord), desc) for date_ord, desc in exc_desc
+        ] == EXC_LINE_RE.findall(case['txt'])
+    assert ' * Celý kurz:    %i\n'%n in case['txt']
+    if args[2]:
+        assert ' * Od %s:   %i\n'%(
+            args[2].strftime(mh.OUTPUT_FMT), n-n1
+            ) in case['txt']
@@ -0,0 +1,145 @@
+"""
+Edge cases of the iCalendar import (`mojehodiny.iter_ical_intervals`).
+"""
+
+from datetime import datetime as dt
+
+import pytest
+
+import mojehodiny as mh
+
+
+def ymd2ord(y, m, d):
+    return dt(y, m, d).toordinal()
+
+def ical_lines(*event_lines):
+    """
+    Return the lines (with CRLF) of a calendar with the given event lines.
+    """
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', *event_lines, 'END:VCALENDAR']
+    return [line + '\r\n' for line in lines]
+
+def event(*properties):
+    return ['BEGIN:VEVENT', *properties, 'END:VEVENT']
+
+def intervals_errors(lines):
+    errors      = []
+    intervals   = list(mh.iter_ical_intervals(lines, errors))
+    return intervals, errors
+
+def test_all_day_events():
+    intervals, errors = intervals_errors(ical_lines(
+        *event('DTSTART;VALUE=DATE:20211027', 'DTEND;VALUE=DATE:20211030',
+            'SUMMARY:Podzimní prázdniny'),
+        *event('DTSTART;VALUE=DATE:20211117', 'SUMMARY:Svátek'),
+        *event('DTSTART;VALUE=DATE:20211224', 'DTEND;VALUE=DATE:20211224',
+            'SUMMARY:Prázdná'),
+        ))
+    assert intervals == [
+        (ymd2ord(2021, 10, 27), ymd2ord(2021, 10, 29), 'Podzimní prázdniny'),
+        (ymd2ord(2021, 11, 17), ymd2ord(2021, 11, 17), 'Svátek'),
+        (ymd2ord(2021, 12, 24), ymd2ord(2021, 12, 24), 'Prázdná'),
+        ]
+    assert errors == []
+
+def test_folded_and_escaped_lines():
+    lines = ical_lines(*event(
+        'DTSTART;VALUE=DATE:20220201',
+        'SUMMARY:Jarní\\, prázdniny\\; ',
+        '\tPraha\\n1\\\\2',
+        'DURATION:P1W',
+        ))
+    intervals, errors = intervals_errors(lines)
+    assert intervals == [(
+        ymd2ord(2022, 2, 1), ymd2ord(2022, 2, 7),
+        'Jarní, prázdniny; Praha 1\\2'
+        )]
+    assert errors == []
+
+def test_quoted_parameter_with_colon():
+    intervals, __ = intervals_errors(ical_lines(*event(
+        'DTSTART;VALUE=DATE:20220301',
+        'SUMMARY;ALTREP="http://example.com/a:b":Výlet',
+        )))
+    assert intervals == [(ymd2ord(2022, 3, 1), ymd2ord(2022, 3, 1), 'Výlet')]
+
+def test_nested_alarm_does_not_end_event():
+    intervals, errors = intervals_errors(ical_lines(*event(
+        'DTSTART;VALUE=DATE:20220401',
+        'BEGIN:VALARM',
+        'TRIGGER:-PT15M',
+        'SUMMARY:Připomínka',
+        'DTSTART:20990101T000000Z',
+        'END:VALARM',
+        'SUMMARY:Velikonoce',
+        )))
+    assert intervals == [
+        (ymd2ord(2022, 4, 1), ymd2ord(2022, 4, 1), 'Velikonoce')
+        ]
+    assert errors == []
+
+def test_cancelled_event_is_skipped():
+    intervals, errors = intervals_errors(ical_lines(
+        *event('DTSTART;VALUE=DATE:20220401', 'STATUS:cancelled',
+            'SUMMARY:Zrušeno'),
+        *event('STATUS:CANCELLED'),
+        ))
+    assert intervals == []
+    assert errors == []
+
+@pytest.mark.parametrize('properties, expected', [
+    # 10:00 to 10:00 the next day covers no whole day:
+    (('DTSTART:20220510T100000', 'DTEND:20220511T100000'), None),
+    (('DTSTART:20220510T000000Z', 'DTEND:20220511T000000Z'), (10, 10)),
+    (('DTSTART:20220510T000000', 'DTEND:20220512T120000'), (10, 11)),
+    (('DTSTART:20220510T080000', 'DTEND:20220513T000000'), (11, 12)),
+    (('DTSTART:20220510T000000', 'DURATION:PT24H'), (10, 10)),
+    (('DTSTART:20220510T120000', 'DURATION:P2DT12H'), (11, 12)),
+    (('DTSTART:20220510T000000', 'DURATION:PT23H59M59S'), None),
+    # a timed event without an end has no duration:
+    (('DTSTART:20220510T000000',), None),
+    ])
+def test_timed_events_take_whole_days(properties, expected):
+    intervals, errors = intervals_errors(
+        ical_lines(*event(*properties, 'SUMMARY:Akce'))
+        )
+    assert intervals == ([] if expected is None else [(
+        ymd2ord(2022, 5, expected[0]), ymd2ord(2022, 5, expected[1]), 'Akce'
+        )])
+    assert errors == []
+
+@pytest.mark.parametrize('summary', [(), ('SUMMARY:',), ('SUMMARY: \\n ',)])
+def test_default_summary(summary):
+    intervals, __ = intervals_errors(
+        ical_lines(*event('DTSTART;VALUE=DATE:20220601', *summary))
+        )
+    assert intervals == [
+        (ymd2ord(2022, 6, 1), ymd2ord(2022, 6, 1), mh.ICAL_DEFAULT_DESC)
+        ]
+
+@pytest.mark.parametrize('properties, message', [
+    (('DTSTART;VALUE=DATE:20220230',), 'Neplatné datum: „20220230“'),
+    (('DTSTART:2022-06-01',), 'Neplatné datum: „2022-06-01“'),
+    (('DTSTART:20220601T250000',), 'Neplatný čas: „20220601T250000“'),
+    (('DTSTART:20220601T000000', 'DTEND:20220602T006100'),
+        'Neplatný čas: „20220602T006100“'),
+    (('DTSTART:20220601T000000', 'DURATION:P'), 'Neplatná délka: „P“'),
+    (('SUMMARY:Bez začátku',), 'Událost nemá začátek (DTSTART).'),
+    ])
+def test_invalid_event(properties, message):
+    lines = ical_lines(
+        *event(*properties),
+        *event('DTSTART;VALUE=DATE:20220701', 'SUMMARY:Léto'),
+        )
+    intervals, errors = intervals_errors(lines)
+    assert intervals == [(ymd2ord(2022, 7, 1), ymd2ord(2022, 7, 1), 'Léto')]
+    assert errors == [(3, message)]
+
+def test_unterminated_event():
+    # a truncated file:
+    lines = ical_lines(
+        *event('DTSTART;VALUE=DATE:20220701', 'SUMMARY:Léto')
+        )[:-1] + ['BEGIN:VEVENT\r\n', 'DTSTART;VALUE=DATE:20220801']
+    intervals, errors = intervals_errors(lines)
+    assert intervals == [(ymd2ord(2022, 7, 1), ymd2ord(2022, 7, 1), 'Léto')]
+    assert errors == [(7, 'Neukončená událost (chybí END:VEVENT).')]
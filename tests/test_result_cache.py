@@ -0,0 +1,111 @@
+"""
+Put/get, TTL expiry and LRU eviction of `mojehodiny.ResultCache` and
+`mojehodiny.SQLiteResultCache`.
+"""
+
+import pytest
+
+import mojehodiny as mh
+
+
+class Clock:
+    """
+    A `time.time` replacement that only moves when told to.
+    """
+
+    def __init__(self):
+        self.now = 1e9
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds=mh.SQLITE_CACHE_ACCESS_RESOLUTION+1):
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(mh.time, 'time', clock)
+    return clock
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_cache(request, tmp_path):
+    def make_cache(max_size):
+        if request.param == 'memory':
+            return mh.ResultCache(max_size)
+        return mh.SQLiteResultCache(str(tmp_path/'cache.db'), max_size)
+    return make_cache
+
+def test_put_get(make_cache):
+    cache = make_cache(1000)
+    assert cache.get('a') is None
+    assert cache.get('a', 'default') == 'default'
+    cache.put('a', 'x'*10)
+    cache.put('b', b'y'*10)
+    assert cache.get('a') == 'x'*10
+    assert cache.get('b') == b'y'*10
+    assert cache.get_or_compute('c', lambda: 'z') == 'z'
+    assert cache.get_or_compute('c', lambda: 'w') == 'z'
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['items']) == (3, 3, 3)
+    assert stats['size'] == 21
+    cache.clear()
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 0
+
+def test_value_larger_than_cache_is_not_stored(make_cache):
+    cache = make_cache(100)
+    cache.put('a', 'x'*50)
+    cache.put('b', 'y'*101)
+    assert cache.get('b') is None
+    assert cache.get('a') == 'x'*50
+
+def test_put_evicts_until_the_size_fits(make_cache, clock):
+    cache = make_cache(1000)
+    for key in 'abc':
+        cache.put(key, key*400)
+        clock.advance()
+        assert cache.get(key) == key*400
+    assert cache.get('a') is None
+    assert cache.get('b') == 'b'*400
+    assert cache.stats()['size'] == 800
+
+def test_put_evicts_least_recently_used(make_cache, clock):
+    cache = make_cache(1000)
+    for key in 'abcd':
+        cache.put(key, key*200)
+        clock.advance()
+    assert cache.get('a') == 'a'*200
+    clock.advance()
+    cache.put('e', 'e'*500)
+    assert cache.get('b') is None
+    assert cache.get('c') is None
+    for key in 'ade':
+        assert cache.get(key)
+    assert cache.stats()['size'] == 900
+
+def test_sqlite_ttl_expiry(tmp_path, clock):
+    cache = mh.SQLiteResultCache(str(tmp_path/'cache.db'), 1000, ttl=3600)
+    cache.put('a', 'old')
+    clock.advance(1800)
+    assert cache.get('a') == 'old'
+    clock.advance(1801)
+    assert cache.get('a') is None
+    # an expired value does not keep a new one out:
+    cache.put('a', 'new')
+    assert cache.get('a') == 'new'
+
+def test_sqlite_expired_values_are_evicted_first(tmp_path, clock):
+    cache = mh.SQLiteResultCache(str(tmp_path/'cache.db'), 1000, ttl=3600)
+    cache.put('a', 'a'*400)
+    clock.advance(1800)
+    cache.put('b', 'b'*400)
+    clock.advance(1801)
+    cache.put('c', 'c'*100)
+    assert cache.stats()['items'] == 2
+    assert cache.get('b') == 'b'*400
+
+def test_sqlite_cache_is_shared(tmp_path):
+    path = str(tmp_path/'cache.db')
+    mh.SQLiteResultCache(path, 1000).put('a', 'x')
+    assert mh.SQLiteResultCache(path, 1000).get('a') == 'x'
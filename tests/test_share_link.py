@@ -0,0 +1,131 @@
+"""
+Round trips of the share link state (`mojehodiny_app.encode_share_state`,
+`decode_share_state`) and of old-format links with a parameter per field
+(needs Dash).
+"""
+
+from datetime import datetime as dt
+from urllib import parse as urllib_parse
+
+import pytest
+
+pytest.importorskip('dash')
+
+import mojehodiny as mh
+import mojehodiny_app as mh_app
+
+SPRING_VALUE = mh.spring_holiday_registry().options[1]['value']
+OTHER_SPRING_VALUE = '1. 2.–7. 2. 2021+31. 1.–6. 2. 2022'
+INTERVALS = [
+    (dt(2021, 10, 27).toordinal(), dt(2021, 10, 29).toordinal(), 'podzim'),
+    (dt(2021, 9, 28).toordinal(), dt(2021, 9, 28).toordinal(), 'svátek, a'),
+    (dt(2022, 7, 1).toordinal(), dt(2022, 8, 31).toordinal(), 'léto ✓'),
+    ]
+FULL_FORM = {
+    'start_date':       '2021-09-01',
+    'end_date':         '2022-06-30',
+    'part_date':        '2022-02-01',
+    'holidays':         ['state', 'school'],
+    'spring_holidays':  [SPRING_VALUE, OTHER_SPRING_VALUE],
+    'intervals':        INTERVALS,
+    'calendar_name':    'Kroužek',
+    'event_name':       'Kroužek #$n',
+    'calendar_options': ['compact'],
+    'exc_calendar_name':    'Volno',
+    'exc_event_name':   'Volno: $s',
+    'wd_values':        [[0], [], [2], [], [4]],
+    'tr_values':        [16, 30, 17, 15] + [None]*4 + [8, 0, 9, 45] +
+                        [None]*4 + [0, 0, 23, 59],
+    }
+EMPTY_FORM = {
+    'start_date':       None,
+    'end_date':         None,
+    'part_date':        None,
+    'holidays':         [],
+    'spring_holidays':  [],
+    'intervals':        None,
+    'calendar_name':    None,
+    'event_name':       None,
+    'calendar_options': [],
+    'exc_calendar_name':    None,
+    'exc_event_name':   None,
+    'wd_values':        [[]]*len(mh_app.WD_CHECKLIST_IDS),
+    'tr_values':        [None]*len(mh_app.WD_TIME_RANGE_IDS),
+    }
+
+
+def encode(form):
+    return mh_app.encode_share_state(
+        form['start_date'], form['end_date'], form['part_date'],
+        form['holidays'], form['spring_holidays'], form['intervals'],
+        form['calendar_name'], form['event_name'], form['calendar_options'],
+        form['exc_calendar_name'], form['exc_event_name'],
+        form['wd_values'], form['tr_values']
+        )
+
+def old_query(form):
+    """
+    Return the old-format query string (a parameter per field) of a form.
+    """
+    params = [
+        (name, form[name])
+        for name in (
+            'start_date', 'end_date', 'part_date', 'calendar_name',
+            'event_name', 'exc_calendar_name', 'exc_event_name'
+            )
+        if form[name]
+        ]
+    for name in ('holidays', 'spring_holidays', 'calendar_options'):
+        params.extend((name, value) for value in form[name])
+    if form['intervals']:
+        params.append(
+            ('custom_holidays', mh.format_date_desc(form['intervals']))
+            )
+    for id, value in zip(mh_app.WD_CHECKLIST_IDS, form['wd_values']):
+        params.extend((id, wd) for wd in value)
+    for id, value in zip(mh_app.WD_TIME_RANGE_IDS, form['tr_values']):
+        if value is not None:
+            params.append((id, value))
+    return urllib_parse.urlencode(params)
+
+def expected_output_values(form):
+    """
+    Return the values of `mh_app.ALL_FIELD_OUTPUTS` for a form.
+    """
+    ymd = lambda s: s and dt.strptime(s, mh.YMD_FMT)
+    return [
+        ymd(form['start_date']), ymd(form['end_date']), ymd(form['part_date']),
+        form['holidays'], form['spring_holidays'],
+        form['intervals'] and mh.format_date_desc(form['intervals']),
+        1 if form['intervals'] else 0,
+        form['calendar_name'], form['event_name'], form['calendar_options'],
+        form['exc_calendar_name'], form['exc_event_name'],
+        *form['wd_values'], *form['tr_values'],
+        ]
+
+@pytest.mark.parametrize('form', [FULL_FORM, EMPTY_FORM])
+def test_share_token_round_trip(form):
+    token = encode(form)
+    assert urllib_parse.quote(token, safe='') == token
+    assert mh_app.share_output_values(token) == expected_output_values(form)
+
+def test_share_token_custom_holidays_reparse():
+    values = mh_app.decode_share_state(encode(FULL_FORM))
+    assert mh.date_desc_intervals(values['custom_holidays']) == INTERVALS
+
+def test_share_token_is_shorter_than_old_query():
+    assert len(encode(FULL_FORM)) < len(old_query(FULL_FORM))
+
+@pytest.mark.parametrize('form', [FULL_FORM, EMPTY_FORM])
+def test_old_query_matches_share_token(form):
+    qs_param2values = urllib_parse.parse_qs(old_query(form))
+    assert (
+        mh_app.query_output_values(qs_param2values) ==
+        mh_app.share_output_values(encode(form))
+        )
+
+@pytest.mark.parametrize('token', ['', 'AQ', 'AZ', 'AQH_____fw', 'x!'])
+def test_invalid_share_token_gives_empty_form(token):
+    assert mh_app.share_output_values(token) == (
+        expected_output_values(EMPTY_FORM)
+        )
@@ -0,0 +1,36 @@
+"""
+Spring holiday dropdown options (`mojehodiny.spring_holiday_options`).
+"""
+
+import re
+
+import mojehodiny as mh
+
+REGISTRY = mh.spring_holiday_registry()
+
+
+def option_values(options):
+    return [option['value'] for option in options]
+
+def test_empty_search_returns_only_selected():
+    selected = REGISTRY.options[-1]['value']
+    for search in (None, '', '  '):
+        assert mh.spring_holiday_options(search) == []
+        assert option_values(
+            mh.spring_holiday_options(search, [selected])
+            ) == [selected]
+
+def test_search_ignores_case_and_diacritics():
+    options = mh.spring_holiday_options('PRA')
+    assert options
+    assert mh.spring_holiday_options('prá') == options
+    assert all(
+        re.search(r'\bpra', mh.search_key(option['label']))
+        for option in options
+        )
+
+def test_search_keeps_selected_in_registry_order():
+    selected = [option['value'] for option in REGISTRY.options]
+    assert option_values(
+        mh.spring_holiday_options('xyz', selected[::-1])
+        ) == selected